@@ -1,16 +1,35 @@
 
 import os
+import json
+import uuid
+import asyncio
 import inspect
 import logging
-from fastapi import FastAPI, HTTPException, APIRouter
+from fastapi import FastAPI, HTTPException, APIRouter, Request
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from typing import List, Any
 from pydantic import BaseModel
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from app.model import CodePayload
-from app.graph import execute_self_healing_code_system
+from app.graph import execute_self_healing_code_system, stream_self_healing_code_system, resume_self_healing_code_system
+from app.nodes import db_client
+from app.execution import compile_source
+from app.slicing import top_level_functions
+from app.serialization import encode_value
+from app.cancellation import RunIdInUse, claim_run, release_run, cancel_run
+from app.checkpoint import get_checkpointer
+from app.replay import get_store
+from app.rules import rule_stats
 from app.settings_loader import settings
 from app.model_loader import ModelLoader
 from app.config_loader import load_config
@@ -23,6 +42,13 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# The workflow is blocking, so runs are executed in the threadpool. This bounds
+# how many of them one worker process executes at once; further requests wait.
+run_slots = asyncio.Semaphore(app_config['server']['max_concurrent_runs'])
+
+# How often a blocking run checks whether its client is still connected.
+_DISCONNECT_POLL_SECONDS = 0.5
+
 # --------------------
 # GUARDRail FUNCTION
 # --------------------
@@ -49,9 +75,10 @@ def is_malicious_code(code: str) -> bool:
 # --------------------
 
 @router.post("/run_agent")
-async def run_agent_workflow(payload: CodePayload):
+async def run_agent_workflow(payload: CodePayload, request: Request):
     """
     Receives a function as a string and its arguments, and runs it through the self-healing agent.
+    The string may also be a whole module, in which case `entry_point` names the function to call.
     
     Args:
         payload (CodePayload): The request body containing the function string and arguments.
@@ -65,6 +92,122 @@ async def run_agent_workflow(payload: CodePayload):
     print(payload)
     print("-------------------")
 
+    return await _run_until_disconnected(request, payload)
+
+
+@router.post("/run_agent/msgpack")
+async def run_agent_workflow_msgpack(request: Request):
+    """
+    Same as `/run_agent`, but the body is a msgpack-encoded `CodePayload`.
+
+    Bytes are sent natively and large numeric arrays as tagged `ndarray` values
+    with a binary buffer, avoiding the size and parsing cost of JSON.
+    """
+    if msgpack is None:
+        raise HTTPException(status_code=415, detail="msgpack bodies are not supported by this server.")
+    try:
+        payload = CodePayload.model_validate(msgpack.unpackb(await request.body(), raw=False))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid msgpack payload: {str(e)}")
+
+    logger.info("Received msgpack request to run agent.")
+    return await _run_until_disconnected(request, payload)
+
+
+@router.post("/run_agent/stream")
+async def run_agent_workflow_stream(payload: CodePayload):
+    """
+    Same as `/run_agent`, but streams progress as newline-delimited JSON.
+
+    A `{"run_id": ...}` line is sent first, a `{"node": ...}` line after every
+    completed node, then a final `{"final_state": ...}` line (or `{"error": ...}`
+    if the workflow fails). If the client disconnects, the run is cancelled.
+    """
+    logger.info("Received request to stream agent run.")
+    callable_function = await run_in_threadpool(_prepare_callable, payload)
+    run_id = _claim_run_id(payload)
+
+    async def progress():
+        finished = False
+        try:
+            yield json.dumps({'run_id': run_id}) + '\n'
+            async with run_slots:
+                async for line in iterate_in_threadpool(_stream_agent_workflow(callable_function, payload)):
+                    yield line
+            finished = True
+        finally:
+            if not finished:
+                cancel_run(run_id)
+            release_run(run_id)
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+
+@router.delete("/runs/{run_id}")
+def cancel_agent_run(run_id: str):
+    """
+    Cancels a run in progress, in any worker of this host. The run stops at its next
+    node, LLM call or sandboxed execution and returns its state so far with `cancelled` set.
+    """
+    if not cancel_run(run_id):
+        raise HTTPException(status_code=404, detail=f"No run with ID '{run_id}' is in progress.")
+    return {'run_id': run_id, 'cancelled': True}
+
+
+@router.post("/runs/{run_id}/resume")
+async def resume_agent_run(run_id: str):
+    """
+    Resumes a run interrupted by a crash or redeploy from its last completed node.
+    Requires `checkpoint.enabled` in the config.
+    """
+    logger.info(f"Received request to resume run {run_id}.")
+    _claim(run_id)
+    try:
+        async with run_slots:
+            return await run_in_threadpool(_resume_agent_workflow, run_id)
+    finally:
+        release_run(run_id)
+
+
+def _claim(run_id: str) -> None:
+    """Registers the run for cancellation; the caller releases it."""
+    try:
+        claim_run(run_id)
+    except RunIdInUse:
+        raise HTTPException(status_code=409, detail=f"A run with ID '{run_id}' is already in progress.")
+
+
+def _claim_run_id(payload: CodePayload) -> str:
+    """Gives the run an ID, unless the client chose one, and registers it for cancellation."""
+    payload.run_id = payload.run_id or uuid.uuid4().hex
+    _claim(payload.run_id)
+    return payload.run_id
+
+
+async def _run_until_disconnected(request: Request, payload: CodePayload) -> dict:
+    """
+    Runs the blocking workflow in the threadpool, cancelling it if the client disconnects.
+
+    The run slot is held until the worker thread returns, which a cancelled run
+    does at its next cancellation check.
+    """
+    run_id = _claim_run_id(payload)
+    try:
+        async with run_slots:
+            task = asyncio.ensure_future(run_in_threadpool(_run_agent_workflow, payload))
+            while not task.done():
+                await asyncio.wait({task}, timeout=_DISCONNECT_POLL_SECONDS)
+                if not task.done() and await request.is_disconnected():
+                    logger.info(f"Client disconnected from run {run_id}.")
+                    cancel_run(run_id)
+                    break
+            return await task
+    finally:
+        release_run(run_id)
+
+
+def _prepare_callable(payload: CodePayload):
+    """Runs the guardrail and compiles the submitted code. Blocking."""
     # Guardrail: Check for malicious code before execution
     if is_malicious_code(payload.function_string):
         logger.error("Malicious code detected. Denying request.")
@@ -74,31 +217,58 @@ async def run_agent_workflow(payload: CodePayload):
         )
 
     # Dynamically execute the function string to get a callable object
-    namespace = {}
     try:
-        exec(payload.function_string, namespace)
+        namespace = compile_source(payload.function_string)
         
-        # Find the function name in the namespace
-        function_name = next(
-            (name for name, obj in namespace.items() if inspect.isfunction(obj)),
-            None
-        )
+        # Use the entry point, or the first function defined in the code (not imported)
+        function_name = payload.entry_point or next(iter(top_level_functions(payload.function_string)), None)
         if not function_name:
             raise ValueError("No function definition found in the provided code.")
+        if not inspect.isfunction(namespace.get(function_name)):
+            raise ValueError(f"Entry point '{function_name}' is not a function defined in the provided code.")
             
-        callable_function = namespace[function_name]
+        return namespace[function_name]
     except Exception as e:
         logger.error(f"Error compiling function string: {str(e)}")
         raise HTTPException(
             status_code=400,
             detail=f"Error compiling function string: {str(e)}"
         )
+
+
+def _workflow_options(payload: CodePayload) -> dict:
+    """Returns the workflow options requested in the payload."""
+    return dict(
+        fast_path=payload.fast_path,
+        namespace=payload.namespace,
+        benchmark_arguments=payload.benchmark_arguments,
+        kwargs=payload.kwargs,
+        run_id=payload.run_id
+    )
+
+
+def _clean_final_state(final_state: dict) -> dict:
+    """Makes the final state of a run JSON-serializable for the response."""
+    if final_state.get('new_function_string'):
+        final_state['function_string'] = final_state['new_function_string']
+    
+    del final_state['function']  
+    del final_state['original_function']
+    for key in ('arguments', 'kwargs', 'benchmark_arguments'):
+        final_state[key] = encode_value(final_state[key])
+    return final_state
+
+
+def _run_agent_workflow(payload: CodePayload) -> dict:
+    """Runs the guardrail and the self-healing workflow. Blocking."""
+    callable_function = _prepare_callable(payload)
     
     try:
         final_state = execute_self_healing_code_system(
             callable_function, 
             payload.arguments,
-            payload.function_string
+            payload.function_string,
+            **_workflow_options(payload)
         )
     except Exception as e:
         logger.exception("An error occurred during agent workflow execution.")
@@ -107,10 +277,75 @@ async def run_agent_workflow(payload: CodePayload):
             detail=f"An error occurred during agent workflow execution: {str(e)}"
         )
     
-    if final_state.get('new_function_string'):
-        final_state['function_string'] = final_state['new_function_string']
-    
-    del final_state['function']  
-    
     logger.info("Agent workflow completed successfully.")
-    return final_state
+    return _clean_final_state(final_state)
+
+
+def _resume_agent_workflow(run_id: str) -> dict:
+    """Resumes a checkpointed run. Blocking."""
+    if get_checkpointer() is None:
+        raise HTTPException(status_code=501, detail="Checkpointing is disabled on this server.")
+    try:
+        final_state = resume_self_healing_code_system(run_id)
+    except Exception as e:
+        logger.exception("An error occurred while resuming the agent workflow.")
+        raise HTTPException(
+            status_code=500,
+            detail=f"An error occurred during agent workflow execution: {str(e)}"
+        )
+    if final_state is None:
+        raise HTTPException(status_code=404, detail=f"No interrupted run with ID '{run_id}' is checkpointed.")
+    return _clean_final_state(final_state)
+
+
+def _stream_agent_workflow(callable_function, payload: CodePayload):
+    """Runs the self-healing workflow, yielding NDJSON progress lines. Blocking."""
+    final_state = None
+    try:
+        for node_name, state in stream_self_healing_code_system(
+            callable_function,
+            payload.arguments,
+            payload.function_string,
+            **_workflow_options(payload)
+        ):
+            final_state = state
+            yield json.dumps({'node': node_name, 'repair_attempts': state['repair_attempts']}) + '\n'
+    except Exception as e:
+        logger.exception("An error occurred during agent workflow execution.")
+        yield json.dumps({'error': f"An error occurred during agent workflow execution: {str(e)}"}) + '\n'
+        return
+
+    logger.info("Agent workflow completed successfully.")
+    yield json.dumps({'final_state': jsonable_encoder(_clean_final_state(dict(final_state)))}) + '\n'
+
+
+@router.get("/rules/stats")
+def rules_stats():
+    """
+    Returns how often the rule-based fixes applied to an error and fixed it
+    without an LLM call, in this worker since startup.
+    """
+    return rule_stats()
+
+
+@router.get("/replay/stats")
+def replay_stats():
+    """
+    Returns the size of the recorded provider responses and the hit rate of LLM
+    and embedding calls in this worker since startup.
+    """
+    store = get_store()
+    if not store:
+        raise HTTPException(status_code=404, detail="Recording of provider responses is off.")
+    return store.stats()
+
+
+@router.get("/memory/stats")
+def memory_stats():
+    """
+    Returns per-namespace memory statistics: number of stored memories, whether
+    the collection handle is open, and search latency since startup.
+    """
+    if not db_client:
+        raise HTTPException(status_code=503, detail="The memory store is not available.")
+    return db_client.stats()
@@ -0,0 +1,315 @@
+import time
+import inspect
+import logging
+import argparse
+import statistics
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# BENCHMARK CORPUS
+# --------------------
+# Mirrors the test cases in app/graph.py, but as source strings so that each
+# case is compiled the same way `/run_agent` compiles a payload. A case can give
+# a function of this file instead, submitted with `inspect.getsource` like the
+# cases in app/graph.py, so that its tracebacks are numbered in the file.
+
+
+def lookup_setting(settings, key):
+    return settings[key]
+
+
+BENCHMARK_CASES = [
+    {
+        'name': 'division_by_zero',
+        'function_string': 'def test_division_by_zero(a, b):\n    return a / b\n',
+        'arguments': [10, 0],
+    },
+    {
+        'name': 'similar_division_by_zero',
+        'function_string': 'def perform_division(numerator, denominator):\n    return numerator / denominator\n',
+        'arguments': [20, 0],
+    },
+    {
+        'name': 'dict_key_error',
+        'function_string': 'def get_dict_value(data_dict, key):\n    return data_dict[key]\n',
+        'arguments': [{"name": "Alice", "age": 30}, "city"],
+    },
+    {
+        'name': 'basic_logic_error',
+        'function_string': (
+            'def calculate_average(numbers):\n'
+            '    total = 0\n'
+            '    for num in numbers:\n'
+            '        total += num\n'
+            '    return total / 0\n'
+        ),
+        'arguments': [[10, 20, 30]],
+    },
+    {
+        'name': 'type_mismatch',
+        'function_string': 'def concatenate_strings(s1, s2):\n    return s1 + " " + s2.upper()\n',
+        'arguments': ["hello", 123],
+    },
+    {
+        'name': 'empty_list',
+        'function_string': 'def get_first_element(my_list):\n    return my_list[0]\n',
+        'arguments': [[]],
+    },
+    {
+        'name': 'infinite_recursion',
+        'function_string': (
+            'def sum_to_n(n):\n'
+            '    if n <= 0:\n'
+            '        return 0\n'
+            '    return n + sum_to_n(n)\n'
+        ),
+        'arguments': [5],
+    },
+    {
+        'name': 'dict_key_error_from_file',
+        'function': lookup_setting,
+        'arguments': [{"timeout": 30}, "retries"],
+    },
+]
+
+
+# Labeled memories and queries for measuring retrieval precision and recall.
+# A query is relevant to every memory sharing its label.
+RETRIEVAL_MEMORIES = [
+    ('zero_division', '# divide ## ZeroDivisionError: division by zero ### The divisor b can be 0 and is not checked before dividing.'),
+    ('zero_division', '# average ## ZeroDivisionError: division by zero ### len(numbers) is 0 for an empty list, so the mean divides by zero.'),
+    ('key_error', '# get_value ## KeyError: city ### The key is read with [] although it may be missing from the dictionary.'),
+    ('key_error', '# load_settings ## KeyError: timeout ### A required config key is absent and no default is provided.'),
+    ('index_error', '# first ## IndexError: list index out of range ### The list is empty when element 0 is accessed.'),
+    ('type_error', '# greet ## TypeError: can only concatenate str (not "int") to str ### An int argument is concatenated to a string.'),
+    ('recursion', '# sum_to_n ## RecursionError: maximum recursion depth exceeded ### The recursive call never decreases n.'),
+]
+
+RETRIEVAL_QUERIES = [
+    ('zero_division', '# perform_division ## ZeroDivisionError: division by zero ### The denominator is zero.'),
+    ('key_error', '# get_dict_value ## KeyError: city ### The dictionary does not contain the requested key.'),
+    ('index_error', '# get_first_element ## IndexError: list index out of range ### Indexing an empty list.'),
+    ('type_error', "# concatenate_strings ## AttributeError: 'int' object has no attribute 'upper' ### s2 is an int, not a str."),
+    ('recursion', '# factorial ## RecursionError: maximum recursion depth exceeded ### Missing base case progress.'),
+]
+
+
+def run_retrieval_benchmark() -> dict:
+    """
+    Measures precision and recall of the memories selected for modification.
+
+    The labeled memories are loaded into a separate in-memory collection using the
+    configured embedding model, and each query goes through the same search and
+    `select_memories_to_update` logic as the graph.
+
+    Returns:
+        dict: Per-query results and mean precision/recall.
+    """
+    from app.db import VectorDB
+    from app.nodes import embedding_model, retrieval_config, select_memories_to_update
+
+    db = VectorDB(embedding_function=embedding_model, collection_name='benchmark-retrieval', dedup_distance=0.0)
+    labels = {db.add_memory(text): label for label, text in RETRIEVAL_MEMORIES}
+
+    results = []
+    for label, query in RETRIEVAL_QUERIES:
+        memories = [
+            {'id': doc.metadata['id'], 'distance': score}
+            for doc, score in db.search(query=query, k=retrieval_config['k'])
+        ]
+        selected = select_memories_to_update(memories)
+        relevant = {memory_id for memory_id, memory_label in labels.items() if memory_label == label}
+        hits = len(relevant.intersection(selected))
+        results.append({
+            'label': label,
+            'selected': len(selected),
+            'precision': hits / len(selected) if selected else 1.0,
+            'recall': hits / len(relevant) if relevant else 1.0,
+        })
+
+    db.get_collection().delete_collection()
+    return {
+        'queries': results,
+        'precision': statistics.mean(r['precision'] for r in results),
+        'recall': statistics.mean(r['recall'] for r in results),
+    }
+
+
+def run_case(case: dict, fast_path=None) -> dict:
+    """
+    Runs a single benchmark case through the self-healing workflow.
+
+    Returns:
+        dict: The repair metrics for the case.
+    """
+    from app.execution import compile_source
+    from app.graph import execute_self_healing_code_system
+
+    if 'function' in case:
+        function = case['function']
+        function_string = inspect.getsource(function)
+    else:
+        function_string = case['function_string']
+        namespace = compile_source(function_string)
+        function = next(obj for obj in namespace.values() if callable(obj) and hasattr(obj, '__code__'))
+
+    start = time.perf_counter()
+    try:
+        final_state = execute_self_healing_code_system(
+            function, case['arguments'], function_string, fast_path=fast_path
+        )
+        attempts, fixed = final_state['repair_attempts'], not final_state['error']
+        rule_fix = final_state['rule_fix']
+    except Exception as e:
+        logger.error(f"Benchmark case '{case['name']}' failed: {e}")
+        attempts, fixed, rule_fix = None, False, ''
+
+    return {
+        'name': case['name'],
+        'fixed': fixed,
+        'repair_attempts': attempts,
+        'first_attempt_success': fixed and attempts == 1,
+        # The rule that fixed the last error, if no LLM was needed for it.
+        'rule_fix': rule_fix,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def run_benchmark(cases=BENCHMARK_CASES, fast_path=None) -> dict:
+    """
+    Runs the benchmark corpus and aggregates repair-loop metrics.
+
+    Args:
+        cases: The benchmark cases to run.
+        fast_path: Forwarded to `execute_self_healing_code_system`.
+
+    Returns:
+        dict: Per-case results and summary metrics.
+    """
+    results = [run_case(case, fast_path=fast_path) for case in cases]
+    attempts = [r['repair_attempts'] for r in results if r['repair_attempts'] is not None]
+    return {
+        'cases': results,
+        'fix_rate': sum(r['fixed'] for r in results) / len(results),
+        'first_attempt_success_rate': sum(r['first_attempt_success'] for r in results) / len(results),
+        'mean_repair_attempts': statistics.mean(attempts) if attempts else None,
+        'rule_fix_rate': sum(bool(r['rule_fix']) for r in results) / len(results),
+        'mean_seconds': statistics.mean(r['seconds'] for r in results),
+    }
+
+
+def _time_queries(search, queries) -> tuple:
+    """Runs the queries one at a time. Returns the mean latency in ms and the result ids."""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(search(query))
+    return 1000 * (time.perf_counter() - start) / len(queries), results
+
+
+def run_vector_index_benchmark(sizes=(10_000, 100_000, 1_000_000), dimensions=128, query_count=100, k=10) -> dict:
+    """
+    Compares the local vector index, exact and HNSW, with Chroma on synthetic embeddings.
+
+    Like real bug reports, the unit vectors are grouped around topics (one per 100
+    memories). Recall is the fraction of the exact k nearest memories found,
+    averaged over the queries (noisy copies of stored vectors). Chroma is skipped
+    if it is not installed.
+
+    Returns:
+        dict: Insert seconds, mean query latency and recall per size and index.
+    """
+    import numpy as np
+    from app.config_loader import load_config
+    from app.vector_index import LocalCollection
+
+    options = load_config()['vector_db']['local_index']
+    rng = np.random.default_rng(0)
+    results = []
+    for size in sizes:
+        topics = rng.standard_normal((max(size // 100, 1), dimensions), dtype=np.float32)
+        vectors = topics[rng.integers(len(topics), size=size)] + 0.3 * rng.standard_normal((size, dimensions), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [str(i) for i in range(size)]
+        queries = vectors[rng.choice(size, query_count)] + 0.05 * rng.standard_normal((query_count, dimensions), dtype=np.float32)
+        queries = queries.tolist()
+
+        indexes = {
+            'exact': LocalCollection('benchmark', **dict(options, hnsw_threshold=float('inf'))),
+            'hnsw': LocalCollection('benchmark', **dict(options, hnsw_threshold=0)),
+        }
+        try:
+            import chromadb
+            client = chromadb.EphemeralClient()
+            indexes['chroma'] = client.create_collection(f"benchmark-{size}", metadata={'hnsw:space': options['space']})
+            batch_size = client.get_max_batch_size()
+        except ImportError:
+            batch_size = 5000
+
+        truth = None
+        for name, index in indexes.items():
+            start = time.perf_counter()
+            for offset in range(0, size, batch_size):
+                index.add(
+                    ids=ids[offset:offset + batch_size],
+                    embeddings=vectors[offset:offset + batch_size],
+                    documents=[''] * len(ids[offset:offset + batch_size]),
+                )
+            insert_seconds = time.perf_counter() - start
+            latency, found = _time_queries(
+                lambda query: index.query(query_embeddings=[query], n_results=k, include=['distances'])['ids'][0], queries
+            )
+            truth = truth or found
+            recall = statistics.mean(len(set(a) & set(b)) / k for a, b in zip(found, truth))
+            results.append({
+                'size': size, 'index': name, 'insert_seconds': insert_seconds, 'query_ms': latency, 'recall': recall,
+            })
+            if name == 'chroma':
+                client.delete_collection(f"benchmark-{size}")
+        del indexes
+    return {'dimensions': dimensions, 'k': k, 'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the self-healing benchmark corpus.")
+    parser.add_argument('--fast-path', action='store_true', help="Use the single-call fast path.")
+    parser.add_argument('--retrieval', action='store_true', help="Measure memory retrieval precision/recall instead.")
+    parser.add_argument('--vector-index', action='store_true', help="Compare the local vector index with Chroma instead.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--dimensions', type=int, default=128)
+    args = parser.parse_args()
+
+    if args.vector_index:
+        report = run_vector_index_benchmark(args.sizes, args.dimensions)
+        for result in report['results']:
+            print(
+                f"{result['size']:>9} {result['index']:<7} insert={result['insert_seconds']:.1f}s "
+                f"query={result['query_ms']:.2f}ms recall@{report['k']}={result['recall']:.3f}"
+            )
+        raise SystemExit(0)
+
+    if args.retrieval:
+        report = run_retrieval_benchmark()
+        for result in report['queries']:
+            print(
+                f"{result['label']:<16} selected={result['selected']} "
+                f"precision={result['precision']:.2f} recall={result['recall']:.2f}"
+            )
+        print("-----------------------------------")
+        print(f"Mean precision: {report['precision']:.2f}")
+        print(f"Mean recall:    {report['recall']:.2f}")
+        raise SystemExit(0)
+
+    report = run_benchmark(fast_path=args.fast_path or None)
+    for result in report['cases']:
+        print(
+            f"{result['name']:<28} fixed={result['fixed']!s:<5} "
+            f"attempts={result['repair_attempts']} rule={result['rule_fix'] or '-'} seconds={result['seconds']:.2f}"
+        )
+    print("-----------------------------------")
+    print(f"Fix rate:                   {report['fix_rate']:.0%}")
+    print(f"First-attempt success rate: {report['first_attempt_success_rate']:.0%}")
+    print(f"Mean repair attempts:       {report['mean_repair_attempts']}")
+    print(f"Fixed by rules (no LLM):    {report['rule_fix_rate']:.0%}")
+    print(f"Mean seconds per case:      {report['mean_seconds']:.2f}")
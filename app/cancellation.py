@@ -0,0 +1,213 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+
+from app.config_loader import load_config
+
+app_config = load_config()
+logger = logging.getLogger(__name__)
+
+# --------------------
+# RUN CANCELLATION
+# --------------------
+# Every workflow run is registered under its run_id. Cancelling a run (client
+# disconnect, job cancellation) sets its event; nodes, LLM calls and sandboxed
+# executions check it and stop within a bounded time.
+#
+# A run can be registered more than once (by the API endpoint and by the graph
+# it calls); its event is kept until every holder has released it, so a run
+# cancelled by a disconnecting client still reads as cancelled in the worker
+# thread until that thread is done.
+#
+# Runs started by clients are claimed instead (`claim_run`): they are also
+# recorded in a SQLite database shared by the workers of the host
+# (`server.run_registry`), so a run ID is unique across workers and a
+# DELETE /runs/{run_id} served by any worker reaches the run. The request only
+# flags the run there; the watcher thread of the owning worker sets its event.
+# Generated run IDs are random, so only their client can cancel them.
+
+_POLL_SECONDS = 0.2
+_WATCH_SECONDS = 0.5
+
+# run_id -> [cancellation event, number of holders, claimed in the shared registry]
+_runs = {}
+_runs_lock = threading.Lock()
+
+_registry = None
+_registry_pid = None
+_registry_lock = threading.Lock()
+
+# LLM calls run here so that the calling node can stop waiting on cancellation.
+# Bounded, so that abandoned calls cannot pile up threads; calls beyond the bound queue.
+_llm_executor = ThreadPoolExecutor(
+    max_workers=app_config['llm']['max_concurrent_calls'], thread_name_prefix="llm-call"
+)
+
+
+class RunCancelled(Exception):
+    """Raised inside a run that has been cancelled."""
+
+
+class RunIdInUse(Exception):
+    """Raised when a client claims the ID of a run that is in progress."""
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _shared_registry() -> sqlite3.Connection:
+    """
+    Returns this process's connection to the shared run registry. Call with `_registry_lock` held.
+
+    Opened lazily, so that each forked worker opens its own connection and starts its own watcher.
+    """
+    global _registry, _registry_pid
+    if _registry_pid != os.getpid():
+        _registry = sqlite3.connect(
+            app_config['server']['run_registry'], timeout=10, isolation_level=None, check_same_thread=False
+        )
+        _registry.execute("PRAGMA journal_mode=WAL")
+        _registry.execute(
+            "CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, pid INTEGER NOT NULL, cancelled INTEGER NOT NULL)"
+        )
+        _registry_pid = os.getpid()
+        threading.Thread(target=_watch_cancellations, name="run-cancellation-watcher", daemon=True).start()
+    return _registry
+
+def _watch_cancellations() -> None:
+    """Sets the events of this worker's runs that another worker has flagged as cancelled."""
+    pid = os.getpid()
+    while True:
+        time.sleep(_WATCH_SECONDS)
+        try:
+            with _registry_lock:
+                rows = _shared_registry().execute(
+                    "SELECT run_id FROM runs WHERE pid = ? AND cancelled = 1", (pid,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read the run registry: {e}")
+            continue
+        for (run_id,) in rows:
+            with _runs_lock:
+                entry = _runs.get(run_id)
+            if entry is not None and not entry[0].is_set():
+                logger.info(f"Cancelling run {run_id} (requested through another worker).")
+                entry[0].set()
+
+
+def register_run(run_id: str) -> threading.Event:
+    """Registers a run, or holds it once more if already registered, and returns its cancellation event."""
+    with _runs_lock:
+        entry = _runs.get(run_id)
+        if entry is None:
+            entry = _runs[run_id] = [threading.Event(), 0, False]
+        entry[1] += 1
+        return entry[0]
+
+def claim_run(run_id: str) -> threading.Event:
+    """
+    Registers a run started by a client, here and in the registry shared by the workers.
+
+    Release it with `release_run` like any other registration.
+
+    Raises:
+        RunIdInUse: If a run with this ID is in progress in any worker.
+    """
+    with _runs_lock:
+        if run_id in _runs:
+            raise RunIdInUse(run_id)
+        entry = _runs[run_id] = [threading.Event(), 1, False]
+    try:
+        with _registry_lock:
+            registry = _shared_registry()
+            try:
+                registry.execute("INSERT INTO runs VALUES (?, ?, 0)", (run_id, os.getpid()))
+            except sqlite3.IntegrityError:
+                # Left behind by a worker that died during the run?
+                row = registry.execute("SELECT pid FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+                if row and row[0] != os.getpid() and _process_alive(row[0]):
+                    raise RunIdInUse(run_id)
+                registry.execute("REPLACE INTO runs VALUES (?, ?, 0)", (run_id, os.getpid()))
+    except BaseException:
+        release_run(run_id)
+        raise
+    entry[2] = True
+    return entry[0]
+
+def release_run(run_id: str) -> None:
+    """Releases a hold on a run; the run is forgotten once every holder has released it."""
+    with _runs_lock:
+        entry = _runs.get(run_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _runs[run_id]
+    if entry[2]:
+        try:
+            with _registry_lock:
+                _shared_registry().execute("DELETE FROM runs WHERE run_id = ? AND pid = ?", (run_id, os.getpid()))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not remove run {run_id} from the run registry: {e}")
+
+def cancel_run(run_id: str) -> bool:
+    """
+    Cancels a registered run, or flags a run claimed by another worker for cancellation.
+
+    Returns:
+        bool: False if no run with this ID is in progress.
+    """
+    with _runs_lock:
+        entry = _runs.get(run_id)
+    if entry is None:
+        with _registry_lock:
+            flagged = _shared_registry().execute(
+                "UPDATE runs SET cancelled = 1 WHERE run_id = ?", (run_id,)
+            ).rowcount
+        if flagged:
+            logger.info(f"Flagged run {run_id} of another worker for cancellation.")
+        return bool(flagged)
+    logger.info(f"Cancelling run {run_id}.")
+    entry[0].set()
+    return True
+
+def is_cancelled(run_id: Optional[str]) -> bool:
+    """Whether the run has been cancelled."""
+    with _runs_lock:
+        entry = _runs.get(run_id)
+    return bool(entry and entry[0].is_set())
+
+def call_cancellable(func: Callable, run_id: Optional[str]):
+    """
+    Calls `func` (typically a provider request) and waits for it unless the run is cancelled.
+
+    The provider call cannot be interrupted from another thread, so on cancellation
+    it is abandoned: its result is discarded and it ends within the client's
+    request timeout (`llm.request_timeout`).
+
+    Raises:
+        RunCancelled: If the run is cancelled before the call completes.
+    """
+    if is_cancelled(run_id):
+        raise RunCancelled(run_id)
+    # In the caller's context, so that LangChain callbacks and tracing keep their parent run.
+    future = _llm_executor.submit(contextvars.copy_context().run, func)
+    while True:
+        try:
+            return future.result(timeout=_POLL_SECONDS)
+        except FutureTimeoutError:
+            if is_cancelled(run_id):
+                future.cancel()
+                raise RunCancelled(run_id)
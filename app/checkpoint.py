@@ -0,0 +1,93 @@
+import os
+import inspect
+import logging
+import sqlite3
+from typing import Optional
+
+from app.config_loader import load_config
+
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+except ImportError:
+    SqliteSaver = None
+    JsonPlusSerializer = object
+
+app_config = load_config()
+logger = logging.getLogger(__name__)
+
+# --------------------
+# RUN CHECKPOINTS
+# --------------------
+# With `checkpoint.enabled`, the state of every run is saved in a local SQLite
+# database after each node, keyed by run_id. A run interrupted by a crash or
+# redeploy can then be resumed from its last completed node.
+
+_checkpointer = None
+_checkpointer_pid = None
+
+
+class _StateSerializer(JsonPlusSerializer):
+    """
+    Serializes the workflow state, leaving out the compiled functions.
+
+    Functions compiled from submitted code cannot be pickled; they are stored as
+    None and recompiled from their source when the run is resumed.
+    """
+    def __init__(self):
+        # Pickle covers argument types msgpack cannot encode.
+        super().__init__(pickle_fallback=True)
+
+    def dumps_typed(self, obj):
+        # Called with whole checkpoints and with single channel writes.
+        if inspect.isfunction(obj):
+            obj = None
+        elif isinstance(obj, dict) and 'channel_values' in obj:
+            obj = {**obj, 'channel_values': _without_functions(obj['channel_values'])}
+        return super().dumps_typed(obj)
+
+
+def _without_functions(values: dict) -> dict:
+    """Replaces the functions in a state, or in a state nested one level down (the run input), with None."""
+    return {
+        key: None if inspect.isfunction(value)
+        else {k: None if inspect.isfunction(v) else v for k, v in value.items()} if isinstance(value, dict)
+        else value
+        for key, value in values.items()
+    }
+
+
+def get_checkpointer() -> Optional["SqliteSaver"]:
+    """
+    Returns the checkpointer of this process, or None if checkpointing is disabled.
+
+    The SQLite connection is opened lazily, so that each forked worker opens its
+    own instead of sharing the one of the master process.
+    """
+    global _checkpointer, _checkpointer_pid
+    config = app_config['checkpoint']
+    if not config['enabled']:
+        return None
+    if SqliteSaver is None:
+        logger.warning("langgraph-checkpoint-sqlite is not installed. Runs will not be checkpointed.")
+        return None
+    if _checkpointer_pid != os.getpid():
+        connection = sqlite3.connect(config['path'], check_same_thread=False)
+        # WAL (enabled by the saver) with synchronous=NORMAL commits without an
+        # fsync per checkpoint; a power loss can only drop the latest checkpoints.
+        connection.execute("PRAGMA synchronous=NORMAL")
+        _checkpointer = SqliteSaver(connection, serde=_StateSerializer())
+        _checkpointer_pid = os.getpid()
+    return _checkpointer
+
+
+def run_config(run_id: str) -> dict:
+    """Returns the graph config that checkpoints a run under its run_id."""
+    return {'configurable': {'thread_id': run_id}}
+
+
+def delete_checkpoints(run_id: str) -> None:
+    """Deletes the checkpoints of a finished run."""
+    checkpointer = get_checkpointer()
+    if checkpointer:
+        checkpointer.delete_thread(run_id)
@@ -1,44 +1,676 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
 import logging
-from typing import Optional
+import sqlite3
+import zipfile
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import chromadb
+from chromadb.config import Settings as ChromaSettings
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
+from app.vector_index import LocalIndexClient
+
 logger = logging.getLogger(__name__)
 class ChromaCompatibleGoogleEmbeddings(GoogleGenerativeAIEmbeddings):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.name = self.model
         
+DEFAULT_NAMESPACE = "default"
+
+# Memory packs (see `export_memories`) are zip archives holding a manifest, the
+# memories as JSON lines and, optionally, their vectors as little-endian float32.
+PACK_FORMAT_VERSION = 1
+_IMPORT_BATCH_SIZE = 256
+_QUERY_BATCH_SIZE = 256
+
+
+def embedding_model_id(app_config: dict) -> str:
+    """Identifies the configured embedding model, to tell if stored vectors can be reused."""
+    provider = app_config['embedding_model']['default_provider']
+    return f"{provider}:{app_config['embedding_model']['providers'][provider]['model_name']}"
+
+
+_SQL_BATCH = 500
+
+
+class MemoryUsage:
+    """
+    Hit counts and last-used times of memories, ranked for eviction.
+
+    They are kept in SQLite rather than in the memories' metadata: a hit is an
+    atomic increment, where a read-modify-write of the metadata loses the hits
+    of concurrent workers, and the least used memories are found with an index
+    instead of a scan of the collection. A file path shares the counts between
+    the workers of a host; each process opens its own connection lazily.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or ':memory:'
+        self._connection_pid = None
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "collection TEXT, id TEXT, hits INTEGER, last_used REAL, PRIMARY KEY (collection, id))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS usage_rank ON usage (collection, hits, last_used)")
+            self._connection, self._connection_pid = connection, os.getpid()
+        return self._connection
+
+    def add(self, collection: str, usage: dict) -> None:
+        """Records memories with their (hits, last_used), replacing any previous record."""
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO usage (collection, id, hits, last_used) VALUES (?, ?, ?, ?)",
+                [(collection, memory_id, hits, last_used) for memory_id, (hits, last_used) in usage.items()],
+            )
+            connection.commit()
+
+    def hit(self, collection: str, ids: List[str], hits: int = 1) -> None:
+        """Adds hits to memories and marks them as used now."""
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT INTO usage (collection, id, hits, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (collection, id) DO UPDATE SET hits = hits + excluded.hits, last_used = excluded.last_used",
+                [(collection, memory_id, hits, time.time()) for memory_id in ids],
+            )
+            connection.commit()
+
+    def get(self, collection: str, ids: List[str]) -> dict:
+        """Returns the (hits, last_used) of the memories that have a record."""
+        found = {}
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(ids), _SQL_BATCH):
+                batch = ids[start:start + _SQL_BATCH]
+                found.update((memory_id, (hits, last_used)) for memory_id, hits, last_used in connection.execute(
+                    f"SELECT id, hits, last_used FROM usage WHERE collection = ? AND id IN ({','.join('?' * len(batch))})",
+                    [collection, *batch],
+                ))
+        return found
+
+    def count(self, collection: str) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM usage WHERE collection = ?", (collection,)).fetchone()[0]
+
+    def least_used(self, collection: str, limit: int) -> List[str]:
+        """Returns the least used memories: fewest hits first, then least recently used."""
+        with self._lock:
+            return [row[0] for row in self._connect().execute(
+                "SELECT id FROM usage WHERE collection = ? ORDER BY hits, last_used LIMIT ?", (collection, limit)
+            )]
+
+    def remove(self, collection: str, ids: List[str]) -> None:
+        with self._lock:
+            connection = self._connect()
+            for start in range(0, len(ids), _SQL_BATCH):
+                batch = ids[start:start + _SQL_BATCH]
+                connection.execute(
+                    f"DELETE FROM usage WHERE collection = ? AND id IN ({','.join('?' * len(batch))})", [collection, *batch]
+                )
+            connection.commit()
+
+
 class VectorDB:
     """
     A modular class to handle ChromaDB vector database operations.
-    It encapsulates the client and collection and is initialized with an embedding function.
+    It encapsulates the client and collections and is initialized with an embedding function.
+
+    With the "local" backend, collections are held in this process instead (see
+    `app.vector_index`): exact search for small sets, HNSW for large ones.
+
+    Memories are isolated per namespace (tenant): each namespace maps to its own
+    collection, opened lazily and kept in an LRU of open handles.
+
+    Besides access to the collections, it manages the memory lifecycle: near-duplicate
+    merging at insert time, a maximum document length, a maximum collection size with
+    usage-based eviction, and offline compaction.
     """
-    def __init__(self, embedding_function):
+    def __init__(
+        self,
+        embedding_function,
+        collection_name: str = "bug-reports",
+        persist_directory: Optional[str] = None,
+        max_document_chars: int = 2000,
+        max_documents: int = 5000,
+        dedup_distance: float = 0.05,
+        max_open_collections: int = 32,
+        memory_limit_bytes: int = 0,
+        server_host: Optional[str] = None,
+        server_port: int = 8000,
+        backend: str = "chroma",
+        local_index: Optional[dict] = None,
+        usage_path: Optional[str] = None,
+    ):
         """
-        Initializes the VectorDB with a ChromaDB instance.
+        Initializes the VectorDB with a ChromaDB client.
         
         Args:
-            embedding_function: The embedding function to use for the collection.
+            embedding_function: The embedding function to use for the collections.
+            collection_name: The collection of the default namespace, and the prefix of the others.
+            persist_directory: Directory for a persistent store. In-memory if None.
+            max_document_chars: Memories longer than this are truncated.
+            max_documents: Least used memories of a namespace are evicted beyond this size.
+            dedup_distance: New memories closer than this to an existing one are merged into it.
+            max_open_collections: Number of collection handles kept open.
+            memory_limit_bytes: For persistent stores, the memory budget of loaded
+                                collection indexes, which are unloaded LRU-first. 0 disables the limit.
+            server_host: Host of a Chroma server. When set, memories live in that server
+                         process and are shared by every API worker.
+            server_port: Port of the Chroma server.
+            backend: "chroma", or "local" for the in-process index. The local index is
+                     not shared between processes, so it ignores `server_host`.
+            local_index: Options of the local index (space and HNSW parameters).
+            usage_path: SQLite file of the memories' hit counts (see `MemoryUsage`),
+                        shared by the workers of a host. In-memory if None.
         """
-        self.collection = None
-        
+        self.client = None
+        self.embedding_function = embedding_function
+        self.collection_name = collection_name
+        self.max_document_chars = max_document_chars
+        self.max_documents = max_documents
+        self.dedup_distance = dedup_distance
+        self.max_open_collections = max_open_collections
+        self.backend = backend
+        self.local_index = local_index or {}
+        self.usage = MemoryUsage(usage_path)
+        self._collections = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._client_args = (persist_directory, memory_limit_bytes, server_host, server_port)
+        self.reconnect()
+
+    def reconnect(self) -> None:
+        """
+        (Re)creates the ChromaDB client and drops every open collection handle.
+
+        Pre-forking servers call this in each worker after the fork, so that no
+        connection is shared between processes.
+        """
+        persist_directory, memory_limit_bytes, server_host, server_port = self._client_args
+        with self._lock:
+            self._collections.clear()
         try:
-    
-            self.collection = Chroma(
-                collection_name="bug-reports",
-                embedding_function=embedding_function,
-            )
-            logger.info("✅ Successfully connected to ChromaDB using langchain-chroma.")
+            if self.backend == 'local':
+                self.client = LocalIndexClient(persist_directory, **self.local_index)
+            elif server_host:
+                self.client = chromadb.HttpClient(host=server_host, port=server_port)
+            elif persist_directory:
+                chroma_settings = ChromaSettings(
+                    chroma_segment_cache_policy="LRU" if memory_limit_bytes else None,
+                    chroma_memory_limit_bytes=memory_limit_bytes,
+                )
+                self.client = chromadb.PersistentClient(path=persist_directory, settings=chroma_settings)
+            else:
+                self.client = chromadb.EphemeralClient()
+            self.get_collection()
+            logger.info(f"✅ Successfully opened the memory store ({self.backend} backend).")
         except Exception as e:
             logger.error(f"❌ Failed to connect to ChromaDB or load collection: {e}")
-            self.collection = None
+            self.client = None
+
+    def close(self) -> None:
+        """Closes the client and every open collection; a local store is released for other processes."""
+        with self._lock:
+            self._collections.clear()
+        if self.backend == 'local' and self.client:
+            self.client.close()
+        self.client = None
+
+    @property
+    def is_persistent(self) -> bool:
+        """Whether the memories outlive this process (a persist directory or a Chroma server)."""
+        return bool(self._client_args[0]) or (self.backend != 'local' and bool(self._client_args[2]))
 
-    def get_collection(self):
-        """Returns the initialized ChromaDB collection."""
-        if not self.collection:
+    @property
+    def is_shared(self) -> bool:
+        """Whether the memories live outside this process and can be shared across workers."""
+        return self.backend != 'local' and bool(self._client_args[2])
+
+    def get_collection(self, namespace: str = DEFAULT_NAMESPACE):
+        """
+        Returns the ChromaDB collection of a namespace, opening it if needed.
+
+        The least recently used handle is closed once more than
+        `max_open_collections` are open.
+        """
+        if not self.client:
             logger.error("Attempted to access collection before successful initialization.")
-        return self.collection
+            return None
+
+        with self._lock:
+            if namespace in self._collections:
+                self._collections.move_to_end(namespace)
+                return self._collections[namespace]
+
+            name = self._collection_name(namespace)
+            if self.backend == 'local':
+                collection = self.client.get_or_create_collection(name)
+            else:
+                collection = Chroma(
+                    client=self.client,
+                    collection_name=name,
+                    embedding_function=self.embedding_function,
+                )
+            self._collections[namespace] = collection
+            self._stats.setdefault(namespace, {'searches': 0, 'search_seconds': 0.0, 'max_search_seconds': 0.0})
+            if len(self._collections) > self.max_open_collections:
+                closed, closed_collection = self._collections.popitem(last=False)
+                if self.backend == 'local':
+                    closed_collection.flush()
+                logger.info(f"Closed idle memory collection for namespace '{closed}'.")
+            return collection
+
+    def _collection_name(self, namespace: str) -> str:
+        return self.collection_name if namespace == DEFAULT_NAMESPACE else f"{self.collection_name}-{namespace}"
+
+    def _store(self, namespace: str = DEFAULT_NAMESPACE):
+        """Returns the low-level collection of a namespace (chromadb's, or a local one with the same API)."""
+        collection = self.get_collection(namespace)
+        return collection if self.backend == 'local' else collection._collection
+
+    def count(self, namespace: str = DEFAULT_NAMESPACE) -> int:
+        """Returns the number of memories in a namespace."""
+        return self._store(namespace).count()
+
+    def stats(self) -> dict:
+        """
+        Returns the size and search latency of every namespace used since startup.
+
+        Idle namespaces are counted through the client, without reopening their
+        handles or reordering the open ones.
+        """
+        with self._lock:
+            snapshot = {namespace: dict(stats) for namespace, stats in self._stats.items()}
+            open_namespaces = set(self._collections)
+        return {
+            namespace: {
+                'documents': self._count_without_opening(namespace),
+                'open': namespace in open_namespaces,
+                'searches': stats['searches'],
+                'mean_search_ms': 1000 * stats['search_seconds'] / stats['searches'] if stats['searches'] else None,
+                'max_search_ms': 1000 * stats['max_search_seconds'],
+            }
+            for namespace, stats in snapshot.items()
+        }
+
+    def _count_without_opening(self, namespace: str) -> int:
+        name = self._collection_name(namespace)
+        if self.backend == 'local':
+            return self.client.count(name)
+        return self.client.get_collection(name).count()
+
+    def search(self, query: str, k: int, namespace: str = DEFAULT_NAMESPACE) -> List[Tuple[Document, float]]:
+        """
+        Searches for memories similar to the query and records a hit on each result.
+
+        Returns:
+            list: (document, distance) pairs, closest first.
+        """
+        store = self._store(namespace)
+        embedding = self.embedding_function.embed_query(query)
+        start = time.perf_counter()
+        found = store.query(query_embeddings=[embedding], n_results=k, include=["documents", "metadatas", "distances"])
+        elapsed = time.perf_counter() - start
+        results = [
+            (Document(page_content=text, metadata=metadata or {}), distance)
+            for text, metadata, distance in zip(found['documents'][0], found['metadatas'][0], found['distances'][0])
+        ]
+
+        with self._lock:
+            stats = self._stats[namespace]
+            stats['searches'] += 1
+            stats['search_seconds'] += elapsed
+            stats['max_search_seconds'] = max(stats['max_search_seconds'], elapsed)
+
+        self.record_hits([doc.metadata['id'] for doc, _ in results if doc.metadata.get('id')], namespace)
+        return results
+
+    def record_hits(self, ids: List[str], namespace: str = DEFAULT_NAMESPACE) -> None:
+        """Increments the hit count and refreshes the last-used time of the given memories."""
+        if ids:
+            self.usage.hit(self._collection_name(namespace), ids)
+
+    def get_memory(self, memory_id: str, namespace: str = DEFAULT_NAMESPACE) -> Optional[Tuple[str, dict]]:
+        """Returns the text and metadata of a memory, or None if it does not exist."""
+        results = self._store(namespace).get(ids=[memory_id], include=["documents", "metadatas"])
+        if not results['documents']:
+            return None
+        return results['documents'][0], results['metadatas'][0] or {}
+
+    def add_memory(self, text: str, metadata: Optional[dict] = None, namespace: str = DEFAULT_NAMESPACE) -> str:
+        """
+        Adds a memory, merging it into an existing one if it is a near-duplicate.
+
+        The text is embedded once and the vector is reused for both the duplicate
+        check and the insert. Least used memories are evicted afterwards if the
+        collection exceeds its maximum size.
+
+        Returns:
+            str: The ID of the new memory, or of the memory it was merged into.
+        """
+        text = text[:self.max_document_chars]
+        embedding = self.embedding_function.embed_documents([text])[0]
+        store = self._store(namespace)
+
+        if store.count():
+            nearest = store.query(query_embeddings=[embedding], n_results=1, include=["distances"])
+            if nearest['ids'][0] and nearest['distances'][0][0] <= self.dedup_distance:
+                duplicate_id = nearest['ids'][0][0]
+                self.record_hits([duplicate_id], namespace)
+                logger.info(f"Merged near-duplicate memory into ID: {duplicate_id}")
+                return duplicate_id
+
+        new_id = str(uuid.uuid4())
+        now = time.time()
+        metadata = dict(metadata or {}, id=new_id, created=now)
+        store.add(ids=[new_id], embeddings=[embedding], documents=[text], metadatas=[metadata])
+        self.usage.add(self._collection_name(namespace), {new_id: (0, now)})
+        self.evict(namespace)
+        return new_id
+
+    def update_memory(
+        self, memory_id: str, text: str, metadata: Optional[dict] = None, namespace: str = DEFAULT_NAMESPACE
+    ) -> None:
+        """Replaces the text of a memory, truncated to the maximum document length."""
+        current = self.get_memory(memory_id, namespace)
+        metadata = dict(current[1] if current else {}, **(metadata or {}), id=memory_id)
+        text = text[:self.max_document_chars]
+        embedding = self.embedding_function.embed_documents([text])[0]
+        self._store(namespace).update(ids=[memory_id], embeddings=[embedding], documents=[text], metadatas=[metadata])
+
+    def set_metadata(self, ids: List[str], namespace: str = DEFAULT_NAMESPACE, **fields) -> None:
+        """Sets metadata fields on the given memories without re-embedding them."""
+        store = self._store(namespace)
+        results = store.get(ids=ids, include=["metadatas"])
+        if results['ids']:
+            metadatas = [dict(metadata or {}, **fields) for metadata in results['metadatas']]
+            store.update(ids=results['ids'], metadatas=metadatas)
+
+    def evict(self, namespace: str = DEFAULT_NAMESPACE) -> int:
+        """
+        Evicts the least used memories until the namespace fits its maximum size.
+
+        Memories are ranked by hit count, then by last-used time, so rarely and
+        least recently used memories go first. The ranking is read from the usage
+        index, so an insert at capacity does not scan the collection.
+
+        Returns:
+            int: The number of evicted memories.
+        """
+        store = self._store(namespace)
+        excess = store.count() - self.max_documents
+        if excess <= 0:
+            return 0
+        name = self._collection_name(namespace)
+        if not self.usage.count(name):
+            self._index_usage(store, name)
+
+        evicted_ids = []
+        while len(evicted_ids) < excess:
+            candidates = self.usage.least_used(name, excess - len(evicted_ids))
+            if not candidates:
+                break
+            # Records can outlive their memories (e.g. an ephemeral store that was restarted).
+            existing = store.get(ids=candidates, include=[])['ids']
+            if existing:
+                store.delete(ids=existing)
+            self.usage.remove(name, candidates)
+            evicted_ids.extend(existing)
+        logger.info(f"Evicted {len(evicted_ids)} least used memories.")
+        return len(evicted_ids)
+
+    def _index_usage(self, store, name: str) -> None:
+        """Records the usage of memories stored before it was tracked, from their metadata."""
+        results = store.get(include=["metadatas"])
+        self.usage.add(name, {
+            memory_id: ((metadata or {}).get('hits', 0), (metadata or {}).get('last_used', 0))
+            for memory_id, metadata in zip(results['ids'], results['metadatas'])
+        })
+
+    def compact(self, namespace: str = DEFAULT_NAMESPACE) -> dict:
+        """
+        Compacts the collection of a namespace offline.
+
+        Oversized memories are truncated, near-duplicates are merged into the most
+        used memory of their group (summing hit counts), and the collection is then
+        evicted down to its maximum size.
+
+        Returns:
+            dict: The number of truncated, merged and evicted memories.
+        """
+        store = self._store(namespace)
+        name = self._collection_name(namespace)
+        results = store.get(include=["documents", "metadatas", "embeddings"])
+        usage = self.usage.get(name, results['ids'])
+        hits = {memory_id: usage.get(memory_id, (0, 0))[0] for memory_id in results['ids']}
+        memories = sorted(
+            zip(results['ids'], results['documents'], results['metadatas'], results['embeddings']),
+            key=lambda item: hits[item[0]],
+            reverse=True,
+        )
+
+        truncated = 0
+        for memory_id, text, metadata, _ in memories:
+            if len(text) > self.max_document_chars:
+                self.update_memory(memory_id, text, metadata, namespace)
+                truncated += 1
+
+        merged_ids = set()
+        for start in range(0, len(memories), _QUERY_BATCH_SIZE):
+            batch = memories[start:start + _QUERY_BATCH_SIZE]
+            # The neighbours of a batch of memories are found with one query.
+            neighbours = store.query(
+                query_embeddings=[embedding for _, _, _, embedding in batch],
+                n_results=min(10, store.count()),
+                include=["distances", "metadatas"],
+            )
+            for index, (memory_id, _, metadata, _) in enumerate(batch):
+                if memory_id in merged_ids:
+                    continue
+                duplicates = [
+                    (neighbour_id, neighbour_metadata)
+                    for neighbour_id, distance, neighbour_metadata in zip(
+                        neighbours['ids'][index], neighbours['distances'][index], neighbours['metadatas'][index]
+                    )
+                    if neighbour_id != memory_id and neighbour_id not in merged_ids and distance <= self.dedup_distance
+                ]
+                if not duplicates:
+                    continue
+                duplicate_ids = [neighbour_id for neighbour_id, _ in duplicates]
+                self.usage.hit(name, [memory_id], hits=sum(hits.get(neighbour_id, 0) for neighbour_id in duplicate_ids))
+                store.delete(ids=duplicate_ids)
+                self.usage.remove(name, duplicate_ids)
+                merged_ids.update(neighbour_id for neighbour_id, _ in duplicates)
+
+        evicted = self.evict(namespace)
+        logger.info(f"Compaction done: {truncated} truncated, {len(merged_ids)} merged, {evicted} evicted.")
+        return {'truncated': truncated, 'merged': len(merged_ids), 'evicted': evicted}
+
+    def export_memories(self, path: str, embedding_model_id: str, namespace: str = DEFAULT_NAMESPACE) -> int:
+        """
+        Exports the memories of a namespace, with their vectors, to a memory pack.
+
+        Args:
+            path: The zip archive to write.
+            embedding_model_id: The model the vectors were computed with, recorded in
+                                the manifest so importers know if they can reuse them.
+            namespace: The namespace to export.
+
+        Returns:
+            int: The number of exported memories.
+        """
+        results = self._store(namespace).get(include=["documents", "metadatas", "embeddings"])
+        usage = self.usage.get(self._collection_name(namespace), results['ids'])
+        metadatas = [
+            dict(metadata or {}, hits=usage[memory_id][0], last_used=usage[memory_id][1]) if memory_id in usage
+            else metadata or {}
+            for memory_id, metadata in zip(results['ids'], results['metadatas'])
+        ]
+        vectors = array('f')
+        for embedding in results['embeddings']:
+            vectors.extend(embedding)
+        if sys.byteorder == 'big':
+            vectors.byteswap()
+
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as pack:
+            pack.writestr('manifest.json', json.dumps({
+                'format_version': PACK_FORMAT_VERSION,
+                'embedding_model': embedding_model_id,
+                'dimensions': len(results['embeddings'][0]) if len(results['ids']) else 0,
+                'count': len(results['ids']),
+            }))
+            pack.writestr('memories.jsonl', ''.join(
+                json.dumps({'id': memory_id, 'document': text, 'metadata': metadata or {}}) + '\n'
+                for memory_id, text, metadata in zip(results['ids'], results['documents'], metadatas)
+            ))
+            pack.writestr('vectors.f32', vectors.tobytes())
+        logger.info(f"Exported {len(results['ids'])} memories to {path}.")
+        return len(results['ids'])
+
+    def import_memories(self, path: str, embedding_model_id: str, namespace: str = DEFAULT_NAMESPACE) -> int:
+        """
+        Imports a memory pack, or a JSON lines file of memories, in batches.
+
+        The vectors of a pack are inserted as they are when they were computed with
+        the same embedding model; otherwise (or for JSON lines files, which hold no
+        vectors) the documents are embedded in batches. Memories keep their IDs, so
+        importing a pack twice does not duplicate it.
+
+        Returns:
+            int: The number of imported memories.
+        """
+        memories, vectors = _read_pack(path, embedding_model_id)
+        store = self._store(namespace)
+        now = time.time()
+        for start in range(0, len(memories), _IMPORT_BATCH_SIZE):
+            batch = memories[start:start + _IMPORT_BATCH_SIZE]
+            ids = [memory.get('id') or str(uuid.uuid5(uuid.NAMESPACE_URL, memory['document'])) for memory in batch]
+            documents = [memory['document'][:self.max_document_chars] for memory in batch]
+            metadatas = [
+                {'created': now, **memory.get('metadata', {}), 'id': memory_id}
+                for memory_id, memory in zip(ids, batch)
+            ]
+            # Usage exported with a pack is moved back to the usage index.
+            usage = {
+                memory_id: (metadata.pop('hits', 0), metadata.pop('last_used', now))
+                for memory_id, metadata in zip(ids, metadatas)
+            }
+            embeddings = vectors[start:start + len(batch)] if vectors else self.embedding_function.embed_documents(documents)
+            store.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+            self.usage.add(self._collection_name(namespace), usage)
+        self.evict(namespace)
+        logger.info(f"Imported {len(memories)} memories from {path} ({'stored' if vectors else 'new'} vectors).")
+        return len(memories)
+
+    def seed(self, path: str, embedding_model_id: str, namespace: str = DEFAULT_NAMESPACE) -> int:
+        """
+        Imports a memory pack into a namespace that has no memories yet.
+
+        Returns:
+            int: The number of imported memories, 0 if the namespace already had some.
+        """
+        if self.count(namespace):
+            return 0
+        return self.import_memories(path, embedding_model_id, namespace)
+
+
+def _read_pack(path: str, embedding_model_id: str) -> Tuple[List[dict], Optional[List[List[float]]]]:
+    """
+    Reads the memories of a pack, and their vectors if they match the embedding model.
+
+    Returns:
+        tuple: The memories (dicts with `document` and optional `id` and `metadata`),
+               and their vectors, or None if they must be recomputed.
+    """
+    if not zipfile.is_zipfile(path):
+        with open(path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file if line.strip()], None
+
+    with zipfile.ZipFile(path) as pack:
+        manifest = json.loads(pack.read('manifest.json'))
+        if manifest['format_version'] > PACK_FORMAT_VERSION:
+            raise ValueError(f"Unsupported memory pack version: {manifest['format_version']}")
+        memories = [json.loads(line) for line in io.TextIOWrapper(pack.open('memories.jsonl'), encoding='utf-8')]
+        if manifest['embedding_model'] != embedding_model_id:
+            logger.warning(
+                f"Memory pack vectors were computed with '{manifest['embedding_model']}', "
+                f"not '{embedding_model_id}'. The memories will be re-embedded."
+            )
+            return memories, None
+        vectors = array('f')
+        vectors.frombytes(pack.read('vectors.f32'))
+    if sys.byteorder == 'big':
+        vectors.byteswap()
+    dimensions = manifest['dimensions']
+    return memories, [vectors[i * dimensions:(i + 1) * dimensions].tolist() for i in range(len(memories))]
+
+
+if __name__ == '__main__':
+    # Maintenance of a persistent store:
+    #   python -m app.db compact [--namespace NAME]
+    #   python -m app.db export PACK [--namespace NAME]
+    #   python -m app.db import PACK [--namespace NAME]
+    #   python -m app.db seed [PACK] [--namespace NAME]   (only into an empty namespace)
+    import argparse
+    from app.config_loader import load_config
+    from app.model_loader import ModelLoader
+    from app.settings_loader import settings
+
+    parser = argparse.ArgumentParser(description="Memory store maintenance.")
+    parser.add_argument('command', choices=['compact', 'export', 'import', 'seed'])
+    parser.add_argument('path', nargs='?', help="Memory pack to export to or import from (seed: memory.seed_pack).")
+    parser.add_argument('--namespace', default=DEFAULT_NAMESPACE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    app_config = load_config()
+    if args.command == 'seed':
+        args.path = args.path or app_config['memory']['seed_pack']
+    if args.command != 'compact' and not args.path:
+        parser.error(f"{args.command} needs the path of a memory pack.")
+    if not (app_config['vector_db'].get('persist_directory') or settings.CHROMA_SERVER_HOST):
+        raise SystemExit("vector_db.persist_directory or CHROMA_SERVER_HOST must be set to maintain a persistent store.")
+
+    provider = app_config['embedding_model']['default_provider']
+    db = VectorDB(
+        embedding_function=ModelLoader().load_embedding(),
+        server_host=settings.CHROMA_SERVER_HOST,
+        server_port=settings.CHROMA_SERVER_PORT,
+        dedup_distance=app_config['retrieval']['providers'][provider]['dedup_distance'],
+        **app_config['vector_db'],
+    )
+    if not db.client:
+        raise SystemExit("Could not connect to the memory store.")
+    before = db.count(args.namespace)
+    if args.command == 'compact':
+        stats = db.compact(args.namespace)
+        print(f"Memories: {before} -> {db.count(args.namespace)} ({stats})")
+    elif args.command == 'export':
+        exported = db.export_memories(args.path, embedding_model_id(app_config), args.namespace)
+        print(f"Exported {exported} memories to {args.path}")
+    elif args.command == 'seed':
+        imported = db.seed(args.path, embedding_model_id(app_config), args.namespace)
+        print(f"Seeded {imported} memories." if imported else f"Not seeded: the namespace has {before} memories.")
+    else:
+        imported = db.import_memories(args.path, embedding_model_id(app_config), args.namespace)
+        print(f"Imported {imported} memories. Memories: {before} -> {db.count(args.namespace)}")
 
 
 
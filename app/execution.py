@@ -0,0 +1,438 @@
+import io
+import os
+import sys
+import time
+import hashlib
+import pstats
+import cProfile
+import logging
+import linecache
+import tracemalloc
+import threading
+import traceback
+import contextvars
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from app.config_loader import load_config
+from app.cancellation import RunCancelled, is_cancelled
+
+app_config = load_config()
+logger = logging.getLogger(__name__)
+
+# Sources compiled from strings are registered in linecache under a unique
+# filename, so tracebacks can show the failing line. Old entries are dropped.
+_registered_sources = deque()
+_MAX_REGISTERED_SOURCES = 256
+
+_POLL_SECONDS = 0.1
+
+# Dotted module name of the submitted code, set by callers that heal a file of a
+# real project (the runner), so that its relative imports resolve. Code compiled
+# in the same context, patches included, runs as that module.
+source_module = contextvars.ContextVar('source_module', default=None)
+
+# sys.path and sys.modules are shared by the process, so runs of project files
+# take turns: two projects with a module of the same name would import each other's.
+_project_lock = threading.Lock()
+
+# tracemalloc and cProfile act on the whole process, so concurrent runs take
+# turns measuring. A forked sandbox gets a fresh lock, whatever other threads held.
+_profiling_lock = threading.Lock()
+
+
+def _reset_profiling_lock() -> None:
+    global _profiling_lock
+    _profiling_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_profiling_lock)
+
+
+# --------------------
+# COMPILATION
+# --------------------
+
+_COMPILED_PREFIX = '<healing-'
+
+def compile_source(source: str) -> dict:
+    """
+    Executes source code in a fresh namespace, keeping its lines available to tracebacks.
+
+    Args:
+        source: The Python source code, e.g. a function definition.
+
+    Returns:
+        dict: The namespace populated by the code.
+    """
+    # Named after the content, so tracebacks (and the prompts quoting them) are
+    # the same every time the same code runs.
+    filename = f"{_COMPILED_PREFIX}{hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]}>"
+    if filename not in linecache.cache:
+        lines = source.splitlines(keepends=True)
+        linecache.cache[filename] = (len(source), None, lines, filename)
+        _registered_sources.append(filename)
+        while len(_registered_sources) > _MAX_REGISTERED_SOURCES:
+            linecache.cache.pop(_registered_sources.popleft(), None)
+
+    namespace = {}
+    module = source_module.get()
+    if module:
+        namespace.update(__name__=module, __package__=module.rpartition('.')[0])
+    exec(compile(source, filename, 'exec'), namespace)
+    return namespace
+
+def module_location(path: str) -> tuple:
+    """
+    Locates a source file in its project: the directory to import it from, and its module name.
+
+    The directory is the file's own one, or the root of the package the file belongs to
+    (the first ancestor without an `__init__.py`), so that sibling modules and relative
+    imports resolve as they do when the project imports the file.
+    """
+    directory, filename = os.path.split(os.path.abspath(path))
+    parts = [os.path.splitext(filename)[0]]
+    while os.path.isfile(os.path.join(directory, '__init__.py')):
+        directory, package = os.path.split(directory)
+        parts.insert(0, package)
+    return directory, '.'.join(parts)
+
+@contextmanager
+def project_module(path: str):
+    """
+    Runs the block as the module at `path` of a real project: its import root is on
+    `sys.path` and code compiled in the block runs under its module name (see
+    `source_module`). Blocks of different runs take turns.
+
+    The project's modules first imported during the block are dropped afterwards, so
+    the next run sees the project's files as they are then.
+    """
+    root, module = module_location(path)
+    with _project_lock:
+        added = root not in sys.path
+        if added:
+            sys.path.insert(0, root)
+        loaded = set(sys.modules)
+        token = source_module.set(module)
+        try:
+            yield
+        finally:
+            source_module.reset(token)
+            if added and root in sys.path:
+                sys.path.remove(root)
+            prefix = os.path.join(root, '')
+            for name in set(sys.modules) - loaded:
+                if (getattr(sys.modules.get(name), '__file__', None) or '').startswith(prefix):
+                    sys.modules.pop(name, None)
+
+def source_line_offset(function: Callable) -> int:
+    """
+    Returns the line, less one, of the submitted source at which the function's code starts.
+
+    Code compiled by `compile_source` is numbered from the first line of its source,
+    while a function defined in a file and submitted with `inspect.getsource` is
+    numbered in its file. Subtracting this from a line number of its traceback
+    gives the line in the submitted source.
+    """
+    code = getattr(function, '__code__', None)
+    if code is None or code.co_filename.startswith(_COMPILED_PREFIX):
+        return 0
+    return code.co_firstlineno - 1
+
+
+# --------------------
+# EXECUTION
+# --------------------
+
+def _safe_repr(value: Any, max_chars: int) -> str:
+    """Returns a repr of the value cut to `max_chars`, never raising."""
+    try:
+        text = repr(value)
+    except Exception as e:
+        text = f"<unrepresentable {type(value).__name__}: {e}>"
+    return text if len(text) <= max_chars else text[:max_chars] + '...'
+
+def _diagnose(error: BaseException, function: Callable) -> dict:
+    """
+    Extracts compact diagnostics from an exception raised by the user function.
+
+    The failing frame is the innermost frame belonging to the user's code.
+    """
+    config = app_config['execution']
+    user_filename = getattr(getattr(function, '__code__', None), 'co_filename', None)
+
+    failing_tb = None
+    tb = error.__traceback__
+    while tb is not None:
+        if tb.tb_frame.f_code.co_filename == user_filename:
+            failing_tb = tb
+        tb = tb.tb_next
+
+    formatted = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+    # The innermost frames are the most useful, so the head is cut.
+    if len(formatted) > config['max_traceback_chars']:
+        formatted = '...' + formatted[-config['max_traceback_chars']:]
+
+    diagnostics = {
+        'error_type': type(error).__name__,
+        'message': str(error),
+        'traceback': formatted,
+        'failing_function': None,
+        'failing_lineno': None,
+        'failing_line': None,
+        'locals': {},
+    }
+    if failing_tb is not None:
+        frame = failing_tb.tb_frame
+        # Qualified, so that `B.run` is not mistaken for `A.run`; a nested function
+        # is reported as the definition that contains it.
+        diagnostics['failing_function'] = frame.f_code.co_qualname.split('.<locals>.')[0]
+        diagnostics['failing_lineno'] = failing_tb.tb_lineno
+        diagnostics['failing_line'] = linecache.getline(frame.f_code.co_filename, failing_tb.tb_lineno).strip()
+        diagnostics['locals'] = {
+            name: _safe_repr(value, config['max_local_chars'])
+            for name, value in list(frame.f_locals.items())[:config['max_locals']]
+        }
+    return diagnostics
+
+def _failure_outcome(error_type: str, message: str) -> dict:
+    """Builds the outcome of an execution that was stopped from outside the function."""
+    return {
+        'error': True,
+        'result': None,
+        'diagnostics': {
+            'error_type': error_type,
+            'message': message,
+            'traceback': '',
+            'failing_function': None,
+            'failing_lineno': None,
+            'failing_line': None,
+            'locals': {},
+        },
+        'profile': {},
+    }
+
+def _execute_inline(function: Callable, arguments: list, kwargs: Optional[dict], profile: bool) -> dict:
+    """Calls the user function in the current thread."""
+    if not profile:
+        return _call(function, arguments, kwargs)
+    with _profiling_lock:
+        return _call_profiled(function, arguments, kwargs)
+
+def _call(function: Callable, arguments: list, kwargs: Optional[dict]) -> dict:
+    outcome = {'error': False, 'result': None, 'diagnostics': {}, 'profile': {}}
+    try:
+        outcome['result'] = function(*arguments, **(kwargs or {}))
+    except Exception as e:
+        outcome['error'] = True
+        outcome['diagnostics'] = _diagnose(e, function)
+    return outcome
+
+def _call_profiled(function: Callable, arguments: list, kwargs: Optional[dict]) -> dict:
+    """Calls the function under cProfile and tracemalloc. Call with `_profiling_lock` held."""
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        profiler.enable()
+        outcome = _call(function, arguments, kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(
+        app_config['execution']['profile_top_functions']
+    )
+    outcome['profile'] = {
+        'seconds': elapsed,
+        'peak_memory_bytes': peak,
+        'top_functions': stream.getvalue().strip(),
+    }
+    return outcome
+
+def _execute_in_child(connection, work: Callable, *args) -> None:
+    """Entry point of the forked sandbox process: does the work and sends back its outcome."""
+    outcome = work(*args)
+    try:
+        connection.send(outcome)
+    except Exception:
+        # The result cannot be pickled, so only its repr is sent back.
+        outcome['result'] = _safe_repr(outcome['result'], app_config['execution']['max_local_chars'])
+        connection.send(outcome)
+    connection.close()
+
+def _in_process(work: Callable, args: tuple, run_id: Optional[str]) -> dict:
+    """
+    Calls `work(*args)`, which returns an outcome, in a forked child process.
+
+    The child is killed when the run is cancelled or after
+    `execution.timeout_seconds`; the outcome then has `timed_out` set. Forking
+    shares the function and arguments with the child without pickling them.
+
+    Raises:
+        RunCancelled: If the run is cancelled while the child runs.
+    """
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_execute_in_child, args=(sender, work, *args), daemon=True)
+    process.start()
+    sender.close()
+
+    timeout = app_config['execution']['timeout_seconds']
+    deadline = time.monotonic() + timeout
+    try:
+        while not receiver.poll(_POLL_SECONDS):
+            if is_cancelled(run_id):
+                raise RunCancelled(run_id)
+            if time.monotonic() > deadline:
+                return dict(
+                    _failure_outcome('TimeoutError', f"Execution did not finish within {timeout} seconds."),
+                    timed_out=True,
+                )
+            if not process.is_alive() and not receiver.poll():
+                return _failure_outcome('ProcessExit', f"The function terminated the process (exit code {process.exitcode}).")
+        return receiver.recv()
+    except EOFError:
+        return _failure_outcome('ProcessExit', f"The function terminated the process (exit code {process.exitcode}).")
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        receiver.close()
+
+def _execute_in_process(
+    function: Callable, arguments: list, kwargs: Optional[dict], profile: bool, run_id: Optional[str]
+) -> dict:
+    """
+    Calls the user function in a forked child process (see `_in_process`).
+
+    Raises:
+        RunCancelled: If the run is cancelled while the function runs.
+    """
+    return _in_process(_execute_inline, (function, arguments, kwargs, profile), run_id)
+
+def execute_function(
+    function: Callable,
+    arguments: list,
+    kwargs: Optional[dict] = None,
+    profile: Optional[bool] = None,
+    run_id: Optional[str] = None,
+) -> dict:
+    """
+    Calls the user function and captures diagnostics on failure.
+
+    Depending on `execution.isolation`, the function runs inline or in a forked
+    sandbox process that can be killed on cancellation or timeout.
+
+    Args:
+        function: The Python callable function.
+        arguments: The positional arguments for the function.
+        kwargs: The keyword arguments for the function.
+        profile: Whether to collect cProfile and tracemalloc statistics. Defaults
+                 to the `execution.profile` setting in the config.
+        run_id: The run the execution belongs to, for cancellation.
+
+    Returns:
+        dict: `error` (bool), `result`, `diagnostics` (dict, on failure) and
+              `profile` (dict, when profiling).
+
+    Raises:
+        RunCancelled: If the run has been cancelled.
+    """
+    if profile is None:
+        profile = app_config['execution']['profile']
+    if is_cancelled(run_id):
+        raise RunCancelled(run_id)
+    if app_config['execution']['isolation'] == 'process':
+        return _execute_in_process(function, arguments, kwargs, profile, run_id)
+    return _execute_inline(function, arguments, kwargs, profile)
+
+def _measure(function: Callable, arguments: list, repeats: int, kwargs: dict) -> dict:
+    """Times a function on one input and measures its peak memory, as the result of an outcome."""
+    outcome = {'error': False, 'result': None, 'diagnostics': {}, 'profile': {}}
+    try:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function(*arguments, **kwargs)
+            timings.append(time.perf_counter() - start)
+
+        with _profiling_lock:
+            tracemalloc.start()
+            try:
+                function(*arguments, **kwargs)
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        return _failure_outcome(type(e).__name__, str(e))
+    outcome['result'] = {'seconds': min(timings), 'peak_memory_bytes': peak_memory}
+    return outcome
+
+def benchmark_function(
+    function: Callable,
+    argument_sets: list,
+    repeats: int,
+    kwargs: Optional[dict] = None,
+    run_id: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Measures the run time and peak memory of a function over a set of inputs.
+
+    Each input is timed `repeats` times and the fastest run is kept, which is the
+    least noisy estimate. Peak memory is measured on a separate traced run, so
+    tracing overhead does not affect the timings. Like `execute_function`, each
+    input is measured in a sandbox process with `execution.isolation: "process"`,
+    killed on cancellation or after `execution.timeout_seconds`.
+
+    Args:
+        function: The Python callable function.
+        argument_sets: A list of positional argument lists.
+        repeats: The number of timed runs per input.
+        kwargs: The keyword arguments passed with every input.
+        run_id: The run the benchmark belongs to, for cancellation.
+
+    Returns:
+        dict: Total `seconds` and maximum `peak_memory_bytes` across the inputs,
+              {'timed_out': True} if an input hit the timeout, or None if the
+              function raises on any input.
+
+    Raises:
+        RunCancelled: If the run has been cancelled.
+    """
+    seconds, peak_memory = 0.0, 0
+    for arguments in argument_sets:
+        if is_cancelled(run_id):
+            raise RunCancelled(run_id)
+        if app_config['execution']['isolation'] == 'process':
+            outcome = _in_process(_measure, (function, arguments, repeats, kwargs or {}), run_id)
+        else:
+            outcome = _measure(function, arguments, repeats, kwargs or {})
+        if outcome.get('timed_out'):
+            return {'timed_out': True}
+        if outcome['error']:
+            return None
+        seconds += outcome['result']['seconds']
+        peak_memory = max(peak_memory, outcome['result']['peak_memory_bytes'])
+    return {'seconds': seconds, 'peak_memory_bytes': peak_memory}
+
+def format_diagnostics(diagnostics: dict) -> str:
+    """Formats execution diagnostics for an LLM prompt."""
+    if not diagnostics:
+        return 'None'
+    lines = [f"{diagnostics['error_type']}: {diagnostics['message']}"]
+    if diagnostics['failing_lineno'] is not None:
+        lines.append(
+            f"Failing line {diagnostics['failing_lineno']} in {diagnostics['failing_function']}: "
+            f"{diagnostics['failing_line']}"
+        )
+    if diagnostics['locals']:
+        lines.append('Local variables at the failure: ' + ', '.join(
+            f"{name}={value}" for name, value in diagnostics['locals'].items()
+        ))
+    lines.append('Traceback:\n' + diagnostics['traceback'])
+    return '\n'.join(lines)
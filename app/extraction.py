@@ -0,0 +1,169 @@
+import re
+import ast
+import textwrap
+from typing import List, Optional
+
+from app.slicing import find_function
+
+# --------------------
+# OUTPUT EXTRACTION
+# --------------------
+# LLM responses are not always bare code: reasoning models emit <think> blocks,
+# and models wrap code in (several) fences or add prose around it, e.g.
+#
+#   <think>The divisor can be zero...</think>
+#   Here is the fixed function:
+#   ```python
+#   def divide(a, b):
+#       ...
+#   ```
+#   This guards the division.
+#
+# The function is located by its name and delimited with `ast.parse`, so the
+# surrounding text does not reach `exec`. Top-level definitions and assignments
+# before it in the same code block (helpers, constants) are kept with it.
+
+_THINK_BLOCK = re.compile(r'<think>.*?</think>', re.DOTALL)
+_PREAMBLE = re.compile(r'^\s*(@|import\s|from\s|#|$)')
+_FENCE = re.compile(r'^\s*```')
+_KEPT_STATEMENTS = (
+    ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Assign, ast.AnnAssign,
+)
+
+
+def strip_reasoning(text: str) -> str:
+    """Removes <think> blocks. An unterminated block (still streaming) hides the rest of the text."""
+    text = _THINK_BLOCK.sub('', text)
+    start = text.find('<think>')
+    return (text if start == -1 else text[:start]).strip()
+
+def signature(function: ast.AST) -> List[str]:
+    """Returns the parameter names of a function definition, in order, with * and ** markers."""
+    args = function.args
+    return (
+        [arg.arg for arg in args.posonlyargs + args.args]
+        + ['*' + args.vararg.arg if args.vararg else '*']
+        + [arg.arg for arg in args.kwonlyargs]
+        + ['**' + args.kwarg.arg if args.kwarg else '**']
+    )
+
+def _preceding_definitions(lines: List[str], name: str) -> str:
+    """
+    Returns the top-level definitions and assignments in the lines, skipping
+    anything else (example calls, prints) and earlier definitions of the function.
+
+    Leading lines that do not parse (prose before an unfenced block) are dropped.
+    """
+    for start in range(len(lines)):
+        if lines[start][:1].isspace():
+            continue
+        code = '\n'.join(lines[start:])
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            continue
+        code_lines = code.split('\n')
+        kept = []
+        for node in tree.body:
+            if isinstance(node, _KEPT_STATEMENTS) and getattr(node, 'name', None) != name.rpartition('.')[2]:
+                first = min([node.lineno] + [decorator.lineno for decorator in getattr(node, 'decorator_list', [])])
+                kept.append('\n'.join(code_lines[first - 1:node.end_lineno]))
+        return '\n\n'.join(kept)
+    return ''
+
+def find_function_code(text: str, name: str, expected_signature: Optional[List[str]] = None, final: bool = True) -> Optional[str]:
+    """
+    Finds the complete definition of a function in an LLM response.
+
+    The definition starts at its `def` line, preceded by any imports and decorators,
+    and ends before the first line at or below its indentation (prose, a closing
+    fence or another definition) at which the code parses. The top-level
+    definitions and assignments before it in its code block are prepended.
+
+    Args:
+        text: The response, possibly still streaming.
+        name: The name of the function, or `Class.method`.
+        expected_signature: If given, only a definition with these parameters is accepted.
+        final: Whether the response is complete. While streaming, the partial last
+               line is ignored and the function must be followed by another line,
+               so that it is known to be complete.
+
+    Returns:
+        str: The code of the function, or None if no complete definition was found.
+    """
+    lines = strip_reasoning(text).split('\n')
+    if not final:
+        lines = lines[:-1]
+    definition = re.compile(rf'^(\s*)(async\s+)?def\s+{re.escape(name.rpartition(".")[2])}\s*\(')
+
+    for index, line in enumerate(lines):
+        match = definition.match(line)
+        if not match:
+            continue
+        start = index
+        while start > 0 and _PREAMBLE.match(lines[start - 1]):
+            start -= 1
+        indent = len(match.group(1))
+        block_start = start
+        while block_start > 0 and not _FENCE.match(lines[block_start - 1]):
+            block_start -= 1
+        # Only for a top-level definition: before a method come its class's lines.
+        preceding = '' if indent else _preceding_definitions(lines[block_start:start], name)
+        ends = [
+            end for end in range(index + 1, len(lines))
+            if lines[end].strip() and len(lines[end]) - len(lines[end].lstrip()) <= indent
+        ]
+        if final:
+            ends.append(len(lines))
+        for end in ends:
+            code = textwrap.dedent('\n'.join(lines[start:end])).strip()
+            try:
+                found = find_function(ast.parse(code), name)
+            except SyntaxError:
+                continue
+            if found and (expected_signature is None or signature(found[0]) == expected_signature):
+                return f"{preceding}\n\n{code}" if preceding else code
+    return None
+
+def extract_code(text: str, name: Optional[str] = None) -> str:
+    """
+    Extracts the code of a function, or of the first code block, from an LLM response.
+
+    Falls back to the response without reasoning and fences, so that invalid code
+    still fails at compilation with a meaningful error.
+    """
+    if name:
+        code = find_function_code(text, name)
+        if code:
+            return code
+    text = strip_reasoning(text)
+    blocks = re.findall(r'```[\w+-]*[ \t]*\n(.*?)```', text, re.DOTALL)
+    if blocks:
+        return blocks[0].strip()
+    return re.sub(r'```python\n|```', '', text).strip()
+
+
+class FunctionStreamParser:
+    """
+    Watches a streamed LLM response for a complete definition of a function.
+
+    Chunks are fed as they arrive; `feed` returns True once the function has been
+    produced with the expected signature, so the caller can stop the generation.
+    """
+    def __init__(self, name: str, expected_signature: Optional[List[str]] = None):
+        self.name = name
+        self.expected_signature = expected_signature
+        self.text = ''
+        self.code = None
+
+    def feed(self, chunk: str) -> bool:
+        """Adds a chunk. Returns True once a complete function has been found."""
+        self.text += chunk
+        # The definition can only complete when a new line starts.
+        if self.code is None and '\n' in chunk:
+            self.code = find_function_code(self.text, self.name, self.expected_signature, final=False)
+        return self.code is not None
+
+    def result(self) -> str:
+        """Returns the function if it was completed early, else the code extracted from the whole response."""
+        return self.code or extract_code(self.text, self.name)
@@ -1,6 +1,10 @@
 
 
+import uuid
 import inspect
+import logging
+from functools import wraps
+
 from langgraph.graph import StateGraph, END
 
 from app.nodes import (
@@ -12,69 +16,258 @@ from app.nodes import (
     memory_modification_node,
     code_update_node,
     code_patching_node,
+    fast_path_node,
+    rule_fix_node,
+    performance_validation_node,
     error_router,
+    fast_error_router,
+    fast_path_router,
+    rule_fix_router,
+    patch_router,
+    performance_router,
     memory_filter_router,
     memory_generation_router,
     memory_update_router
 )
 
 from app.model import AgentState
+from app.db import DEFAULT_NAMESPACE
+from app.cancellation import RunCancelled, is_cancelled, register_run, release_run
+from app.checkpoint import get_checkpointer, run_config, delete_checkpoints
+from app.execution import compile_source
+from app.config_loader import load_config
+
+app_config = load_config()
+logger = logging.getLogger(__name__)
 
 # --------------------
-# BUILD AND COMPILE THE GRAPH
+# CANCELLATION
 # --------------------
 
-builder = StateGraph(AgentState)
-
-
-builder.add_node('code_execution_node', code_execution_node)
-builder.add_node('bug_report_node', bug_report_node)
-builder.add_node('memory_search_node', memory_search_node)
-builder.add_node('memory_filter_node', memory_filter_node)
-builder.add_node('memory_modification_node', memory_modification_node)
-builder.add_node('memory_generation_node', memory_generation_node)
-builder.add_node('code_update_node', code_update_node)
-builder.add_node('code_patching_node', code_patching_node)
-
-
-
-builder.set_entry_point('code_execution_node')
-builder.add_conditional_edges('code_execution_node', error_router)
-builder.add_edge('bug_report_node', 'memory_search_node')
-builder.add_conditional_edges('memory_search_node', memory_filter_router)
-builder.add_conditional_edges('memory_filter_node', memory_generation_router)
-builder.add_edge('memory_generation_node', 'code_update_node')
-builder.add_conditional_edges('memory_modification_node', memory_update_router)
-
-builder.add_edge('code_update_node', 'code_patching_node')
-builder.add_edge('code_patching_node', 'code_execution_node')
-
+def _restore_functions(state: AgentState) -> None:
+    """
+    Recompiles the functions of a run resumed from a checkpoint, which are saved
+    without them (see `app.checkpoint`).
 
-agent_graph = builder.compile()
+    The patched code is used unless performance validation rejected it.
+    """
+    if state['function'] is not None:
+        return
+    state['original_function'] = compile_source(state['function_string'])[state['entry_point']]
+    state['function'] = state['original_function']
+    if state['new_function_string'] and state['performance_report'].get('verdict') != 'rejected':
+        try:
+            state['function'] = compile_source(state['new_function_string'])[state['entry_point']]
+        except Exception as e:
+            logger.warning(f"Could not recompile the patched function, resuming with the original: {e}")
+
+def _cancellable(node):
+    """
+    Wraps a node so a cancelled run skips it and a cancellation inside it stops the run.
+    Functions missing from a resumed state are recompiled first.
+    """
+    @wraps(node)
+    def wrapper(state: AgentState) -> AgentState:
+        if not is_cancelled(state['run_id']):
+            _restore_functions(state)
+            try:
+                return node(state)
+            except RunCancelled:
+                pass
+        logger.info(f"Run {state['run_id']} cancelled. Skipping {node.__name__}.")
+        state['cancelled'] = True
+        return state
+    return wrapper
+
+def _cancellable_router(router):
+    """Wraps a router so a cancelled run ends instead of following its edges."""
+    @wraps(router)
+    def wrapper(state: AgentState) -> str:
+        return END if state['cancelled'] else router(state)
+    return wrapper
 
+# --------------------
+# BUILD AND COMPILE THE GRAPH
+# --------------------
 
-def execute_self_healing_code_system(function, arguments, function_string):
+def build_agent_graph(fast_path: bool = False, checkpointer=None):
     """
-    Executes the self-healing workflow.
-    
+    Builds and compiles the self-healing workflow graph.
+
     Args:
-        function: The Python callable function.
-        arguments: The arguments for the function.
-        function_string: The string representation of the function's code.
+        fast_path: If True, the first error is handled by `fast_path_node`, which
+                   replaces the bug report, memory and fix LLM calls with a single
+                   structured call. The full graph is kept as a fallback.
+        checkpointer: Saves the state after every node, so interrupted runs can be resumed.
     """
+    builder = StateGraph(AgentState)
+
+    builder.add_node('code_execution_node', _cancellable(code_execution_node))
+    builder.add_node('rule_fix_node', _cancellable(rule_fix_node))
+    builder.add_node('bug_report_node', _cancellable(bug_report_node))
+    builder.add_node('memory_search_node', _cancellable(memory_search_node))
+    builder.add_node('memory_filter_node', _cancellable(memory_filter_node))
+    builder.add_node('memory_modification_node', _cancellable(memory_modification_node))
+    builder.add_node('memory_generation_node', _cancellable(memory_generation_node))
+    builder.add_node('code_update_node', _cancellable(code_update_node))
+    builder.add_node('code_patching_node', _cancellable(code_patching_node))
+    builder.add_node('performance_validation_node', _cancellable(performance_validation_node))
+
+    builder.set_entry_point('code_execution_node')
+    if fast_path:
+        builder.add_node('fast_path_node', _cancellable(fast_path_node))
+        builder.add_conditional_edges('code_execution_node', _cancellable_router(fast_error_router))
+        builder.add_conditional_edges('fast_path_node', _cancellable_router(fast_path_router))
+    else:
+        builder.add_conditional_edges('code_execution_node', _cancellable_router(error_router))
+    builder.add_conditional_edges('rule_fix_node', _cancellable_router(rule_fix_router))
+    # Unconditional edges are kept: on cancellation the skipped nodes pass the state
+    # through until the next router ends the run.
+    builder.add_edge('bug_report_node', 'memory_search_node')
+    builder.add_conditional_edges('memory_search_node', _cancellable_router(memory_filter_router))
+    builder.add_conditional_edges('memory_filter_node', _cancellable_router(memory_generation_router))
+    builder.add_edge('memory_generation_node', 'code_update_node')
+    builder.add_conditional_edges('memory_modification_node', _cancellable_router(memory_update_router))
+
+    builder.add_edge('code_update_node', 'code_patching_node')
+    builder.add_conditional_edges('code_patching_node', _cancellable_router(patch_router))
+    builder.add_conditional_edges('performance_validation_node', _cancellable_router(performance_router))
+
+    return builder.compile(checkpointer=checkpointer)
+
+
+agent_graph = build_agent_graph()
+fast_agent_graph = build_agent_graph(fast_path=True)
+
+# Checkpointed variants, compiled on first use in each process.
+_checkpointed_graphs = {}
+
+
+def _select_graph(fast_path: bool):
+    """Returns the graph variant to run, checkpointed if `checkpoint.enabled` is set."""
+    checkpointer = get_checkpointer()
+    if checkpointer is None:
+        return fast_agent_graph if fast_path else agent_graph
+    key = (fast_path, id(checkpointer))
+    if key not in _checkpointed_graphs:
+        _checkpointed_graphs[key] = build_agent_graph(fast_path, checkpointer)
+    return _checkpointed_graphs[key]
+
+
+def _prepare_run(
+    function, arguments, function_string, fast_path=None, namespace=DEFAULT_NAMESPACE, benchmark_arguments=None,
+    kwargs=None, run_id=None
+):
+    """Builds the initial state of a run and selects the graph variant to run it with."""
+    if fast_path is None:
+        fast_path = app_config['fast_path']['enabled']
     initial_state = AgentState(
+        run_id=run_id or uuid.uuid4().hex,
+        cancelled=False,
+        fast_path=fast_path,
         error=False,
         function=function,
+        original_function=function,
+        entry_point=function.__name__,
         function_string=function_string,  # Use the provided string directly
+        target_function=function.__name__,
         arguments=arguments,
+        kwargs=kwargs or {},
         error_description='',
+        error_diagnostics={},
+        execution_profile={},
         new_function_string='',
         bug_report='',
         memory_search_results=[],
-        memory_ids_to_update=[]
+        memory_ids_to_update=[],
+        fast_path_attempted=False,
+        rule_fix='',
+        memory_ids_for_fix=[],
+        repair_attempts=0,
+        namespace=namespace,
+        benchmark_arguments=benchmark_arguments or [],
+        performance_report={}
     )
+    return _select_graph(fast_path), initial_state
+
+
+def execute_self_healing_code_system(function, arguments, function_string, **options):
+    """
+    Executes the self-healing workflow.
     
-    return agent_graph.invoke(initial_state)
+    Args:
+        function: The Python callable function (the entry point, for modules).
+        arguments: The positional arguments for the function.
+        function_string: The string representation of the function's code, or of a
+                         whole module. Only the function that fails is patched.
+        fast_path: Whether to try the single-call fast path first. Defaults to
+                   the `fast_path.enabled` setting in the config.
+        namespace: The tenant whose memories are searched and updated.
+        benchmark_arguments: Inputs the original function handles, used to reject
+                             patches that are much slower (see `performance` in the config).
+        kwargs: The keyword arguments for the function.
+        run_id: The ID under which the run can be cancelled (see `app.cancellation`).
+                Generated if not given.
+    """
+    graph, initial_state = _prepare_run(function, arguments, function_string, **options)
+    run_id = initial_state['run_id']
+    register_run(run_id)
+    try:
+        final_state = graph.invoke(initial_state, run_config(run_id))
+    finally:
+        release_run(run_id)
+    delete_checkpoints(run_id)
+    return final_state
+
+
+def stream_self_healing_code_system(function, arguments, function_string, **options):
+    """
+    Executes the self-healing workflow, yielding progress after every node.
+
+    Takes the same arguments as `execute_self_healing_code_system`.
+
+    Yields:
+        tuple: The name of the node that just completed and the state after it.
+    """
+    graph, initial_state = _prepare_run(function, arguments, function_string, **options)
+    run_id = initial_state['run_id']
+    register_run(run_id)
+    try:
+        for update in graph.stream(initial_state, run_config(run_id), stream_mode="updates"):
+            for node_name, state in update.items():
+                yield node_name, state
+    finally:
+        release_run(run_id)
+    delete_checkpoints(run_id)
+
+
+def resume_self_healing_code_system(run_id):
+    """
+    Resumes an interrupted run from its last checkpoint (see `checkpoint` in the config).
+
+    Nodes that completed before the interruption, with their LLM calls, are not run again.
+
+    Returns:
+        dict: The final state of the run, or None if no unfinished run with this ID is checkpointed.
+
+    Raises:
+        RuntimeError: If checkpointing is disabled.
+    """
+    if get_checkpointer() is None:
+        raise RuntimeError("Checkpointing is disabled (see `checkpoint` in the config).")
+    config = run_config(run_id)
+    saved_state = _select_graph(False).get_state(config).values
+    if not saved_state:
+        return None
+
+    logger.info(f"Resuming run {run_id}.")
+    register_run(run_id)
+    try:
+        final_state = _select_graph(saved_state['fast_path']).invoke(None, config)
+    finally:
+        release_run(run_id)
+    delete_checkpoints(run_id)
+    return final_state
 
 if __name__ == '__main__':
     # You can use this block for local testing
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import difflib
+import argparse
+
+from app.runner import send
+
+# --------------------
+# HEALING CLI
+# --------------------
+# Thin client of the warm runner (see `app.runner`): it only uses the standard
+# library, so an invocation costs milliseconds plus the run itself.
+#
+#   python -m app.heal path/to/calc.py::divide --args '[1, 0]' --write
+#
+# The whole file is sent, so the function may call other code in it, and runs
+# as the module it is in its project, so its sibling and relative imports work
+# (the runner must be able to read the project). Progress
+# goes to stderr and the fix to stdout as a unified diff; --write applies it.
+# The exit status is 0 if the call succeeds (after healing, if needed), 1 if it
+# could not be healed and 2 if no runner is listening.
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Heal a failing function with the warm runner.")
+    parser.add_argument('target', help="FILE.py::FUNCTION, or FILE.py to call its first function.")
+    parser.add_argument('--args', default='[]', help="Positional arguments, as a JSON list.")
+    parser.add_argument('--kwargs', default='{}', help="Keyword arguments, as a JSON object.")
+    parser.add_argument('--fast-path', action='store_true', help="Try the single-call fast path first.")
+    parser.add_argument('--namespace', default='default', help="Tenant whose memories are used.")
+    parser.add_argument('--write', action='store_true', help="Write the fix to the file.")
+    parser.add_argument('--socket', help="Unix socket of the runner.")
+    args = parser.parse_args(argv)
+
+    path, _, function = args.target.partition('::')
+    try:
+        with open(path, encoding='utf-8') as file:
+            source = file.read()
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Cannot read {path}: {e}", file=sys.stderr)
+        return 1
+    try:
+        arguments, kwargs = json.loads(args.args), json.loads(args.kwargs)
+    except ValueError as e:
+        print(f"--args and --kwargs must be JSON: {e}", file=sys.stderr)
+        return 1
+    payload = {
+        'function_string': source,
+        'entry_point': function or None,
+        'arguments': arguments,
+        'kwargs': kwargs,
+        'fast_path': args.fast_path or None,
+        'namespace': args.namespace,
+        # So that the file's imports of its project resolve in the runner.
+        'path': os.path.abspath(path),
+    }
+
+    final_state = None
+    try:
+        for line in send(payload, args.socket):
+            if 'run_id' in line:
+                print(f"Run {line['run_id']}", file=sys.stderr)
+            elif 'node' in line:
+                print(f"  {line['node']} (repair attempts: {line['repair_attempts']})", file=sys.stderr)
+            elif 'error' in line:
+                print(line['error'], file=sys.stderr)
+                return 1
+            elif 'final_state' in line:
+                final_state = line['final_state']
+    except ConnectionError as e:
+        print(e, file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        # Closing the connection cancels the run.
+        return 130
+
+    if final_state is None:
+        print("The runner closed the connection before the run finished.", file=sys.stderr)
+        return 1
+    if final_state['error'] or final_state['cancelled']:
+        print(f"Not healed: {final_state['error_description']}", file=sys.stderr)
+        return 1
+
+    fixed = final_state['function_string']
+    if source.endswith('\n') and not fixed.endswith('\n'):
+        fixed += '\n'
+    if fixed == source:
+        print("The function ran without error.", file=sys.stderr)
+        return 0
+    sys.stdout.writelines(difflib.unified_diff(
+        source.splitlines(keepends=True), fixed.splitlines(keepends=True), fromfile=f"a/{path}", tofile=f"b/{path}",
+    ))
+    if final_state.get('rule_fix'):
+        print(f"Fixed by rule '{final_state['rule_fix']}'.", file=sys.stderr)
+    if args.write:
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(fixed)
+        print(f"Wrote the fix to {path}.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import TypedDict, List, Any, Callable, Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import TypedDict, Dict, List, Any, Callable, Optional
+
+from app.serialization import decode_value
 
 # --------------------
 # Agent Workflow Models
@@ -8,9 +10,36 @@ from typing import TypedDict, List, Any, Callable, Optional
 class CodePayload(BaseModel):
     """
     Pydantic model for validating the incoming request body.
+
+    Argument values may be tagged objects (see `app.serialization`), which are
+    decoded into datetimes, bytes, sets, tuples, decimals or arrays.
     """
     function_string: str
-    arguments: List[Any]
+    arguments: List[Any] = []
+    kwargs: Dict[str, Any] = {}
+    # Function to call when `function_string` is a module. Defaults to the first function defined.
+    entry_point: Optional[str] = None
+    fast_path: Optional[bool] = None
+    # Tenant whose memories are searched and updated. Each namespace has its own collection.
+    namespace: str = Field(default="default", pattern=r"^[a-zA-Z0-9][a-zA-Z0-9_-]{0,39}$")
+    # Inputs the original function handles, used to check patches for performance regressions.
+    benchmark_arguments: Optional[List[List[Any]]] = None
+    # ID under which the run can be cancelled with DELETE /runs/{run_id}. Generated if not given.
+    run_id: Optional[str] = Field(default=None, pattern=r"^[a-zA-Z0-9_-]{1,64}$")
+
+    @field_validator('arguments', 'kwargs', 'benchmark_arguments')
+    @classmethod
+    def _decode_typed_values(cls, value):
+        return decode_value(value)
+
+class FastPathResponse(BaseModel):
+    """
+    Pydantic model for validating the structured output of the fast path,
+    which asks the LLM for the bug report, archive summary and fix at once.
+    """
+    bug_report: str
+    archive_summary: str
+    new_function_string: str
 
 class AgentState(TypedDict):
     """
@@ -20,11 +49,27 @@ class AgentState(TypedDict):
     Using a TypedDict provides a clear and type-safe way to manage state.
     """
     function: Callable
+    original_function: Callable
     function_string: str
+    target_function: str
     arguments: list
+    kwargs: dict
     error: bool
     error_description: str
+    error_diagnostics: dict
+    execution_profile: dict
     new_function_string: str
     bug_report: str
     memory_search_results: List[dict]
     memory_ids_to_update: List[str]
+    fast_path_attempted: bool
+    memory_ids_for_fix: List[str]
+    repair_attempts: int
+    namespace: str
+    benchmark_arguments: List[list]
+    performance_report: dict
+    run_id: str
+    cancelled: bool
+    fast_path: bool
+    entry_point: str
+    rule_fix: str
@@ -8,6 +8,7 @@ from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmb
 
 from app.settings_loader import settings
 from app.config_loader import load_config
+from app.replay import attach_llm, wrap_embeddings
 
 
 class ModelLoader:
@@ -33,15 +34,21 @@ class ModelLoader:
         try:
             target_provider = provider or self.app_config["llm"]["default_provider"]
             model_name = self.app_config["llm"]["providers"][target_provider]["model_name"]
+            request_options = {
+                "timeout": self.app_config["llm"]["request_timeout"],
+                "max_retries": self.app_config["llm"]["max_retries"],
+            }
             
             if target_provider == "openai":
-                return ChatOpenAI(model=model_name)
+                model = ChatOpenAI(model=model_name, **request_options)
             elif target_provider == "google":
-                return ChatGoogleGenerativeAI(model=model_name)
+                model = ChatGoogleGenerativeAI(model=model_name, **request_options)
             elif target_provider == "groq":
-                return ChatGroq(model_name=model_name)
+                model = ChatGroq(model_name=model_name, **request_options)
             else:
                 raise ValueError(f"Unknown LLM provider: {target_provider}")
+            # Records or replays responses, depending on `replay.mode`.
+            return attach_llm(model, f"{target_provider}:{model_name}")
         except Exception as e:
             print(f"❌ Failed to load LLM model for provider '{provider}': {e}")
             return None
@@ -57,11 +64,12 @@ class ModelLoader:
             model_name = self.app_config["embedding_model"]["providers"][target_provider]["model_name"]
 
             if target_provider == "google":
-                return GoogleGenerativeAIEmbeddings(model=model_name)
+                embeddings = GoogleGenerativeAIEmbeddings(model=model_name)
             elif target_provider == "openai":
-                return OpenAIEmbeddings(model=model_name)
+                embeddings = OpenAIEmbeddings(model=model_name)
             else:
                 raise ValueError(f"Unknown embedding provider: {target_provider}")
+            return wrap_embeddings(embeddings, f"{target_provider}:{model_name}")
         except Exception as e:
             print(f"❌ Failed to load embedding model for provider '{provider}': {e}")
             return None
@@ -73,7 +81,7 @@ class ModelLoader:
         """
         try:
             model_name = self.app_config["safeguard"]["groq"]["model_name"]
-            return ChatGroq(model_name=model_name)
+            return attach_llm(ChatGroq(model_name=model_name), f"groq:{model_name}")
         except Exception as e:
             print(f"❌ Failed to load safeguard model: {e}")
             return None
@@ -1,7 +1,8 @@
 import uuid
 import inspect
 import logging
-import re
+import ast
+import textwrap
 from typing import TypedDict
 
 from langchain_core.prompts import ChatPromptTemplate
@@ -9,8 +10,16 @@ from langchain_core.messages import HumanMessage
 from langgraph.graph import END
 from langchain_core.documents import Document
 
-from app.model import AgentState
-from app.db import VectorDB
+from pydantic import ValidationError
+
+from app.model import AgentState, FastPathResponse
+from app.slicing import find_function, slice_for_function, replace_function
+from app.patching import number_lines, apply_line_edits, validate_patched_function
+from app.cancellation import RunCancelled, call_cancellable, is_cancelled
+from app.rules import find_rule_fix, record_rule_fix
+from app.extraction import FunctionStreamParser, extract_code, signature, strip_reasoning
+from app.execution import compile_source, execute_function, format_diagnostics, benchmark_function, source_line_offset
+from app.db import VectorDB, embedding_model_id
 from app.model_loader import ModelLoader
 from app.settings_loader import settings
 from app.config_loader import load_config
@@ -18,22 +27,190 @@ from app.config_loader import load_config
 app_config = load_config()
 model_loader = ModelLoader()
 llm = model_loader.load_llm()
-embedding_model = model_loader.load_embedding(provider='openai')
+embedding_provider = app_config['embedding_model']['default_provider']
+embedding_model = model_loader.load_embedding(provider=embedding_provider)
+# Distances depend on the embedding model, so retrieval is tuned per provider.
+retrieval_config = app_config['retrieval']['providers'][embedding_provider]
 
 
 if embedding_model:
-    db_client = VectorDB(embedding_function=embedding_model)
+    db_client = VectorDB(
+        embedding_function=embedding_model,
+        server_host=settings.CHROMA_SERVER_HOST,
+        server_port=settings.CHROMA_SERVER_PORT,
+        dedup_distance=retrieval_config['dedup_distance'],
+        **app_config['vector_db'],
+    )
 else:
     db_client = None
     logging.error("Embedding model not loaded, vector database will not be available.")
 
 collection = db_client.get_collection() if db_client else None
 
+# Whether this process has seeded the store (or left it to another process).
+# Forked workers inherit it from the gunicorn master.
+memory_seeded = False
+
+
+def seed_memory_store() -> int:
+    """
+    Imports the seed pack of common Python errors into a fresh (empty) store, once per process.
+
+    Servers call this at startup (main.py, gunicorn.conf.py, the runner) rather
+    than at import, so that CLIs, benchmarks and forked workers make no
+    embedding calls before serving.
+
+    Returns:
+        int: The number of imported memories.
+    """
+    global memory_seeded
+    if memory_seeded or not collection or not app_config['memory']['seed_pack']:
+        return 0
+    memory_seeded = True
+    try:
+        return db_client.seed(app_config['memory']['seed_pack'], embedding_model_id(app_config))
+    except Exception as e:
+        logging.error(f"Failed to import the memory seed pack: {e}")
+        return 0
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# --------------------
+# HELPER FUNCTIONS
+# --------------------
+
+def _format_memories(memories: list) -> str:
+    """
+    Formats retrieved memories for a fix prompt, most relevant first.
+
+    At most `memory.prompt_top_k` memories are included and the text is cut off
+    once `memory.prompt_token_budget` (estimated at ~4 characters per token) is
+    spent, so less relevant memories are the ones truncated.
+    """
+    budget = app_config['memory']['prompt_token_budget'] * 4
+    top_k = app_config['memory']['prompt_top_k']
+    entries = []
+    for memory in sorted(memories, key=lambda m: m['distance'])[:top_k]:
+        entry = f"- (distance {memory['distance']:.3f}) {memory['memory']}"
+        if memory.get('fix'):
+            entry += f"\n  Known fix:\n{memory['fix']}"
+        if len(entry) > budget:
+            entry = entry[:budget]
+        entries.append(entry)
+        budget -= len(entry)
+        if budget <= 0:
+            break
+    return '\n'.join(entries) or 'None'
+
+def _cut_at_gap(memories: list) -> list:
+    """
+    Returns the memories, closest first, up to the first large distance gap.
+
+    Used in adaptive retrieval mode: memories past a jump of more than
+    `retrieval.min_gap` in distance are unlikely to describe the same bug.
+    """
+    memories = sorted(memories, key=lambda m: m['distance'])
+    for i in range(1, len(memories)):
+        if memories[i]['distance'] - memories[i - 1]['distance'] > app_config['retrieval']['min_gap']:
+            return memories[:i]
+    return memories
+
+def select_memories_to_update(memories: list) -> list:
+    """
+    Selects the IDs of retrieved memories that describe the current bug.
+
+    Memories must be within the provider's distance threshold. In adaptive mode
+    the selection also stops at the first large distance gap. Memories are
+    selected closest first, at most `retrieval.max_updates` if it is set.
+    """
+    if app_config['retrieval']['adaptive']:
+        memories = _cut_at_gap(memories)
+    selected = [
+        memory['id']
+        for memory in sorted(memories, key=lambda m: m['distance'])
+        if memory['distance'] < retrieval_config['distance_threshold']
+    ]
+    return selected[:app_config['retrieval']['max_updates']]
+
+def _invoke_llm(state: AgentState, message: HumanMessage) -> str:
+    """
+    Sends a prompt to the LLM, giving up on it if the run is cancelled meanwhile.
+    Reasoning (<think>) blocks are removed from the response.
+    """
+    return strip_reasoning(call_cancellable(lambda: llm.invoke([message]), state['run_id']).content)
+
+def _stream_function(state: AgentState, message: HumanMessage) -> str:
+    """
+    Streams a function definition from the LLM and extracts it from the response.
+
+    The generation is stopped as soon as the failing function has been produced
+    completely with its original parameters, so trailing explanations are not paid for.
+    """
+    function_source, _ = slice_for_function(state['function_string'], state['target_function'])
+    try:
+        found = find_function(ast.parse(textwrap.dedent(function_source)), state['target_function'])
+    except SyntaxError:
+        found = None
+    parser = FunctionStreamParser(state['target_function'], signature(found[0]) if found else None)
+
+    def generate() -> str:
+        stream = llm.stream([message])
+        try:
+            for chunk in stream:
+                if is_cancelled(state['run_id']):
+                    break
+                if parser.feed(chunk.content):
+                    logger.info("Function complete, stopping the generation early.")
+                    break
+        finally:
+            stream.close()
+        return parser.result()
+
+    return call_cancellable(generate, state['run_id'])
+
+def _prompt_code(state: AgentState) -> str:
+    """
+    Returns the code to show the LLM: the failing function, plus only the module
+    code it depends on when a whole module was submitted.
+    """
+    function_source, context = slice_for_function(state['function_string'], state['target_function'])
+    if not context:
+        return function_source
+    return f"{function_source}\nCode the function depends on (do not modify or repeat it):\n{context}"
+
+def _current_code(state: AgentState) -> str:
+    """Returns the submitted code with the fixes of earlier attempts, if they parse."""
+    base = state['new_function_string'] or state['function_string']
+    try:
+        ast.parse(base)
+    except SyntaxError:
+        base = state['function_string']
+    return base
+
+def _splice_fix(state: AgentState, fixed_function: str) -> str:
+    """
+    Replaces the failing function in the submitted code with its fixed version.
+
+    Fixes of other functions from earlier attempts are kept, so a module with
+    several bugs converges instead of reintroducing them.
+    """
+    return replace_function(_current_code(state), state['target_function'], extract_code(fixed_function, state['target_function']))
+
+def _store_fix(state: AgentState) -> None:
+    """Records a successful fix in the metadata of the memories describing the bug."""
+    memory_ids = state['memory_ids_for_fix']
+    if not collection or not memory_ids:
+        return
+    try:
+        fix, _ = slice_for_function(state['new_function_string'], state['target_function'])
+        db_client.set_metadata(list(dict.fromkeys(memory_ids)), state['namespace'], fix=fix)
+        logger.info(f"Stored fix for memories: {memory_ids}")
+    except Exception as e:
+        logger.error(f"Failed to store fix in memory: {e}")
+
 # --------------------
 # NODE FUNCTIONS
 # --------------------
@@ -41,15 +218,59 @@ logger = logging.getLogger(__name__)
 def code_execution_node(state: AgentState) -> AgentState:
     """Executes the user-provided function and updates the state."""
     logger.info("Executing arbitrary function.")
-    try:
-        result = state['function'](*state['arguments'])
-        logger.info(f"Function ran without error. Result: {result}")
-        state['error'] = False
+    outcome = execute_function(state['function'], state['arguments'], state['kwargs'], run_id=state['run_id'])
+    state['error'] = outcome['error']
+    state['error_diagnostics'] = outcome['diagnostics']
+    state['execution_profile'] = outcome['profile']
+    if outcome['error']:
+        diagnostics = outcome['diagnostics']
+        state['error_description'] = f"{diagnostics['error_type']}: {diagnostics['message']}"
+        logger.error(f"Function raised an error: {state['error_description']}")
+        # Heal the function whose frame failed, if it is defined in the submitted code.
+        failing_function = diagnostics['failing_function']
+        try:
+            defined = failing_function and find_function(ast.parse(state['function_string']), failing_function)
+        except SyntaxError:
+            defined = None
+        state['target_function'] = failing_function if defined else state['function'].__name__
+    else:
+        logger.info(f"Function ran without error. Result: {outcome['result']}")
         state['error_description'] = ''
+    return state
+
+def rule_fix_node(state: AgentState) -> AgentState:
+    """
+    Tries a deterministic fix for common errors before any LLM call (see `app.rules`).
+
+    The fix is kept only if the function then runs without error on the failing
+    arguments; otherwise `rule_fix` stays empty and the router takes the LLM path.
+    """
+    state['rule_fix'] = ''
+    fix = find_rule_fix(
+        _current_code(state), state['target_function'], state['error_diagnostics'],
+        line_offset=source_line_offset(state['function']),
+    )
+    if fix is None:
+        record_rule_fix(None, False)
+        return state
+
+    rule, patched = fix
+    try:
+        function = compile_source(patched)[state['entry_point']]
+        validated = not execute_function(function, state['arguments'], state['kwargs'], profile=False, run_id=state['run_id'])['error']
+    except RunCancelled:
+        raise
     except Exception as e:
-        logger.error(f"Function raised an error: {e}")
-        state['error'] = True
-        state['error_description'] = str(e)
+        logger.warning(f"Rule '{rule}' produced code that could not be loaded: {e}")
+        validated = False
+    record_rule_fix(rule, validated)
+
+    if validated:
+        logger.info(f"Fixed by rule '{rule}' without an LLM call.")
+        state['rule_fix'] = rule
+        state['new_function_string'] = patched
+    else:
+        logger.info(f"The fix of rule '{rule}' did not pass. Falling back to the LLM.")
     return state
 
 def bug_report_node(state: AgentState) -> AgentState:
@@ -59,13 +280,15 @@ def bug_report_node(state: AgentState) -> AgentState:
         'You are tasked with generating a bug report for a Python function that raised an error.'
         'Function: {function_string}'
         'Error: {error_description}'
+        'Execution diagnostics: {diagnostics}'
         'Your response must be a comprehensive string including only crucial information on the bug report'
     )
     message = HumanMessage(content=prompt.format(
-        function_string=state['function_string'], 
-        error_description=state['error_description']
+        function_string=_prompt_code(state), 
+        error_description=state['error_description'],
+        diagnostics=format_diagnostics(state['error_diagnostics']),
     ))
-    bug_report = llm.invoke([message]).content.strip()
+    bug_report = _invoke_llm(state, message)
     logger.info(f"Generated bug report: {bug_report}")
     state['bug_report'] = bug_report
     return state
@@ -85,10 +308,10 @@ def memory_search_node(state: AgentState) -> AgentState:
         'Format: # function_name ## error_description ### error_analysis'
     )
     message = HumanMessage(content=prompt.format(bug_report=state['bug_report']))
-    response = llm.invoke([message]).content.strip()
+    response = _invoke_llm(state, message)
     
     try:
-        results = collection.similarity_search_with_score(query=response, k=10)
+        results = db_client.search(query=response, k=retrieval_config['k'], namespace=state['namespace'])
     except Exception as e:
         logger.error(f"ChromaDB query failed: {e}")
         results = []
@@ -96,9 +319,16 @@ def memory_search_node(state: AgentState) -> AgentState:
     if results:
         logger.info(f"Found {len(results)} similar bug reports.")
         state['memory_search_results'] = [
-            {'id': doc.metadata.get('id', str(uuid.uuid4())), 'memory': doc.page_content, 'distance': score} 
+            {
+                'id': doc.metadata.get('id', str(uuid.uuid4())),
+                'memory': doc.page_content,
+                'fix': doc.metadata.get('fix'),
+                'distance': score,
+            }
             for doc, score in results
         ]
+        if app_config['retrieval']['adaptive']:
+            state['memory_search_results'] = _cut_at_gap(state['memory_search_results'])
     else:
         logger.info("No similar bug reports found.")
         state['memory_search_results'] = []
@@ -108,10 +338,7 @@ def memory_search_node(state: AgentState) -> AgentState:
 def memory_filter_node(state: AgentState) -> AgentState:
     """Filters the search results based on a distance threshold."""
     logger.info("Filtering bug reports.")
-    state['memory_ids_to_update'] = []
-    for memory in state['memory_search_results']:
-        if memory['distance'] < 0.3:
-            state['memory_ids_to_update'].append(memory['id'])
+    state['memory_ids_to_update'] = select_memories_to_update(state['memory_search_results'])
     
     logger.info(f"Selected {len(state['memory_ids_to_update'])} bug reports for modification.")
     return state
@@ -130,11 +357,10 @@ def memory_generation_node(state: AgentState) -> AgentState:
         'Format: # function_name ## error_description ### error_analysis'
     )
     message = HumanMessage(content=prompt.format(bug_report=state['bug_report']))
-    response = llm.invoke([message]).content.strip()
+    response = _invoke_llm(state, message)
     
-    new_id = str(uuid.uuid4())
-    doc = Document(page_content=response, metadata={"id": new_id})
-    collection.add_documents(documents=[doc], ids=[new_id])
+    new_id = db_client.add_memory(response, namespace=state['namespace'])
+    state['memory_ids_for_fix'].append(new_id)
     logger.info(f"Saved new bug report to memory with ID: {new_id}")
     return state
 
@@ -150,13 +376,14 @@ def memory_modification_node(state: AgentState) -> AgentState:
         'Current Bug Report: {bug_report}'
         'Prior Bug Report: {memory_to_update}'
         'Your response must be a concise but cumulative string including only crucial information on the current and prior bug reports for future reference.'
+        'Your response must not exceed {max_chars} characters.'
         'Format: # function_name ## error_description ### error_analysis'
     )
     memory_to_update_id = state['memory_ids_to_update'].pop(0)
-    results = collection.get(ids=[memory_to_update_id])
+    memory = db_client.get_memory(memory_to_update_id, namespace=state['namespace'])
 
-    if results['documents']:
-        memory_to_update = results['documents'][0]
+    if memory:
+        memory_to_update = memory[0]
     else:
         logger.warning(f"Could not retrieve document with ID {memory_to_update_id}. Skipping modification.")
         return state
@@ -164,21 +391,23 @@ def memory_modification_node(state: AgentState) -> AgentState:
     message = HumanMessage(content=prompt.format(
         bug_report=state['bug_report'],
         memory_to_update=memory_to_update,
+        max_chars=db_client.max_document_chars,
     ))
-    response = llm.invoke([message]).content.strip()
+    response = _invoke_llm(state, message)
     
-    updated_doc = Document(page_content=response, metadata={"id": memory_to_update_id})
-    collection.update_documents(ids=[memory_to_update_id], documents=[updated_doc])
+    db_client.update_memory(memory_to_update_id, response, namespace=state['namespace'])
+    state['memory_ids_for_fix'].append(memory_to_update_id)
     logger.info(f"Updated memory with ID: {memory_to_update_id}")
     return state
 
-def code_update_node(state: AgentState) -> AgentState:
-    """Generates a proposed bug fix using the LLM."""
-    logger.info("Generating proposed bug fix.")
+def _generate_full_fix(state: AgentState) -> str:
+    """Asks the LLM to regenerate the whole function with the fix applied."""
     prompt = ChatPromptTemplate.from_template(
         'You are tasked with fixing a Python function that raised an error.'
         'Function: {function_string}'
         'Error: {error_description}' 
+        'Similar past bug reports and their fixes, most relevant first: {memories}'
+        'Performance feedback on previous fixes: {performance_feedback}'
         'You must provide a fix for the present error only.'
         'The bug fix should handle the thrown error case gracefully by returning an error message.'
         'Do not raise an error in your bug fix.'
@@ -187,29 +416,167 @@ def code_update_node(state: AgentState) -> AgentState:
         'Your response must not contain any additional formatting, such as code delimiters or language declarations.'
     )
     message = HumanMessage(content=prompt.format(
-        function_string=state['function_string'], 
-        error_description=state['error_description']
+        function_string=_prompt_code(state), 
+        error_description=state['error_description'],
+        memories=_format_memories(state['memory_search_results']),
+        performance_feedback=state['performance_report'].get('feedback', 'None'),
+    ))
+    # Streamed calls bypass the record/replay cache, so they are only used without it.
+    if app_config['patching']['stream'] and not llm.cache:
+        return _stream_function(state, message)
+    return _invoke_llm(state, message)
+
+def _generate_diff_fix(state: AgentState) -> str:
+    """
+    Asks the LLM for line-range replacements only and applies them to the function.
+
+    Raises:
+        ValueError: If the edits cannot be applied or the result is not a valid
+                    replacement of the function.
+    """
+    prompt = ChatPromptTemplate.from_template(
+        'You are tasked with fixing a Python function that raised an error.'
+        'Function, with line numbers: \n{numbered_function}\n'
+        'Code the function depends on (do not modify it): {context}'
+        'Error: {error_description}'
+        'Similar past bug reports and their fixes, most relevant first: {memories}'
+        'Performance feedback on previous fixes: {performance_feedback}'
+        'You must provide a fix for the present error only.'
+        'The bug fix should handle the thrown error case gracefully by returning an error message.'
+        'Do not raise an error in your bug fix.'
+        'Do not change the function name or parameters.'
+        'Respond only with the minimal line-range replacements, each as a header line "@@ start-end" '
+        '(1-based, inclusive, referring to the numbers above) followed by the replacement lines '
+        'with their full indentation and without line numbers. Use "@@ n-(n-1)" to insert before line n.'
+        'Do not repeat unchanged lines and do not add any other text.'
+    )
+    function_source, context = slice_for_function(state['function_string'], state['target_function'])
+    message = HumanMessage(content=prompt.format(
+        numbered_function=number_lines(function_source),
+        context=context or 'None',
+        error_description=state['error_description'],
+        memories=_format_memories(state['memory_search_results']),
+        performance_feedback=state['performance_report'].get('feedback', 'None'),
     ))
-    new_function_string = llm.invoke([message]).content.strip()
+    edits = _invoke_llm(state, message)
+    patched = apply_line_edits(function_source, edits)
+    validate_patched_function(function_source, patched, state['target_function'])
+    return patched
+
+def code_update_node(state: AgentState) -> AgentState:
+    """
+    Generates a proposed bug fix using the LLM.
+
+    Only the failing function is fixed and spliced back into the submitted code.
+    In `diff` patching mode, functions of at least `patching.diff_min_lines` lines
+    are fixed with line-range replacements, which keeps output tokens small. The
+    whole function is regenerated if the edits cannot be applied.
+    """
+    logger.info(f"Generating proposed bug fix for '{state['target_function']}'.")
+    config = app_config['patching']
+    function_source, _ = slice_for_function(state['function_string'], state['target_function'])
+    new_function_string = None
+    if config['mode'] == 'diff' and len(function_source.splitlines()) >= config['diff_min_lines']:
+        try:
+            new_function_string = _generate_diff_fix(state)
+        except ValueError as e:
+            logger.warning(f"Line-range patch could not be applied, regenerating the whole function: {e}")
+    if new_function_string is None:
+        new_function_string = _generate_full_fix(state)
     
     logger.info(f"Proposed bug fix: {new_function_string}")
-    state['new_function_string'] = new_function_string
+    state['new_function_string'] = _splice_fix(state, new_function_string)
+    return state
+
+def fast_path_node(state: AgentState) -> AgentState:
+    """
+    Produces the bug report, archive summary and fix with a single structured LLM call.
+
+    Similar memories are retrieved with the raw error as the query so that no
+    summarization round-trip is needed. When the response cannot be validated
+    against `FastPathResponse`, `new_function_string` is left empty and the
+    router falls back to the full graph.
+    """
+    logger.info("Running fast path (single structured LLM call).")
+    state['fast_path_attempted'] = True
+    state['new_function_string'] = ''
+
+    func_name = state['target_function']
+    memories = []
+    if collection:
+        try:
+            results = db_client.search(
+                query=f"# {func_name} ## {state['error_description']}",
+                k=app_config['fast_path']['memory_k'],
+                namespace=state['namespace'],
+            )
+            memories = [
+                {'id': doc.metadata.get('id'), 'memory': doc.page_content, 'fix': doc.metadata.get('fix'), 'distance': score}
+                for doc, score in results
+            ]
+        except Exception as e:
+            logger.error(f"ChromaDB query failed: {e}")
+
+    prompt = ChatPromptTemplate.from_template(
+        'You are tasked with analysing and fixing a Python function that raised an error.'
+        'Function: {function_string}'
+        'Error: {error_description}'
+        'Execution diagnostics: {diagnostics}'
+        'Similar past bug reports: {memories}'
+        'Respond with a single JSON object and nothing else, with exactly these string keys:'
+        '"bug_report": a comprehensive bug report including only crucial information,'
+        '"archive_summary": a concise summary for future reference in the format # function_name ## error_description ### error_analysis,'
+        '"new_function_string": the fixed function definition.'
+        'The fix must handle the thrown error case gracefully by returning an error message and must not raise an error.'
+        'The function must use the exact same name and parameters.'
+    )
+    message = HumanMessage(content=prompt.format(
+        function_string=_prompt_code(state),
+        error_description=state['error_description'],
+        diagnostics=format_diagnostics(state['error_diagnostics']),
+        memories=_format_memories(memories),
+    ))
+    content = _invoke_llm(state, message)
+
+    try:
+        start, end = content.find('{'), content.rfind('}')
+        if start == -1 or end < start:
+            raise ValueError("No JSON object found in the response.")
+        response = FastPathResponse.model_validate_json(content[start:end + 1])
+    except (ValidationError, ValueError) as e:
+        logger.warning(f"Fast path response could not be parsed, falling back to full graph: {e}")
+        return state
+
+    state['bug_report'] = response.bug_report
+    state['new_function_string'] = _splice_fix(state, response.new_function_string)
+    logger.info(f"Fast path proposed bug fix: {response.new_function_string}")
+
+    # Only archive the bug when no close memory exists, since merging would
+    # cost another LLM call. The closest memory receives the fix instead.
+    close_ids = select_memories_to_update([memory for memory in memories if memory['id']])
+    if close_ids:
+        state['memory_ids_for_fix'].append(close_ids[0])
+    elif collection:
+        new_id = db_client.add_memory(response.archive_summary, namespace=state['namespace'])
+        state['memory_ids_for_fix'].append(new_id)
+        logger.info(f"Saved new bug report to memory with ID: {new_id}")
     return state
 
 def code_patching_node(state: AgentState) -> AgentState:
     """Applies the proposed fix and tests the patched function."""
     logger.info("Applying code patch.")
+    state['repair_attempts'] += 1
     try:
         # print("---------------- STATE IN PATCHING -------------------")
         # for key, value in state.items():
         #     print(f"Key: {key}, Value: {value}")
         # print("-----------------------------------")
         
-        # Remove Markdown code fences from the LLM's response
-        new_code = re.sub(r'```python\n|```', '', state['new_function_string']).strip()
+        # Remove reasoning, prose and Markdown code fences from the LLM's response
+        new_code = extract_code(state['new_function_string'])
+        state['new_function_string'] = new_code
         
-        namespace = {}
-        exec(new_code, namespace)
+        namespace = compile_source(new_code)
         
         func_name = state['function'].__name__
         new_function = namespace[func_name]
@@ -218,20 +585,133 @@ def code_patching_node(state: AgentState) -> AgentState:
         state['error'] = False
         
         # Test the patched function with the original arguments
-        result = state['function'](*state['arguments'])
-        logger.info(f"Patch successful. Test run result: {result}")
+        outcome = execute_function(state['function'], state['arguments'], state['kwargs'], run_id=state['run_id'])
+        if outcome['error']:
+            raise RuntimeError(format_diagnostics(outcome['diagnostics']))
+        logger.info(f"Patch successful. Test run result: {outcome['result']}")
+        if not app_config['performance']['enabled']:
+            _store_fix(state)
+    except RunCancelled:
+        raise
     except Exception as e:
         logger.error(f"Patch failed: {e}")
         state['error'] = True
     return state
 
+def performance_validation_node(state: AgentState) -> AgentState:
+    """
+    Compares the patched function with the original on inputs the original handles.
+
+    Patches slower than `performance.max_slowdown` times the original, or using more
+    than `performance.max_memory_growth` times its peak memory, are rejected (the
+    original function is restored and a new fix is generated with the feedback,
+    without a new bug report or memory) or flagged, depending on
+    `performance.action`. The numbers are kept in `performance_report`.
+    """
+    config = app_config['performance']
+    report = dict(state['performance_report'], verdict='skipped')
+    state['performance_report'] = report
+
+    argument_sets = [
+        arguments for arguments in state['benchmark_arguments']
+        if not execute_function(
+            state['original_function'], arguments, state['kwargs'], profile=False, run_id=state['run_id']
+        )['error']
+    ]
+    original = (
+        benchmark_function(state['original_function'], argument_sets, config['repeats'], state['kwargs'], state['run_id'])
+        if argument_sets else None
+    )
+    if original is None or original.get('timed_out'):
+        logger.info("No benchmark inputs the original function handles in time. Skipping performance validation.")
+        _store_fix(state)
+        return state
+
+    logger.info(f"Benchmarking patch on {len(argument_sets)} inputs.")
+    patched = benchmark_function(state['function'], argument_sets, config['repeats'], state['kwargs'], state['run_id'])
+    if patched is None:
+        report.update(verdict='rejected', feedback='The previous fix raised an error on inputs the original function handles.')
+    elif patched.get('timed_out'):
+        report.update(
+            verdict='rejected',
+            feedback=(
+                f"The previous fix did not finish within {app_config['execution']['timeout_seconds']} seconds "
+                f"on inputs the original function handles."
+            ),
+        )
+    else:
+        slowdown = patched['seconds'] / max(original['seconds'], 1e-9)
+        memory_growth = patched['peak_memory_bytes'] / max(original['peak_memory_bytes'], 1)
+        report.update(
+            original_seconds=original['seconds'],
+            patched_seconds=patched['seconds'],
+            slowdown=slowdown,
+            original_peak_memory_bytes=original['peak_memory_bytes'],
+            patched_peak_memory_bytes=patched['peak_memory_bytes'],
+            memory_growth=memory_growth,
+            verdict='accepted',
+        )
+        if slowdown > config['max_slowdown'] or memory_growth > config['max_memory_growth']:
+            report.update(
+                verdict='rejected',
+                feedback=(
+                    f'The previous fix was {slowdown:.1f}x slower and used {memory_growth:.1f}x the memory '
+                    f'of the original function. Keep the original algorithm and only guard the error case.'
+                ),
+            )
+
+    rejections = report.get('rejections', 0)
+    if report['verdict'] == 'rejected' and (config['action'] == 'flag' or rejections >= config['max_rejections']):
+        report['verdict'] = 'flagged'
+
+    if report['verdict'] == 'rejected':
+        report['rejections'] = rejections + 1
+        logger.warning(f"Patch rejected by performance validation: {report['feedback']}")
+        state['function'] = state['original_function']
+    else:
+        logger.info(f"Performance validation verdict: {report['verdict']}")
+        _store_fix(state)
+    return state
+
 # --------------------
 # ROUTER FUNCTIONS
 # --------------------
 
+def _llm_entry(state: AgentState) -> str:
+    """Returns the first LLM node: the fast path on the first error, the full graph afterwards."""
+    return 'fast_path_node' if state['fast_path'] and not state['fast_path_attempted'] else 'bug_report_node'
+
 def error_router(state: AgentState) -> str:
     """Decides if the workflow should proceed to fix the error or end."""
-    return 'bug_report_node' if state['error'] else END
+    if not state['error']:
+        return END
+    return 'rule_fix_node' if app_config['rules']['enabled'] else 'bug_report_node'
+
+def fast_error_router(state: AgentState) -> str:
+    """Tries the rules, then the fast path on the first error and the full graph afterwards."""
+    if not state['error']:
+        return END
+    return 'rule_fix_node' if app_config['rules']['enabled'] else _llm_entry(state)
+
+def rule_fix_router(state: AgentState) -> str:
+    """Decides if a rule fixed the error or an LLM must be asked."""
+    return 'code_patching_node' if state['rule_fix'] else _llm_entry(state)
+
+def fast_path_router(state: AgentState) -> str:
+    """Decides if the fast path produced a patch or the full graph must be used."""
+    return 'code_patching_node' if state['new_function_string'] else 'bug_report_node'
+
+def patch_router(state: AgentState) -> str:
+    """Decides if a working patch must pass performance validation first."""
+    if not state['error'] and app_config['performance']['enabled']:
+        return 'performance_validation_node'
+    return 'code_execution_node'
+
+def performance_router(state: AgentState) -> str:
+    """Sends a rejected patch straight back to patch generation, which gets the performance feedback."""
+    if state['performance_report'].get('verdict') == 'rejected':
+        return 'code_update_node'
+    return 'code_execution_node'
 
 def memory_filter_router(state: AgentState) -> str:
     """Decides if similar memories were found."""
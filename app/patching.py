@@ -0,0 +1,91 @@
+import re
+import ast
+from typing import List, Tuple
+
+# --------------------
+# LINE-RANGE PATCHES
+# --------------------
+# For large functions the LLM returns only the lines to replace, e.g.
+#
+#   @@ 12-14
+#       if b == 0:
+#           return "Error: division by zero"
+#       return a / b
+#
+# which replaces lines 12 to 14 (1-based, inclusive) of the numbered source.
+
+_EDIT_HEADER = re.compile(r'^@@\s*(\d+)\s*-\s*(\d+)\s*@*\s*$')
+
+
+def number_lines(source: str) -> str:
+    """Prefixes each line of the source with its 1-based line number, for the prompt."""
+    return '\n'.join(f"{number:>4}| {line}" for number, line in enumerate(source.splitlines(), start=1))
+
+def parse_line_edits(edits_text: str) -> List[Tuple[int, int, List[str]]]:
+    """
+    Parses line-range edits from an LLM response.
+
+    Returns:
+        list: (start, end, replacement_lines) tuples in order of appearance.
+
+    Raises:
+        ValueError: If the response contains no edit.
+    """
+    edits = []
+    for line in edits_text.splitlines():
+        header = _EDIT_HEADER.match(line.strip())
+        if header:
+            edits.append((int(header.group(1)), int(header.group(2)), []))
+        elif edits and not line.strip().startswith('```'):
+            edits[-1][2].append(line)
+    if not edits:
+        raise ValueError("No line-range edit found in the response.")
+    return edits
+
+def apply_line_edits(source: str, edits_text: str) -> str:
+    """
+    Applies line-range edits to the source.
+
+    Raises:
+        ValueError: If an edit is out of range or edits overlap.
+    """
+    lines = source.splitlines()
+    edits = sorted(parse_line_edits(edits_text), key=lambda edit: edit[0])
+    previous_end = 0
+    for start, end, _ in edits:
+        if start < 1 or end < start - 1 or end > len(lines) or start <= previous_end:
+            raise ValueError(f"Invalid or overlapping edit range {start}-{end}.")
+        previous_end = end
+
+    # Applied bottom-up so earlier line numbers stay valid.
+    for start, end, replacement in reversed(edits):
+        lines[start - 1:end] = replacement
+    return '\n'.join(lines) + '\n'
+
+def _find_function(tree: ast.Module, name: str):
+    # The sources are single definitions: a method is found by its own name.
+    name = name.rpartition('.')[2]
+    return next(
+        (node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name),
+        None,
+    )
+
+def validate_patched_function(original: str, patched: str, function_name: str) -> None:
+    """
+    Checks that the patched source parses and keeps the function's name and signature.
+
+    Raises:
+        ValueError: If the patched source is not a valid replacement.
+    """
+    try:
+        patched_tree = ast.parse(patched)
+    except SyntaxError as e:
+        raise ValueError(f"Patched source does not parse: {e}") from e
+
+    patched_function = _find_function(patched_tree, function_name)
+    if patched_function is None:
+        raise ValueError(f"Patched source no longer defines '{function_name}'.")
+
+    original_function = _find_function(ast.parse(original), function_name)
+    if original_function and ast.dump(original_function.args) != ast.dump(patched_function.args):
+        raise ValueError(f"Patched source changes the signature of '{function_name}'.")
@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from typing import List, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from app.config_loader import load_config
+
+app_config = load_config()
+logger = logging.getLogger(__name__)
+
+# --------------------
+# RECORD / REPLAY
+# --------------------
+# Provider responses are stored in a local SQLite file, keyed by a hash of the
+# model (with its parameters) and the prompt. `replay.mode` selects how the
+# clients of ModelLoader use it:
+#
+#   record   every call reaches the provider and its response is stored
+#   replay   responses are only served from the store; a miss is an error
+#            (deterministic, offline tests and benchmarks)
+#   cache    read-through: stored responses are reused, misses are recorded
+#            (deduplicates identical prompts in production)
+#
+# The store is bounded to `replay.max_bytes`; least recently used responses are
+# evicted first.
+
+MODES = ('off', 'record', 'replay', 'cache')
+
+
+class ReplayMiss(Exception):
+    """Raised in replay mode for a call that was never recorded."""
+
+
+class ReplayStore:
+    """
+    A size-bounded store of provider responses with hit-rate statistics.
+
+    Each process opens its own SQLite connection lazily, so pre-forked workers do
+    not share the one of the master. Statistics are counted per process.
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection_pid = None
+        self._connection = None
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, kind TEXT, model TEXT, value BLOB, size INTEGER, "
+                "created REAL, last_used REAL, hits INTEGER DEFAULT 0)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._connection, self._connection_pid = connection, os.getpid()
+        return self._connection
+
+    def _count(self, kind: str, event: str) -> None:
+        stats = self._stats.setdefault(kind, {'hits': 0, 'misses': 0, 'records': 0})
+        stats[event] += 1
+
+    def get(self, key: str, kind: str) -> Optional[bytes]:
+        """Returns a stored response and marks it as used, or None."""
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(kind, 'misses')
+                return None
+            connection.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            connection.commit()
+            self._count(kind, 'hits')
+            return row[0]
+
+    def put(self, key: str, kind: str, model: str, value: bytes) -> None:
+        """Stores a response, evicting the least recently used ones beyond `max_bytes`."""
+        with self._lock:
+            connection = self._connect()
+            now = time.time()
+            previous = connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, model, value, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, model, value, len(value), now, now),
+            )
+            self._size += len(value) - (previous[0] if previous else 0)
+            if self.max_bytes and self._size > self.max_bytes:
+                self._evict(connection)
+            connection.commit()
+            self._count(kind, 'records')
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """Deletes least recently used responses until the store is 10% below its limit."""
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for key, size in connection.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if self._size <= target:
+                break
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._size -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} least recently used recorded responses.")
+
+    def stats(self) -> dict:
+        """Returns the store size and the hit rate of each kind of call in this process."""
+        with self._lock:
+            connection = self._connect()
+            entries = connection.execute("SELECT kind, COUNT(*) FROM responses GROUP BY kind").fetchall()
+            return {
+                'entries': dict(entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'calls': {
+                    kind: dict(stats, hit_rate=stats['hits'] / (stats['hits'] + stats['misses']) if stats['hits'] + stats['misses'] else None)
+                    for kind, stats in self._stats.items()
+                },
+            }
+
+    def clear(self) -> None:
+        """Deletes every stored response."""
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM responses")
+            connection.commit()
+            self._size = 0
+
+
+def _key(*parts: str) -> str:
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+
+class ReplayLLMCache(BaseCache):
+    """
+    LangChain cache that records and replays chat model responses.
+
+    LangChain passes the serialized prompt and a string of the model and its
+    parameters, so responses of different models or temperatures are kept apart.
+    Only the text of the responses is stored.
+    """
+    def __init__(self, store: ReplayStore, mode: str, model_id: str):
+        self.store = store
+        self.mode = mode
+        self.model_id = model_id
+
+    def lookup(self, prompt: str, llm_string: str):
+        if self.mode == 'record':
+            return None
+        value = self.store.get(_key('llm', llm_string, prompt), 'llm')
+        if value is None:
+            if self.mode == 'replay':
+                raise ReplayMiss(f"No recorded response for this prompt: {prompt[:200]}")
+            return None
+        return [ChatGeneration(message=AIMessage(content=text)) for text in json.loads(value)]
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        value = json.dumps([generation.text for generation in return_val]).encode('utf-8')
+        self.store.put(_key('llm', llm_string, prompt), 'llm', self.model_id, value)
+
+    def clear(self, **kwargs) -> None:
+        self.store.clear()
+
+
+class ReplayEmbeddings(Embeddings):
+    """Wraps an embedding model so that vectors are recorded and replayed per text."""
+    def __init__(self, embeddings: Embeddings, model_id: str, store: ReplayStore, mode: str):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.store = store
+        self.mode = mode
+        # Chroma identifies embedding functions by name.
+        self.name = getattr(embeddings, 'name', model_id)
+
+    def _lookup(self, text: str) -> Optional[List[float]]:
+        if self.mode == 'record':
+            return None
+        value = self.store.get(_key('embedding', self.model_id, text), 'embedding')
+        if value is None:
+            if self.mode == 'replay':
+                raise ReplayMiss(f"No recorded embedding for this text: {text[:200]}")
+            return None
+        vector = array('d')
+        vector.frombytes(value)
+        if sys.byteorder == 'big':
+            vector.byteswap()
+        return vector.tolist()
+
+    def _record(self, text: str, vector: List[float]) -> None:
+        packed = array('d', vector)
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        self.store.put(_key('embedding', self.model_id, text), 'embedding', self.model_id, packed.tobytes())
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds the texts, calling the provider once for all texts that are not stored."""
+        vectors = [self._lookup(text) for text in texts]
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[index] for index in missing])
+            for index, vector in zip(missing, computed):
+                vectors[index] = vector
+                self._record(texts[index], vector)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        # Some providers embed queries differently from documents, so they are stored apart.
+        vector = self._lookup('query:' + text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._record('query:' + text, vector)
+        return vector
+
+
+_store = None
+
+def get_store() -> Optional[ReplayStore]:
+    """Returns the response store, or None if `replay.mode` is off."""
+    global _store
+    config = app_config['replay']
+    if config['mode'] not in MODES:
+        raise ValueError(f"Unknown replay mode: {config['mode']}")
+    if config['mode'] == 'off':
+        return None
+    if _store is None:
+        _store = ReplayStore(config['path'], config['max_bytes'])
+        logger.info(f"Provider calls use the response store at {config['path']} in '{config['mode']}' mode.")
+    return _store
+
+def attach_llm(model, model_id: str):
+    """Makes a chat model record or replay its responses, according to `replay.mode`."""
+    store = get_store()
+    if model is not None and store:
+        model.cache = ReplayLLMCache(store, app_config['replay']['mode'], model_id)
+    return model
+
+def wrap_embeddings(embeddings: Embeddings, model_id: str) -> Embeddings:
+    """Makes an embedding model record or replay its vectors, according to `replay.mode`."""
+    store = get_store()
+    if embeddings is None or not store:
+        return embeddings
+    return ReplayEmbeddings(embeddings, model_id, store, app_config['replay']['mode'])
+
+
+if __name__ == '__main__':
+    # python -m app.replay stats|clear
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recorded provider responses.")
+    parser.add_argument('command', choices=['stats', 'clear'])
+    args = parser.parse_args()
+
+    store = ReplayStore(app_config['replay']['path'], app_config['replay']['max_bytes'])
+    if args.command == 'clear':
+        store.clear()
+        print("Cleared recorded responses.")
+    else:
+        print(json.dumps({key: value for key, value in store.stats().items() if key != 'calls'}, indent=2))
@@ -0,0 +1,57 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# --------------------
+# FRONTEND RESULT CACHE
+# --------------------
+# The Streamlit frontends keep the final states of previous runs, so re-running
+# an unchanged function reuses the result instead of healing it again. Each
+# browser session has its own cache (in `st.session_state`), so results are not
+# shown to other users. Only standard library imports, since the HTTP frontend
+# does not load the app.
+
+DEFAULT_SIZE = 64
+
+
+class ResultCache:
+    """The final states of a session's successful runs, keyed on code and arguments, least recently used first."""
+    def __init__(self, size: int = DEFAULT_SIZE):
+        self.size = size
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(function_string: str, arguments) -> str:
+        """Returns the cache key of a run."""
+        canonical = json.dumps([function_string, arguments], sort_keys=True)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, function_string: str, arguments) -> Optional[dict]:
+        """Returns the final state of an identical previous run, or None."""
+        key = self.key(function_string, arguments)
+        with self._lock:
+            final_state = self._results.get(key)
+            if final_state is not None:
+                self._results.move_to_end(key)
+            return final_state
+
+    def put(self, function_string: str, arguments, final_state: Optional[dict]) -> None:
+        """Caches the final state of a run. Failed or cancelled runs are not cached, so they can be retried."""
+        if not final_state or final_state.get('error') or final_state.get('cancelled'):
+            return
+        key = self.key(function_string, arguments)
+        with self._lock:
+            self._results[key] = final_state
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+
+def session_result_cache(session_state) -> ResultCache:
+    """Returns the result cache of a browser session, given its `st.session_state`."""
+    if 'result_cache' not in session_state:
+        session_state['result_cache'] = ResultCache()
+    return session_state['result_cache']
@@ -0,0 +1,351 @@
+import re
+import ast
+import logging
+import textwrap
+import threading
+from typing import List, Optional, Tuple, Union
+
+from app.slicing import find_function
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# RULE-BASED FIXES
+# --------------------
+# Common errors have a known, local fix that needs no LLM. Each rule matches the
+# error type and message of the failure and the AST of the failing line, and
+# returns either a guard, inserted before the failing statement:
+#
+#   def divide(a, b):                   def divide(a, b):
+#       return a / b          ->            if b == 0:
+#                                               return 'Error: division by zero'
+#                                           return a / b
+#
+# or a rewrite of the failing statement (e.g. "n: " + n -> "n: " + str(n)).
+# Like the fixes asked of the LLM, guards return an error message instead of
+# raising. A rule only applies to operands without side effects (names,
+# attributes, subscripts, literals and len()), since a guard evaluates them again.
+# The fix is validated by the caller; when no rule applies or the fix still
+# fails, the LLM path is taken.
+
+_COMPOUND = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith, ast.Try, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+_CONCATENATION = re.compile(r'can only concatenate str|unsupported operand type\(s\) for \+: .*\'str\'')
+_MISSING_ATTRIBUTE = re.compile(r"^'(?P<type>\w+)' object has no attribute '(?P<attr>\w+)'")
+
+
+def _is_simple(node: ast.AST) -> bool:
+    """Whether an expression can be evaluated again without side effects."""
+    if isinstance(node, (ast.Name, ast.Constant)):
+        return True
+    if isinstance(node, ast.Attribute):
+        return _is_simple(node.value)
+    if isinstance(node, ast.Subscript):
+        return _is_simple(node.value) and _is_simple(node.slice)
+    if isinstance(node, ast.UnaryOp):
+        return _is_simple(node.operand)
+    if isinstance(node, ast.Call):
+        return (
+            isinstance(node.func, ast.Name) and node.func.id == 'len'
+            and len(node.args) == 1 and not node.keywords and _is_simple(node.args[0])
+        )
+    return False
+
+def _on_line(statement: ast.stmt, lineno: int) -> List[ast.AST]:
+    """Returns the expressions of a statement that span the failing line, outermost first."""
+    return [
+        node for node in ast.walk(statement)
+        if isinstance(node, ast.expr) and node.lineno <= lineno <= node.end_lineno
+    ]
+
+def _failing_statement(function: ast.AST, lineno: int) -> Optional[ast.stmt]:
+    """Returns the innermost statement of the function that spans the failing line."""
+    found = None
+    for node in ast.walk(function):
+        if isinstance(node, ast.stmt) and node is not function and node.lineno <= lineno <= node.end_lineno:
+            if found is None or node.lineno >= found.lineno and node.end_lineno <= found.end_lineno:
+                found = node
+    # The header of a nested definition runs when the definition is executed.
+    if found is None or isinstance(found, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return None
+    return found
+
+def _unique(expressions: List[ast.AST]) -> List[ast.AST]:
+    seen, unique = set(), []
+    for expression in expressions:
+        key = ast.dump(expression)
+        if key not in seen:
+            seen.add(key)
+            unique.append(expression)
+    return unique
+
+def _guard(conditions: List[ast.AST], message: Union[str, ast.expr]) -> Optional[tuple]:
+    """Builds a guard returning the message: a fixed text, or an expression evaluated when it fails."""
+    conditions = _unique(conditions)
+    if not conditions:
+        return None
+    test = conditions[0] if len(conditions) == 1 else ast.BoolOp(op=ast.Or(), values=conditions)
+    return 'guard', ast.unparse(test), ast.unparse(message) if isinstance(message, ast.expr) else repr(f"Error: {message}")
+
+# --------------------
+# RULES
+# --------------------
+# Each rule takes the diagnostics and the expressions on the failing line, and
+# returns a ('guard', condition, message) or ('rewrite', transformer) tuple, or None.
+# The condition and message of a guard are Python source.
+
+def _division_by_zero(diagnostics: dict, expressions: list) -> Optional[tuple]:
+    if diagnostics['error_type'] != 'ZeroDivisionError':
+        return None
+    divisors = [
+        node.right for node in expressions
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod))
+    ]
+    # A literal zero divisor is a logic error the LLM has to fix.
+    if not divisors or not all(_is_simple(divisor) and not isinstance(divisor, ast.Constant) for divisor in divisors):
+        return None
+    return _guard(
+        [ast.Compare(left=divisor, ops=[ast.Eq()], comparators=[ast.Constant(0)]) for divisor in divisors],
+        diagnostics['message'],
+    )
+
+def _missing_key(diagnostics: dict, expressions: list) -> Optional[tuple]:
+    if diagnostics['error_type'] != 'KeyError':
+        return None
+    # The message is the repr of the key; the subscript using that key is guarded.
+    key_repr = diagnostics['message']
+    candidates = []
+    for node in expressions:
+        if not (isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load) and _is_simple(node)):
+            continue
+        key = node.slice
+        if isinstance(key, ast.Constant) and repr(key.value) == key_repr or \
+                isinstance(key, ast.Name) and diagnostics['locals'].get(key.id) == key_repr:
+            candidates.append(ast.Compare(left=key, ops=[ast.NotIn()], comparators=[node.value]))
+    keys = _unique([candidate.left for candidate in candidates])
+    if len(keys) == 1 and not isinstance(keys[0], ast.Constant):
+        # The key held by a variable differs between calls: it is formatted when the guard fails.
+        return _guard(candidates, ast.JoinedStr(values=[
+            ast.Constant("Error: key "),
+            ast.FormattedValue(value=keys[0], conversion=ord('r')),
+            ast.Constant(" not found"),
+        ]))
+    return _guard(candidates, f"key {key_repr} not found" if len(keys) == 1 else "key not found")
+
+def _index_out_of_range(diagnostics: dict, expressions: list) -> Optional[tuple]:
+    if diagnostics['error_type'] != 'IndexError':
+        return None
+    if diagnostics['message'].startswith('pop from empty'):
+        conditions = [
+            ast.UnaryOp(op=ast.Not(), operand=node.func.value) for node in expressions
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'pop'
+            and not node.args and _is_simple(node.func.value)
+        ]
+        return _guard(conditions, diagnostics['message'])
+    if 'index out of range' not in diagnostics['message']:
+        return None
+    conditions = []
+    for node in expressions:
+        if not (isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load)):
+            continue
+        if isinstance(node.slice, ast.Slice) or not _is_simple(node):
+            continue
+        length = ast.Call(func=ast.Name(id='len', ctx=ast.Load()), args=[node.value], keywords=[])
+        in_range = ast.Compare(
+            left=ast.UnaryOp(op=ast.USub(), operand=length), ops=[ast.LtE(), ast.Lt()], comparators=[node.slice, length],
+        )
+        conditions.append(ast.UnaryOp(op=ast.Not(), operand=in_range))
+    return _guard(conditions, diagnostics['message'])
+
+def _none_value(diagnostics: dict, expressions: list) -> Optional[tuple]:
+    message = diagnostics['message']
+    if diagnostics['error_type'] == 'AttributeError':
+        match = _MISSING_ATTRIBUTE.match(message)
+        if not match or match.group('type') != 'NoneType':
+            return None
+        values = [node.value for node in expressions if isinstance(node, ast.Attribute) and node.attr == match.group('attr')]
+    elif diagnostics['error_type'] == 'TypeError' and message.startswith("'NoneType' object is not subscriptable"):
+        values = [node.value for node in expressions if isinstance(node, ast.Subscript)]
+    else:
+        return None
+    values = [value for value in values if _is_simple(value) and not isinstance(value, ast.Constant)]
+    return _guard(
+        [ast.Compare(left=value, ops=[ast.Is()], comparators=[ast.Constant(None)]) for value in values],
+        f"{ast.unparse(values[0]) if values else 'value'} is None",
+    )
+
+def _is_str_literal(node: ast.AST) -> bool:
+    return isinstance(node, ast.JoinedStr) or isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+def _chain(node: ast.BinOp) -> List[ast.BinOp]:
+    """Returns the additions of a chain like `a + b + c`, outermost first."""
+    chain = [node]
+    while isinstance(chain[-1].left, ast.BinOp) and isinstance(chain[-1].left.op, ast.Add):
+        chain.append(chain[-1].left)
+    return chain
+
+class _StrOperands(ast.NodeTransformer):
+    """Converts the operands of the given addition chains to str."""
+    def __init__(self, chains: List[ast.BinOp]):
+        self.chains = {id(chain) for chain in chains}
+
+    def _str(self, operand: ast.AST) -> ast.AST:
+        if _is_str_literal(operand):
+            return operand
+        return ast.Call(func=ast.Name(id='str', ctx=ast.Load()), args=[operand], keywords=[])
+
+    def visit_BinOp(self, node):
+        if id(node) not in self.chains:
+            return self.generic_visit(node)
+        chain = _chain(node)
+        for addition in chain:
+            addition.right = self._str(addition.right)
+        chain[-1].left = self._str(chain[-1].left)
+        return node
+
+def _str_concatenation(diagnostics: dict, expressions: list) -> Optional[tuple]:
+    if diagnostics['error_type'] != 'TypeError' or not _CONCATENATION.search(diagnostics['message']):
+        return None
+    additions = [node for node in expressions if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add)]
+    inner = {id(link) for node in additions for link in _chain(node)[1:]}
+    chains = [node for node in additions if id(node) not in inner]
+    # Numeric additions on the same line are left alone when a chain has a string literal.
+    with_literals = [
+        chain for chain in chains
+        if any(_is_str_literal(link.right) for link in _chain(chain)) or _is_str_literal(_chain(chain)[-1].left)
+    ]
+    if not chains:
+        return None
+    return 'rewrite', _StrOperands(with_literals or chains)
+
+class _StrReceiver(ast.NodeTransformer):
+    """Converts the object of a str method call to str."""
+    def __init__(self, attr: str):
+        self.attr = attr
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        if node.attr == self.attr:
+            node.value = ast.Call(func=ast.Name(id='str', ctx=ast.Load()), args=[node.value], keywords=[])
+        return node
+
+def _str_method_on_number(diagnostics: dict, expressions: list) -> Optional[tuple]:
+    if diagnostics['error_type'] != 'AttributeError':
+        return None
+    match = _MISSING_ATTRIBUTE.match(diagnostics['message'])
+    if not match or match.group('type') not in ('int', 'float') or not hasattr(str, match.group('attr')):
+        return None
+    return 'rewrite', _StrReceiver(match.group('attr'))
+
+
+RULES = {
+    'division_by_zero': _division_by_zero,
+    'missing_key': _missing_key,
+    'index_out_of_range': _index_out_of_range,
+    'none_value': _none_value,
+    'str_concatenation': _str_concatenation,
+    'str_method_on_number': _str_method_on_number,
+}
+
+# --------------------
+# APPLYING RULES
+# --------------------
+
+def _apply(source: str, statement: ast.stmt, action: tuple) -> Optional[str]:
+    """Inserts a guard before the failing statement, or replaces the statement with its rewrite."""
+    lines = source.split('\n')
+    first_line = lines[statement.lineno - 1]
+    indent = first_line[:statement.col_offset]
+    if indent.strip() or first_line[statement.col_offset:].startswith('elif'):
+        # The statement shares its line with other code.
+        return None
+
+    if action[0] == 'guard':
+        _, condition, message = action
+        step = '\t' if '\t' in indent else '    '
+        replacement = [f"{indent}if {condition}:", f"{indent}{step}return {message}", first_line]
+        start, end = statement.lineno - 1, statement.lineno
+    else:
+        if isinstance(statement, _COMPOUND):
+            return None
+        rewritten = action[1].visit(statement)
+        replacement = [indent + line for line in ast.unparse(rewritten).split('\n')]
+        start, end = statement.lineno - 1, statement.end_lineno
+
+    patched = '\n'.join(lines[:start] + replacement + lines[end:])
+    try:
+        ast.parse(patched)
+    except SyntaxError:
+        return None
+    return None if patched == source else patched
+
+def find_rule_fix(source: str, function_name: str, diagnostics: dict, line_offset: int = 0) -> Optional[Tuple[str, str]]:
+    """
+    Fixes the failing line of a function with the first rule that matches the error.
+
+    Args:
+        source: The code the failing function was compiled from.
+        function_name: The function to fix.
+        diagnostics: The diagnostics of the failure (see `app.execution`).
+        line_offset: Subtracted from the failing line number to get its line in
+                     `source` (see `app.execution.source_line_offset`).
+
+    Returns:
+        tuple: The name of the rule and the patched source, or None if no rule applies.
+    """
+    lineno, line = diagnostics.get('failing_lineno'), diagnostics.get('failing_line')
+    if not lineno or diagnostics.get('failing_function') != function_name:
+        return None
+    lineno -= line_offset
+    # A nested function submitted with `inspect.getsource` is indented.
+    source = textwrap.dedent(source)
+    lines = source.split('\n')
+    # The diagnostics must describe this version of the code.
+    if not 0 < lineno <= len(lines) or lines[lineno - 1].strip() != (line or '').strip():
+        return None
+    try:
+        found = find_function(ast.parse(source), function_name)
+    except SyntaxError:
+        return None
+    statement = found and _failing_statement(found[0], lineno)
+    if statement is None:
+        return None
+
+    for name, rule in RULES.items():
+        action = rule(diagnostics, _on_line(statement, lineno))
+        if action is None:
+            continue
+        patched = _apply(source, statement, action)
+        if patched:
+            return name, patched
+    return None
+
+# --------------------
+# HIT RATE
+# --------------------
+
+_stats = {'errors': 0, 'applied': 0, 'validated': 0, 'rules': {}}
+_stats_lock = threading.Lock()
+
+def record_rule_fix(rule: Optional[str], validated: bool) -> None:
+    """Counts an error the rules were tried on, the rule that applied and whether its fix passed."""
+    with _stats_lock:
+        _stats['errors'] += 1
+        if rule is None:
+            return
+        _stats['applied'] += 1
+        _stats['validated'] += validated
+        counts = _stats['rules'].setdefault(rule, {'applied': 0, 'validated': 0})
+        counts['applied'] += 1
+        counts['validated'] += validated
+
+def rule_stats() -> dict:
+    """Returns how often the rules applied and fixed the error, in this process."""
+    with _stats_lock:
+        errors = _stats['errors']
+        return {
+            'errors': errors,
+            'applied': _stats['applied'],
+            'validated': _stats['validated'],
+            'hit_rate': _stats['validated'] / errors if errors else None,
+            'rules': {name: dict(counts) for name, counts in _stats['rules'].items()},
+        }
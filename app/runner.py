@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import logging
+import tempfile
+import threading
+import socketserver
+from typing import Iterator, Optional
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# WARM RUNNER DAEMON
+# --------------------
+# Starting the app imports every provider SDK, loads the models, connects to
+# the memory store and compiles the graphs, which takes seconds. The runner pays
+# that once and then serves healing runs over a Unix socket, so local and CI
+# invocations (`python -m app.heal`) only pay for the run itself:
+#
+#   python -m app.runner serve          (from the project root, like main.py)
+#   python -m app.heal calc.py::divide --args '[1, 0]'
+#   python -m app.runner status|stop
+#
+# A client sends one JSON line, a `CodePayload` or a {"command": ...}, and gets
+# the NDJSON lines of `/run_agent/stream` back. Closing the connection cancels
+# the run. The socket is only accessible to the user who started the runner.
+#
+# This module is imported by the client, so the app is only imported in `serve`.
+
+SOCKET_ENV = 'HEALING_RUNNER_SOCKET'
+
+
+def default_socket_path() -> str:
+    """Returns the socket path: $HEALING_RUNNER_SOCKET, or a per-user file in the temp directory."""
+    return os.environ.get(SOCKET_ENV) or os.path.join(tempfile.gettempdir(), f"healing-runner-{os.getuid()}.sock")
+
+
+def send(message: dict, path: Optional[str] = None, timeout: Optional[float] = None) -> Iterator[dict]:
+    """
+    Sends a request to the runner and yields the lines of its response.
+
+    Raises:
+        ConnectionError: If no runner is listening on the socket.
+    """
+    path = path or default_socket_path()
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        connection.close()
+        raise ConnectionError(f"No runner is listening on {path}. Start one with `python -m app.runner serve`.") from e
+    with connection, connection.makefile('rwb') as stream:
+        stream.write(json.dumps(message).encode('utf-8') + b'\n')
+        stream.flush()
+        for line in stream:
+            yield json.loads(line)
+
+
+class _RunHandler(socketserver.StreamRequestHandler):
+    """Serves one request: a healing run, or a runner command."""
+
+    def _write(self, message) -> None:
+        self.wfile.write((message if isinstance(message, str) else json.dumps(message) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            self._write({'error': "The request must be one JSON line."})
+            return
+        command = request.pop('command', 'run') if isinstance(request, dict) else None
+        if command == 'status':
+            self._write(self.server.status())
+        elif command == 'stop':
+            self._write({'stopping': True})
+            self.server.stop()
+        elif command == 'run':
+            self._run(request)
+        else:
+            self._write({'error': f"Unknown command: {command}"})
+
+    def _watch_disconnect(self, run_id: str, finished: threading.Event) -> None:
+        """Cancels the run if the client closes the connection before it finishes."""
+        from app.cancellation import cancel_run
+        try:
+            self.connection.recv(1)
+        except OSError:
+            pass
+        if not finished.is_set():
+            logger.info(f"Client disconnected from run {run_id}.")
+            cancel_run(run_id)
+
+    def _run(self, request: dict) -> None:
+        from fastapi import HTTPException
+        from pydantic import ValidationError
+        from app.api import _claim_run_id, _prepare_callable, _stream_agent_workflow
+        from app.cancellation import cancel_run, release_run
+        from app.execution import project_module
+        from app.model import CodePayload
+
+        # The path of the healed file, sent by `app.heal`; not part of the API's payload.
+        path = request.pop('path', None) if isinstance(request, dict) else None
+        try:
+            payload = CodePayload.model_validate(request)
+        except ValidationError as e:
+            self._write({'error': f"Invalid request: {e}"})
+            return
+        try:
+            run_id = _claim_run_id(payload)
+        except HTTPException as e:
+            self._write({'error': e.detail})
+            return
+        finished = threading.Event()
+        self.server.runs[run_id] = time.time()
+        try:
+            self._write({'run_id': run_id})
+            threading.Thread(target=self._watch_disconnect, args=(run_id, finished), daemon=True).start()
+            # Runs of project files take turns (see `project_module`) before taking a slot.
+            with project_module(path) if path else nullcontext(), self.server.run_slots:
+                try:
+                    function = _prepare_callable(payload)
+                except HTTPException as e:
+                    self._write({'error': e.detail})
+                    return
+                for line in _stream_agent_workflow(function, payload):
+                    self._write(line)
+            self.server.completed += 1
+        except (BrokenPipeError, ConnectionResetError):
+            cancel_run(run_id)
+        finally:
+            finished.set()
+            self.server.runs.pop(run_id, None)
+            release_run(run_id)
+
+
+class RunnerServer(socketserver.ThreadingUnixStreamServer):
+    """The runner's socket server. Runs are executed in one thread per connection."""
+    daemon_threads = True
+
+    def __init__(self, path: str, max_concurrent_runs: int):
+        # The socket is created accessible to its owner only: whoever can connect can run code.
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, _RunHandler)
+        finally:
+            os.umask(umask)
+        self.path = path
+        self.started = time.time()
+        self.run_slots = threading.BoundedSemaphore(max_concurrent_runs)
+        self.runs = {}
+        self.completed = 0
+
+    def status(self) -> dict:
+        return {
+            'pid': os.getpid(),
+            'uptime_seconds': time.time() - self.started,
+            'runs_in_progress': len(self.runs),
+            'runs_completed': self.completed,
+        }
+
+    def stop(self) -> None:
+        """Cancels the runs in progress and stops serving (from any thread)."""
+        from app.cancellation import cancel_run
+        for run_id in list(self.runs):
+            cancel_run(run_id)
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+
+def serve(path: Optional[str] = None) -> None:
+    """Warms up the app and serves healing runs on the Unix socket until stopped."""
+    path = path or default_socket_path()
+    if os.path.exists(path):
+        try:
+            next(send({'command': 'status'}, path, timeout=5))
+            raise SystemExit(f"A runner is already listening on {path}.")
+        except ConnectionError:
+            # Left behind by a runner that did not exit cleanly.
+            os.unlink(path)
+
+    start = time.perf_counter()
+    from app.config_loader import load_config
+    import app.api  # noqa: F401  Loads the models, the memory store and the compiled graphs.
+    from app.nodes import seed_memory_store
+    seed_memory_store()
+    logger.info(f"App loaded in {time.perf_counter() - start:.1f}s.")
+
+    server = RunnerServer(path, load_config()['server']['max_concurrent_runs'])
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: server.stop())
+    logger.info(f"Runner listening on {path} (pid {os.getpid()}).")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+        logger.info("Runner stopped.")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Warm runner daemon for `python -m app.heal`.")
+    parser.add_argument('command', choices=['serve', 'status', 'stop'])
+    parser.add_argument('--socket', help=f"Unix socket path (default: ${SOCKET_ENV} or a per-user temp file).")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        logging.basicConfig(level=logging.INFO)
+        serve(args.socket)
+        raise SystemExit(0)
+    try:
+        for response in send({'command': args.command}, args.socket, timeout=10):
+            print(json.dumps(response, indent=2))
+    except ConnectionError as e:
+        print(e, file=sys.stderr)
+        raise SystemExit(1)
@@ -0,0 +1,342 @@
+import os
+import re
+import ast
+import sys
+import json
+import difflib
+import logging
+import argparse
+import functools
+import multiprocessing
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, Optional
+
+from app.config_loader import load_config
+
+app_config = load_config()
+logger = logging.getLogger(__name__)
+
+# --------------------
+# REPOSITORY SCANNER
+# --------------------
+# Heals every function of a repository that raised an error in a pytest run:
+#
+#   pytest --junitxml=report.xml           (run from the repository root)
+#   python -m app.scanner REPO report.xml --output scan-results
+#
+# The report is read as a stream. The failing function and its arguments are
+# recovered from the long traceback of each failure: pytest prints the arguments
+# of the failing frame ("a = 1, b = 0") and its location ("src/calc.py:2:
+# ZeroDivisionError"). Failures with the same file, function and error type are
+# healed once. Healing runs in a process pool. Every worker draws its LLM calls
+# from one global budget. Patches and a summary report are written to the
+# output directory.
+
+_LOCATION = re.compile(r'^(?P<path>\S+\.py):(?P<line>\d+): (?P<error>[\w.]+)$')
+_SEPARATOR = re.compile(r'^_( _)+$')
+
+
+class BudgetExhausted(Exception):
+    """Raised when the global LLM call budget of a scan is used up."""
+
+
+def _budget_handler(counter, limit: int):
+    """Returns a LangChain callback that counts LLM calls against the shared budget."""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class LLMBudget(BaseCallbackHandler):
+        # Exceptions raised by the handler must stop the call instead of being logged.
+        raise_error = True
+
+        def _spend(self):
+            with counter.get_lock():
+                if counter.value >= limit:
+                    raise BudgetExhausted(f"The LLM budget of {limit} calls is used up.")
+                counter.value += 1
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            self._spend()
+
+        def on_llm_start(self, serialized, prompts, **kwargs):
+            self._spend()
+
+    return LLMBudget()
+
+
+# --------------------
+# DISCOVERY
+# --------------------
+
+@functools.lru_cache(maxsize=32)
+def _module_functions(path: str) -> tuple:
+    """Returns the top-level function definitions of a file (recent files are cached)."""
+    with open(path, encoding='utf-8') as file:
+        tree = ast.parse(file.read())
+    return tuple(node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)))
+
+def _enclosing_function(path: str, line: int) -> Optional[ast.AST]:
+    """Returns the top-level function containing a line, or None."""
+    for node in _module_functions(path):
+        if node.lineno <= line <= node.end_lineno:
+            return node
+    return None
+
+def _parse_call_arguments(text: str, function: ast.AST) -> Optional[tuple]:
+    """
+    Recovers the arguments of the failing call from pytest's argument line.
+
+    pytest prints "name = repr" pairs in the order of the code's variables:
+    positional parameters, keyword-only parameters, then *args and **kwargs.
+
+    Returns:
+        tuple: The positional and keyword arguments, or None if a value is missing,
+               truncated or not a literal.
+    """
+    args = function.args
+    positional = [arg.arg for arg in args.posonlyargs + args.args]
+    keyword = [arg.arg for arg in args.kwonlyargs]
+    names = positional + keyword + [arg.arg for arg in (args.vararg, args.kwarg) if arg]
+    if not names:
+        return [], {}
+
+    rest, values = text, {}
+    for index, name in enumerate(names):
+        if not rest.startswith(f"{name} = "):
+            return None
+        rest = rest[len(name) + 3:]
+        end = rest.find(f", {names[index + 1]} = ") if index + 1 < len(names) else len(rest)
+        if end == -1:
+            return None
+        try:
+            values[name] = ast.literal_eval(rest[:end])
+        except (ValueError, SyntaxError):
+            return None
+        rest = rest[end + 2:]
+
+    arguments = [values[name] for name in positional] + list(values.get(args.vararg.arg, ()) if args.vararg else ())
+    kwargs = {name: values[name] for name in keyword}
+    if args.kwarg:
+        kwargs.update(values[args.kwarg.arg])
+    return arguments, kwargs
+
+def _is_test_file(path: str) -> bool:
+    """Whether a failure location is in test code, which is not healed."""
+    name = os.path.basename(path)
+    return name.startswith('test_') or name.endswith('_test.py') or name == 'conftest.py'
+
+def _parse_failure(repo: str, text: str) -> Optional[dict]:
+    """
+    Locates the failing function of a pytest failure and the arguments it was called with.
+
+    Returns:
+        dict: The job for the failure, or None if it did not fail in repository code
+              or its arguments cannot be recovered.
+    """
+    lines = text.strip().splitlines()
+    location = _LOCATION.match(lines[-1]) if lines else None
+    if not location:
+        return None
+    path = os.path.normpath(location.group('path'))
+    full_path = os.path.join(repo, path)
+    if os.path.isabs(path) or path.startswith('..') or _is_test_file(path) or not os.path.isfile(full_path):
+        return None
+    try:
+        function = _enclosing_function(full_path, int(location.group('line')))
+    except (SyntaxError, UnicodeDecodeError):
+        return None
+    if function is None:
+        return None
+
+    # The last traceback entry starts after the last separator, with the argument line.
+    start = max((index for index, line in enumerate(lines) if _SEPARATOR.match(line.strip())), default=-1) + 1
+    argument_line = next((line for line in lines[start:] if line.strip()), '')
+    call = _parse_call_arguments(argument_line, function)
+    if call is None:
+        return None
+    return {
+        'path': path,
+        'function': function.name,
+        'error_type': location.group('error'),
+        'arguments': call[0],
+        'kwargs': call[1],
+    }
+
+def discover_failures(repo: str, junit_path: str, stats: dict) -> Iterator[dict]:
+    """
+    Streams the failing functions of a JUnit XML report, one job per error signature.
+
+    A signature is the file, function and error type. Tests that hit an already
+    seen signature are added to its job's `tests`. Counts of unusable failures
+    are kept in `stats`.
+    """
+    jobs = {}
+    for _, element in ElementTree.iterparse(junit_path):
+        if element.tag != 'testcase':
+            continue
+        failure = element.find('failure')
+        if failure is None:
+            failure = element.find('error')
+        test = f"{element.get('classname')}::{element.get('name')}"
+        element.clear()
+        if failure is None:
+            continue
+
+        stats['failures'] += 1
+        job = _parse_failure(repo, failure.text or '')
+        if job is None:
+            stats['unrecoverable'] += 1
+            logger.info(f"Skipping {test}: no repository function with literal arguments in its traceback.")
+            continue
+        signature = (job['path'], job['function'], job['error_type'])
+        if signature in jobs:
+            jobs[signature]['tests'].append(test)
+            continue
+        job['tests'] = [test]
+        job['message'] = failure.get('message', '')
+        jobs[signature] = job
+        yield job
+
+
+# --------------------
+# HEALING
+# --------------------
+
+_budget = None
+
+def _init_worker(repo: str, counter, limit: int) -> None:
+    """Prepares a pool process: the repository is importable and LLM calls are budgeted."""
+    global _budget
+    sys.path.insert(0, repo)
+    _budget = (counter, limit)
+    from app import nodes
+
+    if nodes.llm:
+        nodes.llm.callbacks = [_budget_handler(counter, limit)]
+
+def _heal(repo: str, job: dict) -> dict:
+    """Runs the healing workflow on one failing function. Executed in a pool process."""
+    counter, limit = _budget
+    result = {key: job[key] for key in ('path', 'function', 'error_type', 'message')}
+    if counter.value >= limit:
+        return dict(result, status='skipped', detail="LLM budget used up.")
+
+    from app.execution import project_module
+    path = os.path.join(repo, job['path'])
+    with open(path, encoding='utf-8') as file:
+        source = file.read()
+    # As the module it is in the repository, so its relative and sibling imports resolve.
+    with project_module(path):
+        return _heal_source(result, job, source)
+
+def _heal_source(result: dict, job: dict, source: str) -> dict:
+    """Loads the failing function from its file's source and heals it. Call within `project_module`."""
+    from app.graph import execute_self_healing_code_system
+    from app.execution import compile_source
+
+    try:
+        function = compile_source(source)[job['function']]
+    except Exception as e:
+        return dict(result, status='not_reproducible', detail=f"The module could not be loaded on its own: {e}")
+
+    try:
+        final_state = execute_self_healing_code_system(function, job['arguments'], source, kwargs=job['kwargs'])
+    except BudgetExhausted as e:
+        return dict(result, status='skipped', detail=str(e))
+    except Exception as e:
+        return dict(result, status='not_healed', detail=str(e))
+
+    if final_state['error']:
+        return dict(result, status='not_healed', detail=final_state['error_description'])
+    if not final_state['new_function_string']:
+        return dict(result, status='not_reproducible', detail="The function did not fail when called on its own.")
+    patch = ''.join(difflib.unified_diff(
+        source.splitlines(keepends=True),
+        final_state['new_function_string'].splitlines(keepends=True),
+        fromfile=f"a/{job['path']}",
+        tofile=f"b/{job['path']}",
+    ))
+    return dict(result, status='healed', repair_attempts=final_state['repair_attempts'], patch=patch)
+
+
+def scan(repo: str, junit_path: str, output_dir: str, workers: int, llm_budget: int) -> dict:
+    """
+    Heals the failing functions of a repository and writes patches and a report.
+
+    Results are appended to `results.jsonl` as they complete, patches are written
+    to `patches/`, and `summary.json` holds the counts and the tests behind each job.
+    At most twice as many jobs as workers are in flight, so the report is consumed
+    as the pool frees up.
+
+    Returns:
+        dict: The summary.
+    """
+    repo = os.path.abspath(repo)
+    os.makedirs(os.path.join(output_dir, 'patches'), exist_ok=True)
+    stats = {'failures': 0, 'unrecoverable': 0}
+    counts, jobs = {}, []
+    counter = multiprocessing.Value('i', 0)
+
+    def record(future, job, results_file):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {key: job[key] for key in ('path', 'function', 'error_type', 'message')}
+            result.update(status='not_healed', detail=f"Worker failed: {e}")
+        patch = result.pop('patch', None)
+        if patch:
+            name = f"{job['path'].replace(os.sep, '__')}__{job['function']}.patch"
+            with open(os.path.join(output_dir, 'patches', name), 'w', encoding='utf-8') as file:
+                file.write(patch)
+            result['patch_file'] = os.path.join('patches', name)
+        result['tests'] = job['tests']
+        results_file.write(json.dumps(result) + '\n')
+        results_file.flush()
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+        logger.info(f"{result['status']}: {job['path']}::{job['function']} ({job['error_type']})")
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(repo, counter, llm_budget)) as pool, \
+            open(os.path.join(output_dir, 'results.jsonl'), 'w', encoding='utf-8') as results_file:
+        pending = {}
+        for job in discover_failures(repo, junit_path, stats):
+            jobs.append(job)
+            pending[pool.submit(_heal, repo, job)] = job
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(future, pending.pop(future), results_file)
+        for future in list(pending):
+            record(future, pending.pop(future), results_file)
+
+    summary = dict(
+        stats,
+        signatures=len(jobs),
+        llm_calls=counter.value,
+        llm_budget=llm_budget,
+        **counts,
+        jobs=[{'path': job['path'], 'function': job['function'], 'error_type': job['error_type'], 'tests': job['tests']} for job in jobs],
+    )
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as file:
+        json.dump(summary, file, indent=2)
+    return summary
+
+
+if __name__ == '__main__':
+    config = app_config['scanner']
+    parser = argparse.ArgumentParser(description="Heal every function of a repository that failed in a pytest run.")
+    parser.add_argument('repo', help="Root of the repository, where pytest was run.")
+    parser.add_argument('junit', help="JUnit XML report of the run (pytest --junitxml).")
+    parser.add_argument('--output', default='scan-results', help="Directory for patches and the report.")
+    parser.add_argument('--workers', type=int, default=config['workers'])
+    parser.add_argument('--llm-budget', type=int, default=config['llm_budget'], help="Maximum LLM calls for the whole scan.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    summary = scan(args.repo, args.junit, args.output, args.workers, args.llm_budget)
+    print("-----------------------------------")
+    print(f"Failures in report:  {summary['failures']} ({summary['unrecoverable']} without a reproducible call)")
+    print(f"Error signatures:    {summary['signatures']}")
+    for status in ('healed', 'not_healed', 'not_reproducible', 'skipped'):
+        print(f"{status + ':':<21}{summary.get(status, 0)}")
+    print(f"LLM calls:           {summary['llm_calls']} / {summary['llm_budget']}")
+    print(f"Report written to {args.output}")
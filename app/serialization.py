@@ -0,0 +1,99 @@
+import base64
+import datetime
+import decimal
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --------------------
+# TYPED ARGUMENT ENCODING
+# --------------------
+# JSON has no datetimes, bytes, sets, tuples or decimals, so such values are sent
+# as tagged objects, e.g. {"__type__": "datetime", "value": "2024-01-01T00:00:00"}.
+# With a msgpack body, bytes are native and "ndarray" values carry their raw
+# buffer, which is decoded without copying.
+
+TYPE_KEY = "__type__"
+
+
+def _decode_bytes(value) -> bytes:
+    return value if isinstance(value, (bytes, bytearray, memoryview)) else base64.b64decode(value)
+
+def decode_value(value: Any) -> Any:
+    """
+    Recursively decodes tagged values into Python objects.
+
+    Raises:
+        ValueError: If a tagged value has an unknown type or an invalid value.
+    """
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if TYPE_KEY not in value:
+        return {key: decode_value(item) for key, item in value.items()}
+
+    kind = value[TYPE_KEY]
+    try:
+        if kind == 'datetime':
+            return datetime.datetime.fromisoformat(value['value'])
+        if kind == 'date':
+            return datetime.date.fromisoformat(value['value'])
+        if kind == 'time':
+            return datetime.time.fromisoformat(value['value'])
+        if kind == 'timedelta':
+            return datetime.timedelta(seconds=value['value'])
+        if kind == 'decimal':
+            return decimal.Decimal(value['value'])
+        if kind == 'bytes':
+            return _decode_bytes(value['value'])
+        if kind == 'tuple':
+            return tuple(decode_value(value['value']))
+        if kind == 'set':
+            return set(decode_value(value['value']))
+        if kind == 'frozenset':
+            return frozenset(decode_value(value['value']))
+        if kind == 'ndarray':
+            if np is None:
+                raise ValueError("numpy is not installed.")
+            # A bytearray makes the array writable (frombuffer over bytes is read-only)
+            # without a second copy, so functions can modify their arguments in place.
+            return np.frombuffer(bytearray(_decode_bytes(value['data'])), dtype=value['dtype']).reshape(value['shape'])
+    except (KeyError, TypeError, ValueError, decimal.InvalidOperation) as e:
+        raise ValueError(f"Invalid '{kind}' value: {e}") from e
+    raise ValueError(f"Unknown argument type: {kind}")
+
+def encode_value(value: Any) -> Any:
+    """Recursively encodes Python objects into JSON-compatible tagged values."""
+    if isinstance(value, datetime.datetime):
+        return {TYPE_KEY: 'datetime', 'value': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {TYPE_KEY: 'date', 'value': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {TYPE_KEY: 'time', 'value': value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {TYPE_KEY: 'timedelta', 'value': value.total_seconds()}
+    if isinstance(value, decimal.Decimal):
+        return {TYPE_KEY: 'decimal', 'value': str(value)}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {TYPE_KEY: 'bytes', 'value': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, tuple):
+        return {TYPE_KEY: 'tuple', 'value': [encode_value(item) for item in value]}
+    if isinstance(value, (set, frozenset)):
+        kind = 'frozenset' if isinstance(value, frozenset) else 'set'
+        return {TYPE_KEY: kind, 'value': [encode_value(item) for item in value]}
+    if np is not None and isinstance(value, np.ndarray):
+        return {
+            TYPE_KEY: 'ndarray',
+            'dtype': value.dtype.str,
+            'shape': list(value.shape),
+            'data': base64.b64encode(np.ascontiguousarray(value).tobytes()).decode('ascii'),
+        }
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    return value
@@ -22,6 +22,11 @@ class Settings(BaseSettings):
     
     PORT: int = 8080
 
+    # --- Shared Memory Store (Optional) ---
+    # Chroma server used by all API workers. In-process store if unset.
+    CHROMA_SERVER_HOST: Optional[str] = None
+    CHROMA_SERVER_PORT: int = 8000
+
     @model_validator(mode='after')
     def _check_langsmith_settings(self) -> 'Settings':
         """
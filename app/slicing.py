@@ -0,0 +1,204 @@
+import ast
+import textwrap
+from typing import Dict, List, Optional, Set, Tuple
+
+# --------------------
+# MODULE ANALYSIS
+# --------------------
+# Submitted code can be a whole module. Only the failing function and the code
+# it depends on (imports, module-level names, callees) are sent to the LLM, and
+# only the failing function is replaced.
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def top_level_functions(source: str) -> List[str]:
+    """Returns the names of the top-level functions defined in the source, in order."""
+    return [
+        node.name for node in ast.parse(source).body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    ]
+
+def _referenced_names(node: ast.AST) -> Set[str]:
+    """Returns the names loaded anywhere inside the node, including called names."""
+    return {child.id for child in ast.walk(node) if isinstance(child, ast.Name)}
+
+def _defined_names(node: ast.stmt) -> Set[str]:
+    """Returns the module-level names a statement defines."""
+    if isinstance(node, _DEFINITIONS):
+        return {node.name}
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return {(alias.asname or alias.name).split('.')[0] for alias in node.names}
+    if isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        return {child.id for target in targets for child in ast.walk(target) if isinstance(child, ast.Name)}
+    return set()
+
+def build_call_graph(source: str) -> Dict[str, Set[str]]:
+    """
+    Builds the dependency graph of the module's top-level statements.
+
+    Returns:
+        dict: For each module-level name, the module-level names its definition references.
+    """
+    tree = ast.parse(source)
+    defined = {name for node in tree.body for name in _defined_names(node)}
+    graph = {}
+    for node in tree.body:
+        for name in _defined_names(node):
+            graph.setdefault(name, set()).update(_referenced_names(node) & defined - {name})
+    return graph
+
+def find_function(tree: ast.Module, name: str) -> Optional[Tuple[ast.AST, Optional[ast.ClassDef]]]:
+    """
+    Finds a top-level function, or a method of a top-level class, by name.
+
+    A qualified `Class.method` name resolves to that class's method. If the module
+    has no such class (e.g. it holds the method alone), the method is looked up by
+    its own name, like an unqualified one: top-level functions first, then the
+    first class defining it.
+    """
+    class_name, _, name = name.rpartition('.')
+    if class_name:
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and node.name == class_name:
+                for child in node.body:
+                    if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and child.name == name:
+                        return child, node
+                return None
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == name:
+            return node, None
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and child.name == name:
+                    return child, node
+    return None
+
+def _line_range(node: ast.AST) -> Tuple[int, int]:
+    """Returns the 1-based, inclusive line range of a definition, including decorators."""
+    start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, 'decorator_list', [])])
+    return start, node.end_lineno
+
+def slice_for_function(source: str, name: str) -> Tuple[str, str]:
+    """
+    Splits the module into the function to fix and the context it depends on.
+
+    The context holds, in source order, the imports, module-level assignments and
+    definitions transitively referenced by the function (or by its class, for methods).
+
+    Returns:
+        tuple: (function_source, context_source). If the function cannot be found,
+               the whole source is returned with an empty context.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return source, ''
+    found = find_function(tree, name)
+    if found is None:
+        return source, ''
+    function, owner = found
+
+    lines = source.splitlines()
+    start, end = _line_range(function)
+    function_source = textwrap.dedent('\n'.join(lines[start - 1:end]))
+
+    graph = build_call_graph(source)
+    defined = set(graph)
+    pending = list(_referenced_names(owner or function) & defined)
+    needed = set()
+    while pending:
+        dependency = pending.pop()
+        if dependency not in needed:
+            needed.add(dependency)
+            pending.extend(graph.get(dependency, set()) - needed)
+    needed.discard(name)
+
+    context = []
+    for node in tree.body:
+        if node is owner:
+            # The class is needed for its other members, but the method itself is sent separately.
+            class_start, class_end = _line_range(node)
+            context.append('\n'.join(lines[class_start - 1:start - 1] + lines[end:class_end]))
+        elif _defined_names(node) & needed and node is not function:
+            node_start, node_end = _line_range(node)
+            context.append('\n'.join(lines[node_start - 1:node_end]))
+    return function_source, '\n\n'.join(context)
+
+def replace_function(source: str, name: str, new_function_source: str) -> str:
+    """
+    Replaces a function (or method) in the module with a new definition.
+
+    The new definition is re-indented to the original's indentation. If the
+    function cannot be found, the new definition is returned as is.
+
+    Top-level statements accompanying the new definition (helpers, constants,
+    imports) are spliced into the module: a definition of an existing name
+    replaces it, statements the module already has are skipped, new imports go
+    after the module's imports and the rest before the function (or its class).
+    """
+    try:
+        tree = ast.parse(source)
+        found = find_function(tree, name)
+    except SyntaxError:
+        found = None
+    if found is None:
+        return new_function_source
+
+    new_source = textwrap.dedent(new_function_source).strip('\n')
+    extras = []
+    try:
+        new_tree = ast.parse(new_source)
+        new_found = find_function(new_tree, name)
+    except SyntaxError:
+        new_found = None
+    if new_found is not None and new_found[1] is None and len(new_tree.body) > 1:
+        new_lines = new_source.splitlines()
+        new_start, new_end = _line_range(new_found[0])
+        extras = [
+            (node, '\n'.join(new_lines[_line_range(node)[0] - 1:node.end_lineno]))
+            for node in new_tree.body if node is not new_found[0]
+        ]
+        new_source = '\n'.join(new_lines[new_start - 1:new_end])
+
+    lines = source.splitlines()
+    function, owner = found
+    start, end = _line_range(function)
+    indent = lines[start - 1][:len(lines[start - 1]) - len(lines[start - 1].lstrip())]
+    # (start, end, replacement lines); at the same start, replacements go after insertions.
+    edits = [(start, end, textwrap.indent(new_source, indent).splitlines())]
+
+    anchor = owner or function
+    existing = {ast.dump(node) for node in tree.body}
+    inserted, imports = [], []
+    for node, text in extras:
+        if ast.dump(node) in existing:
+            continue
+        names = _defined_names(node)
+        replaced = next((
+            old for old in tree.body
+            if old is not anchor and type(old) is type(node) and names and _defined_names(old) == names
+        ), None)
+        if replaced is not None and not isinstance(node, (ast.Import, ast.ImportFrom)):
+            old_start, old_end = _line_range(replaced)
+            edits.append((old_start, old_end, text.splitlines()))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.extend(text.splitlines())
+        else:
+            inserted.extend(text.splitlines() + ['', ''])
+    if inserted:
+        edits.append((_line_range(anchor)[0], _line_range(anchor)[0] - 1, inserted))
+    if imports:
+        last_import = max(
+            (node.end_lineno for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))), default=0
+        )
+        if last_import:
+            edits.append((last_import + 1, last_import, imports))
+        else:
+            edits.append((_line_range(anchor)[0], _line_range(anchor)[0] - 1, imports + ['']))
+
+    for edit_start, edit_end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1]), reverse=True):
+        lines[edit_start - 1:edit_end] = replacement
+    return '\n'.join(lines) + '\n'
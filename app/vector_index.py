@@ -0,0 +1,498 @@
+import os
+import json
+import fcntl
+import atexit
+import pathlib
+import sqlite3
+import logging
+import threading
+import weakref
+from typing import List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# --------------------
+# IN-PROCESS VECTOR INDEX
+# --------------------
+# With `vector_db.backend: "local"`, memories are kept in this process instead of
+# in Chroma. A collection stores its documents and metadata in SQLite and its
+# vectors in a float32 matrix, memory-mapped from `vectors.f32` for persistent
+# stores:
+#
+#   {persist_directory}/{collection}/memories.sqlite
+#   {persist_directory}/{collection}/vectors.f32
+#   {persist_directory}/{collection}/hnsw.bin
+#   {persist_directory}/{collection}/lock
+#
+# Below `hnsw_threshold` memories, queries are exact: one matrix product against
+# all vectors. Above it, an HNSW graph (hnswlib, optional) answers them
+# approximately; `hnsw_ef_search` trades recall for speed. Distances follow
+# Chroma's conventions for the chosen space, so the thresholds in the config keep
+# their meaning: squared L2 for "l2", 1 - cosine similarity for "cosine", and
+# 1 - inner product for "ip".
+#
+# The collections implement the part of the chromadb Collection API used by
+# `VectorDB`. They are not shared between processes: rows are allocated in
+# memory, so a persistent collection is locked by the process that opens it and
+# a second process (e.g. another gunicorn worker) fails to open it.
+
+SPACES = ('l2', 'cosine', 'ip')
+_CHUNK_ROWS = 65536
+_SQL_BATCH = 500
+_MIN_CAPACITY = 1024
+
+
+class LocalCollection:
+    """
+    A collection of memories held in this process, searched exactly or with HNSW.
+
+    Vectors live in rows of a matrix; deleted rows are reused. Every write bumps a
+    generation number, so a saved HNSW graph that missed writes (e.g. after a
+    crash) is detected and rebuilt.
+    """
+    def __init__(
+        self,
+        name: str,
+        directory: Optional[str] = None,
+        space: str = 'l2',
+        hnsw_threshold: int = 20000,
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_search: int = 64,
+    ):
+        if np is None:
+            raise RuntimeError("numpy is needed for the local vector index.")
+        if space not in SPACES:
+            raise ValueError(f"Unknown vector space: {space}")
+        self.name = name
+        self.directory = directory
+        self.space = space
+        self.hnsw_threshold = hnsw_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self._lock = threading.RLock()
+        self._hnsw = None
+        self._hnsw_dirty = False
+        self._lock_file = None
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._lock_file = open(os.path.join(directory, 'lock'), 'w')
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lock_file.close()
+                raise RuntimeError(
+                    f"The local collection '{name}' is already open (in another process?); "
+                    f"the local backend serves a store from one process only."
+                )
+        self._connection = sqlite3.connect(
+            os.path.join(directory, 'memories.sqlite') if directory else ':memory:', check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS memories (id TEXT PRIMARY KEY, row INTEGER UNIQUE, document TEXT, metadata TEXT)"
+        )
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._connection.commit()
+        self._load()
+
+    # ----- storage -----
+
+    def _meta(self, key: str, default=None):
+        row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key: str, value) -> None:
+        self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _path(self, filename: str) -> Optional[str]:
+        return os.path.join(self.directory, filename) if self.directory else None
+
+    def _load(self) -> None:
+        """Reads the row of every memory and maps the vectors."""
+        self.dimensions = self._meta('dimensions')
+        self._generation = self._meta('generation', 0)
+        self._row_of = dict(self._connection.execute("SELECT id, row FROM memories"))
+        self._size = max(self._row_of.values(), default=-1) + 1
+        self._ids = [None] * self._size
+        for memory_id, row in self._row_of.items():
+            self._ids[row] = memory_id
+        self._free = [row for row in range(self._size) if self._ids[row] is None]
+        self._capacity = 0
+        self._vectors = None
+        if self.dimensions:
+            self._allocate(self._meta('capacity', self._size))
+            self._sq_norms[:self._size] = np.einsum('ij,ij->i', self._vectors[:self._size], self._vectors[:self._size])
+        self._load_hnsw()
+
+    def _allocate(self, capacity: int) -> None:
+        """Grows the vector matrix (and the file backing it) to hold `capacity` rows."""
+        capacity = max(capacity, _MIN_CAPACITY)
+        path = self._path('vectors.f32')
+        if path:
+            if self._vectors is not None:
+                self._vectors.flush()
+            with open(path, 'ab') as file:
+                file.truncate(max(os.path.getsize(path), capacity * self.dimensions * 4))
+            self._vectors = np.memmap(path, dtype=np.float32, mode='r+', shape=(capacity, self.dimensions))
+        else:
+            vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+            if self._vectors is not None:
+                vectors[:self._capacity] = self._vectors
+            self._vectors = vectors
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        if self._capacity:
+            sq_norms[:self._capacity] = self._sq_norms
+        self._sq_norms = sq_norms
+        self._alive = np.array([memory_id is not None for memory_id in self._ids] + [False] * (capacity - self._size))
+        self._capacity = capacity
+        if self._hnsw is not None:
+            self._hnsw.resize_index(capacity)
+
+    def _as_vectors(self, embeddings):
+        """Converts embeddings to a float32 matrix; the first ones fix the dimensions of the collection."""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            self._set_meta('dimensions', self.dimensions)
+            self._allocate(_MIN_CAPACITY)
+            self._set_meta('capacity', self._capacity)
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected vectors of {self.dimensions} dimensions, got {vectors.shape[1]}.")
+        return vectors
+
+    def _take_rows(self, count: int) -> List[int]:
+        """Returns free rows for new memories, growing the matrix if needed."""
+        rows = [self._free.pop() for _ in range(min(count, len(self._free)))]
+        rows += list(range(self._size, self._size + count - len(rows)))
+        if rows and rows[-1] >= self._size:
+            self._size = rows[-1] + 1
+            self._ids.extend([None] * (self._size - len(self._ids)))
+        if self._size > self._capacity:
+            self._allocate(max(self._size, 2 * self._capacity))
+            self._set_meta('capacity', self._capacity)
+        return rows
+
+    def _write_vectors(self, rows: List[int], vectors) -> None:
+        self._vectors[rows] = vectors
+        self._sq_norms[rows] = np.einsum('ij,ij->i', vectors, vectors)
+        if self._hnsw is not None:
+            self._hnsw.add_items(vectors, rows)
+            self._hnsw_dirty = True
+
+    def _commit(self) -> None:
+        self._generation += 1
+        self._set_meta('generation', self._generation)
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        self._connection.commit()
+        self._maybe_build_hnsw()
+
+    def _records(self, ids: Optional[List[str]] = None) -> List[tuple]:
+        """Returns (id, row, document, metadata) of the given memories, or of all of them by row."""
+        if ids is None:
+            return self._connection.execute("SELECT id, row, document, metadata FROM memories ORDER BY row").fetchall()
+        found = {}
+        for start in range(0, len(ids), _SQL_BATCH):
+            batch = ids[start:start + _SQL_BATCH]
+            query = f"SELECT id, row, document, metadata FROM memories WHERE id IN ({','.join('?' * len(batch))})"
+            found.update((record[0], record) for record in self._connection.execute(query, batch))
+        return [found[memory_id] for memory_id in dict.fromkeys(ids) if memory_id in found]
+
+    # ----- HNSW -----
+
+    def _load_hnsw(self) -> None:
+        path = self._path('hnsw.bin')
+        if hnswlib is None or not self.dimensions:
+            return
+        if path and os.path.exists(path) and self._meta('hnsw_generation') == self._generation:
+            self._hnsw = hnswlib.Index(space=self.space, dim=self.dimensions)
+            self._hnsw.load_index(path, max_elements=self._capacity)
+            self._hnsw.set_ef(self.hnsw_ef_search)
+            return
+        self._maybe_build_hnsw()
+
+    def _maybe_build_hnsw(self) -> None:
+        """Builds the HNSW graph once the collection reaches `hnsw_threshold` memories."""
+        if self._hnsw is not None or len(self._row_of) < self.hnsw_threshold:
+            return
+        if hnswlib is None:
+            logger.warning(f"hnswlib is not installed. '{self.name}' is searched by brute force.")
+            self.hnsw_threshold = float('inf')
+            return
+        logger.info(f"Building the HNSW index of '{self.name}' ({len(self._row_of)} memories).")
+        index = hnswlib.Index(space=self.space, dim=self.dimensions)
+        index.init_index(max_elements=self._capacity, ef_construction=self.hnsw_ef_construction, M=self.hnsw_m)
+        index.set_ef(self.hnsw_ef_search)
+        rows = np.flatnonzero(self._alive[:self._size])
+        for start in range(0, len(rows), _CHUNK_ROWS):
+            chunk = rows[start:start + _CHUNK_ROWS]
+            index.add_items(self._vectors[chunk], chunk)
+        self._hnsw = index
+        self._hnsw_dirty = True
+
+    def flush(self) -> None:
+        """Saves the HNSW graph of a persistent collection if it changed."""
+        with self._lock:
+            path = self._path('hnsw.bin')
+            if self._hnsw is None or not self._hnsw_dirty or not path:
+                return
+            self._hnsw.save_index(path)
+            self._set_meta('hnsw_generation', self._generation)
+            self._connection.commit()
+            self._hnsw_dirty = False
+
+    def close(self) -> None:
+        """Saves the collection and releases it for other processes. The handle is unusable afterwards."""
+        with self._lock:
+            self.flush()
+            self._connection.close()
+            if self._lock_file:
+                self._lock_file.close()
+                self._lock_file = None
+
+    # ----- search -----
+
+    def _distances(self, queries, start: int, end: int):
+        """Distances from each query to the rows start..end, in the collection's space."""
+        products = queries @ self._vectors[start:end].T
+        if self.space == 'l2':
+            distances = self._sq_norms[start:end] + np.einsum('ij,ij->i', queries, queries)[:, None] - 2 * products
+            np.maximum(distances, 0, out=distances)
+        elif self.space == 'cosine':
+            norms = np.sqrt(self._sq_norms[start:end]) * np.linalg.norm(queries, axis=1)[:, None]
+            distances = 1 - products / np.maximum(norms, 1e-12)
+        else:
+            distances = 1 - products
+        distances[:, ~self._alive[start:end]] = np.inf
+        return distances
+
+    def _brute_force(self, queries, k: int):
+        """Exact top-k rows of every query, scanning the matrix in chunks."""
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_distances = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self._size, _CHUNK_ROWS):
+            end = min(start + _CHUNK_ROWS, self._size)
+            distances = np.concatenate([best_distances, self._distances(queries, start, end)], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), (len(queries), end - start))], axis=1)
+            if distances.shape[1] > k:
+                top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                distances = np.take_along_axis(distances, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_rows, best_distances = rows, distances
+        order = np.argsort(best_distances, axis=1)
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_distances, order, axis=1)
+
+    def query(self, query_embeddings: list, n_results: int = 10, include: Optional[list] = None) -> dict:
+        """
+        Returns the nearest memories of each query, closest first.
+
+        Several queries are answered with one matrix product (or one HNSW batch).
+        """
+        include = include if include is not None else ['documents', 'metadatas', 'distances']
+        with self._lock:
+            k = min(n_results, len(self._row_of))
+            results = {'ids': [[] for _ in query_embeddings]}
+            for field in include:
+                results[field] = [[] for _ in query_embeddings]
+            if not k:
+                return results
+
+            queries = np.asarray(query_embeddings, dtype=np.float32)
+            rows = None
+            if self._hnsw is not None:
+                self._hnsw.set_ef(max(self.hnsw_ef_search, k))
+                try:
+                    rows, distances = self._hnsw.knn_query(queries, k=k)
+                except RuntimeError:
+                    # Fewer than k reachable elements, e.g. after many deletions.
+                    rows = None
+            if rows is None:
+                rows, distances = self._brute_force(queries, k)
+
+            needs_records = 'documents' in include or 'metadatas' in include
+            for index, (query_rows, query_distances) in enumerate(zip(rows, distances)):
+                ids = [self._ids[row] for row in query_rows]
+                results['ids'][index] = ids
+                if 'distances' in include:
+                    results['distances'][index] = [float(distance) for distance in query_distances]
+                if needs_records:
+                    records = {record[0]: record for record in self._records(ids)}
+                    if 'documents' in include:
+                        results['documents'][index] = [records[memory_id][2] for memory_id in ids]
+                    if 'metadatas' in include:
+                        results['metadatas'][index] = [json.loads(records[memory_id][3]) for memory_id in ids]
+            return results
+
+    # ----- chromadb Collection API -----
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[list] = None) -> dict:
+        """Returns the given memories, or all of them, with the included fields."""
+        include = include if include is not None else ['documents', 'metadatas']
+        with self._lock:
+            records = self._records(ids)
+            results = {'ids': [record[0] for record in records]}
+            if 'documents' in include:
+                results['documents'] = [record[2] for record in records]
+            if 'metadatas' in include:
+                results['metadatas'] = [json.loads(record[3]) for record in records]
+            if 'embeddings' in include:
+                results['embeddings'] = [self._vectors[record[1]].tolist() for record in records]
+            return results
+
+    def upsert(self, ids: List[str], embeddings: list, documents: List[str], metadatas: Optional[List[dict]] = None) -> None:
+        """Inserts new memories and replaces existing ones."""
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            vectors = self._as_vectors(embeddings)
+            existing = set(self._row_of)
+            new_ids = [memory_id for memory_id in dict.fromkeys(ids) if memory_id not in existing]
+            for memory_id, row in zip(new_ids, self._take_rows(len(new_ids))):
+                self._row_of[memory_id] = row
+                self._ids[row] = memory_id
+            rows = [self._row_of[memory_id] for memory_id in ids]
+            records = [(document, json.dumps(metadata or {}), memory_id, row)
+                       for memory_id, row, document, metadata in zip(ids, rows, documents, metadatas)]
+            # A plain INSERT: a row taken by a memory this handle does not know
+            # about fails the write instead of replacing that memory.
+            self._connection.executemany(
+                "INSERT INTO memories (document, metadata, id, row) VALUES (?, ?, ?, ?)",
+                [record for record in dict((record[2], record) for record in records).values() if record[2] not in existing],
+            )
+            self._connection.executemany(
+                "UPDATE memories SET document = ?, metadata = ? WHERE id = ? AND row = ?",
+                [record for record in records if record[2] in existing],
+            )
+            self._write_vectors(rows, vectors)
+            self._alive[rows] = True
+            self._commit()
+
+    def add(self, ids: List[str], embeddings: list, documents: List[str], metadatas: Optional[List[dict]] = None) -> None:
+        """Inserts new memories. Existing IDs are ignored, as in Chroma."""
+        with self._lock:
+            new = [index for index, memory_id in enumerate(ids) if memory_id not in self._row_of]
+            if len(new) < len(ids):
+                logger.warning(f"Ignoring {len(ids) - len(new)} memories with existing IDs.")
+            if new:
+                self.upsert(
+                    [ids[i] for i in new], [embeddings[i] for i in new], [documents[i] for i in new],
+                    [metadatas[i] for i in new] if metadatas else None,
+                )
+
+    def update(
+        self, ids: List[str], embeddings: Optional[list] = None, documents: Optional[List[str]] = None,
+        metadatas: Optional[List[dict]] = None,
+    ) -> None:
+        """Updates the given fields of existing memories. Unknown IDs are ignored."""
+        with self._lock:
+            records = {record[0]: record for record in self._records(ids)}
+            indexes = [index for index, memory_id in enumerate(ids) if memory_id in records]
+            if not indexes:
+                return
+            if embeddings is not None:
+                self._write_vectors([records[ids[i]][1] for i in indexes], self._as_vectors([embeddings[i] for i in indexes]))
+            self._connection.executemany(
+                "UPDATE memories SET document = ?, metadata = ? WHERE id = ?",
+                [(
+                    documents[i] if documents is not None else records[ids[i]][2],
+                    json.dumps(metadatas[i] or {}) if metadatas is not None else records[ids[i]][3],
+                    ids[i],
+                ) for i in indexes],
+            )
+            self._commit()
+
+    def delete(self, ids: List[str]) -> None:
+        """Deletes memories; their rows are reused by later inserts."""
+        with self._lock:
+            rows = [self._row_of.pop(memory_id) for memory_id in dict.fromkeys(ids) if memory_id in self._row_of]
+            for start in range(0, len(ids), _SQL_BATCH):
+                batch = ids[start:start + _SQL_BATCH]
+                self._connection.execute(f"DELETE FROM memories WHERE id IN ({','.join('?' * len(batch))})", batch)
+            for row in rows:
+                self._ids[row] = None
+                self._alive[row] = False
+                self._free.append(row)
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(row)
+                    self._hnsw_dirty = True
+            self._commit()
+
+    def delete_collection(self) -> None:
+        """Deletes every memory of the collection."""
+        self.delete(list(self._row_of))
+
+
+class LocalIndexClient:
+    """
+    Opens the local collections of a store, persistent when a directory is given.
+
+    A collection is opened once while it is in use, however many handles refer
+    to it. HNSW graphs are saved when their handle is closed and at exit.
+    In-memory collections (no directory) are only held here, so they are kept
+    for the lifetime of the client rather than while a handle refers to them.
+    """
+    def __init__(self, directory: Optional[str] = None, **options):
+        self.directory = directory
+        self.options = options
+        self._open = weakref.WeakValueDictionary()
+        self._in_memory = {}
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def get_or_create_collection(self, name: str) -> LocalCollection:
+        with self._lock:
+            collection = self._open.get(name)
+            if collection is None:
+                directory = os.path.join(self.directory, name) if self.directory else None
+                collection = LocalCollection(name, directory, **self.options)
+                self._open[name] = collection
+                if directory is None:
+                    self._in_memory[name] = collection
+            return collection
+
+    def count(self, name: str) -> int:
+        """
+        Returns the number of memories in a collection without opening it: a
+        closed persistent collection is counted from its database, read-only.
+        """
+        with self._lock:
+            collection = self._open.get(name)
+        if collection is not None:
+            return collection.count()
+        path = os.path.join(self.directory, name, 'memories.sqlite') if self.directory else None
+        if path is None or not os.path.exists(path):
+            return 0
+        connection = sqlite3.connect(f"{pathlib.Path(path).absolute().as_uri()}?mode=ro", uri=True)
+        try:
+            return connection.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+        finally:
+            connection.close()
+
+    def flush(self) -> None:
+        for collection in list(self._open.values()):
+            collection.flush()
+
+    def close(self) -> None:
+        """Closes every open collection, releasing them for other processes."""
+        with self._lock:
+            for collection in list(self._open.values()):
+                collection.close()
+            self._open.clear()
+            self._in_memory.clear()
+
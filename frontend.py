@@ -7,6 +7,8 @@ import subprocess
 import time
 import os
 
+from app.result_cache import session_result_cache
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -41,6 +43,42 @@ arguments_string = st.text_area(
 # On your local machine, it's also localhost
 BASE_URL = "http://localhost:8080"
 
+# --- POOLED HTTP SESSION ---
+# One session per Streamlit process keeps connections to the API alive instead
+# of reconnecting on every button press.
+@st.cache_resource
+def get_session() -> requests.Session:
+    """Creates and caches a pooled HTTP session."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def run_agent_streaming(payload: dict, progress) -> dict:
+    """
+    Calls the streaming endpoint and reports each completed node.
+
+    The response is closed when the script stops, e.g. because Streamlit reruns
+    it after the inputs changed, which cancels the run on the server.
+    """
+    with get_session().post(f"{BASE_URL}/run_agent/stream", json=payload, stream=True, timeout=(5, 600)) as response:
+        if response.status_code != 200:
+            st.error(f"API Error: {response.status_code}")
+            st.json(response.json())
+            st.stop()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            message = json.loads(line)
+            if 'node' in message:
+                progress.write(f"✔️ {message['node']} (repair attempts: {message['repair_attempts']})")
+            elif 'error' in message:
+                raise RuntimeError(message['error'])
+            elif 'final_state' in message:
+                return message['final_state']
+    raise RuntimeError("The agent run ended without a result.")
+
 # Button to trigger the agent
 if st.button("Run Agent", type="primary"):
     if not function_string or not arguments_string:
@@ -56,42 +94,41 @@ if st.button("Run Agent", type="primary"):
                 "arguments": arguments
             }
             
-            # Display a spinner while the agent is working
-            with st.spinner("Running agent workflow..."):
-                # Send the POST request to the FastAPI endpoint
-                response = requests.post(f"{BASE_URL}/run_agent", json=payload)
+            cache = session_result_cache(st.session_state)
+            final_state = cache.get(function_string, arguments)
+            if final_state is not None:
+                st.caption("Showing the cached result of an identical previous run.")
+            else:
+                # Show streamed progress while the agent is working
+                with st.status("Running agent workflow...", expanded=True) as progress:
+                    final_state = run_agent_streaming(payload, progress)
+                    progress.update(label="Agent workflow finished.", state="complete", expanded=False)
+                cache.put(function_string, arguments, final_state)
             
-            # Check for a successful response
-            if response.status_code == 200:
-                final_state = response.json()
-                st.success("✅ Agent workflow completed successfully!")
-                
-                # Display the results
-                st.subheader("Results")
-                
-                # Show the original function code
-                st.info("The agent started with this function:")
-                st.code(function_string, language='python')
-                
-                # Show the patched function if a fix was applied
-                patched_code = final_state.get('new_function_string')
-                if patched_code:
-                    st.success("The agent applied the following fix:")
-                    st.code(patched_code, language='python')
-                
-                # Display the final execution result
-                if not final_state['error']:
-                    st.success(f"Final Result: {final_state.get('function_string')}")
-                else:
-                    st.error(f"Final Error: {final_state.get('error_description')}")
-                    
-                # Display the full bug report
-                st.markdown("### 📝 Bug Report from the Agent")
-                st.markdown(f"```\n{final_state.get('bug_report')}\n```")
-                
+            st.success("✅ Agent workflow completed successfully!")
+            
+            # Display the results
+            st.subheader("Results")
+            
+            # Show the original function code
+            st.info("The agent started with this function:")
+            st.code(function_string, language='python')
+            
+            # Show the patched function if a fix was applied
+            patched_code = final_state.get('new_function_string')
+            if patched_code:
+                st.success("The agent applied the following fix:")
+                st.code(patched_code, language='python')
+            
+            # Display the final execution result
+            if not final_state['error']:
+                st.success(f"Final Result: {final_state.get('function_string')}")
             else:
-                st.error(f"API Error: {response.status_code}")
-                st.json(response.json())
+                st.error(f"Final Error: {final_state.get('error_description')}")
+                
+            # Display the full bug report
+            st.markdown("### 📝 Bug Report from the Agent")
+            st.markdown(f"```\n{final_state.get('bug_report')}\n```")
                 
         except json.JSONDecodeError:
             st.error("Invalid JSON format for arguments. Please enter a valid JSON array.")
@@ -0,0 +1,69 @@
+# File: gunicorn.conf.py
+# Production server: N pre-forked uvicorn workers sharing one Chroma server.
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# Each worker runs up to `server.max_concurrent_runs` (config.yml) healing runs
+# at once, so total capacity is WEB_CONCURRENCY * max_concurrent_runs.
+import os
+import logging
+import multiprocessing
+
+# Allows the gRPC channels of the Google clients, created before the fork, to be used in workers.
+os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "true")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Import the app (provider SDKs, models, compiled graph) once in the master;
+# workers inherit it through copy-on-write instead of importing it each.
+preload_app = True
+
+# A healing run makes several LLM calls, so requests can take a while.
+timeout = int(os.environ.get("WORKER_TIMEOUT", "300"))
+# On SIGTERM, workers stop accepting connections and get this long to drain in-flight runs.
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "120"))
+keepalive = 5
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def on_starting(server):
+    from app.config_loader import load_config
+
+    vector_db = load_config()['vector_db']
+    if workers > 1 and vector_db['backend'] == 'local' and vector_db['persist_directory']:
+        # Each collection of a persistent local store can only be open in one process.
+        raise SystemExit(
+            f"The local vector_db backend cannot be served by {workers} workers. "
+            "Set WEB_CONCURRENCY=1, or use the Chroma backend with CHROMA_SERVER_HOST."
+        )
+
+
+def when_ready(server):
+    import app.nodes
+    from app.nodes import db_client, seed_memory_store
+
+    # Seed a store that outlives the master once, here. Workers inherit
+    # `memory_seeded`, so they do not seed (ephemeral stores are not seeded).
+    if db_client and db_client.is_persistent:
+        seed_memory_store()
+    app.nodes.memory_seeded = True
+
+    if db_client and db_client.backend == 'local':
+        # The worker opens the store after the fork (post_fork); the master must release it.
+        db_client.close()
+    if workers > 1 and db_client and not db_client.is_shared:
+        logger.warning(
+            "Running %d workers without a shared memory store (CHROMA_SERVER_HOST): "
+            "each worker has its own, unsynchronized memories.", workers
+        )
+
+
+def post_fork(server, worker):
+    # Connections opened by the master must not be shared between processes.
+    from app.nodes import db_client
+
+    if db_client:
+        db_client.reconnect()
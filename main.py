@@ -2,9 +2,11 @@ import uvicorn
 import os
 import logging
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from app.settings_loader import settings
 from app.api import router
+from app.nodes import seed_memory_store
 
 # --- Environment Variable Setup ---
 # It's good practice to set these up early.
@@ -33,6 +35,12 @@ templates = Jinja2Templates(directory=templates_dir)
 # --- Router and Routes ---
 app.include_router(router)
 
+@app.on_event("startup")
+async def seed_memories():
+    # A fresh store starts with the seed pack of common Python errors. Under
+    # gunicorn, the master seeds the shared store once (see gunicorn.conf.py).
+    await run_in_threadpool(seed_memory_store)
+
 @app.get("/")
 def root(request: Request):
     """
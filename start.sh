@@ -1,4 +1,26 @@
-# # start.sh
-# uvicorn main:app --host 0.0.0.0 --port 8000 &
-# streamlit run frontend.py --server.port=8080  --server.address=0.0.0.0
+#!/bin/sh
+# start.sh
+# Production entrypoint: a Chroma server holding the shared memory store,
+# plus pre-forked API workers (see gunicorn.conf.py).
+set -e
 
+export CHROMA_SERVER_HOST="${CHROMA_SERVER_HOST:-127.0.0.1}"
+export CHROMA_SERVER_PORT="${CHROMA_SERVER_PORT:-8000}"
+
+chroma run --path "${CHROMA_PATH:-/app/chroma_data}" --host "$CHROMA_SERVER_HOST" --port "$CHROMA_SERVER_PORT" &
+
+# Wait for the memory store before the app is preloaded; without it, give up
+# instead of serving with no memories.
+python - <<'PY'
+import os, sys, time, chromadb
+for _ in range(60):
+    try:
+        chromadb.HttpClient(host=os.environ["CHROMA_SERVER_HOST"], port=int(os.environ["CHROMA_SERVER_PORT"])).heartbeat()
+        break
+    except Exception:
+        time.sleep(0.5)
+else:
+    sys.exit("The Chroma server did not come up within 30s.")
+PY
+
+exec gunicorn -c gunicorn.conf.py main:app
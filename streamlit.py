@@ -5,8 +5,11 @@ import logging
 import inspect
 
 # --- NEW IMPORTS (from your api.py and backend logic) ---
-from app.graph import execute_self_healing_code_system
+from app.graph import stream_self_healing_code_system
 from app.model_loader import ModelLoader
+from app.execution import compile_source
+from app.slicing import top_level_functions
+from app.result_cache import session_result_cache
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
 
@@ -83,36 +86,47 @@ if st.button("Run Agent", type="primary"):
         try:
             # 1. Parse arguments from the UI
             arguments = json.loads(arguments_string)
-            
-            with st.spinner("Running agent workflow..."):
-                # 2. Guardrail: Check for malicious code first
-                if is_malicious_code(function_string):
-                    st.error("The provided code was flagged as potentially malicious and cannot be executed.")
-                    st.stop() # Stop execution
-
-                # 3. Dynamically prepare the function from the string
-                namespace = {}
-                exec(function_string, namespace)
-                function_name = next(
-                    (name for name, obj in namespace.items() if inspect.isfunction(obj)), None
-                )
-                
-                if not function_name:
-                    st.error("No function definition found in the provided code.")
-                    st.stop()
+
+            cache = session_result_cache(st.session_state)
+            final_state = cache.get(function_string, arguments)
+            if final_state is not None:
+                st.caption("Showing the cached result of an identical previous run.")
+
+            # Show progress after every node. When the inputs change, Streamlit
+            # stops this script run, which also stops the workflow between nodes.
+            if final_state is None:
+                with st.status("Running agent workflow...", expanded=True) as progress:
+                    # 2. Guardrail: Check for malicious code first
+                    if is_malicious_code(function_string):
+                        st.error("The provided code was flagged as potentially malicious and cannot be executed.")
+                        st.stop() # Stop execution
+
+                    # 3. Dynamically prepare the function from the string
+                    namespace = compile_source(function_string)
+                    function_name = next(iter(top_level_functions(function_string)), None)
                     
-                callable_function = namespace[function_name]
-
-                # 4. Execute the main agent logic directly
-                final_state = execute_self_healing_code_system(
-                    callable_function, 
-                    arguments,
-                    function_string
-                )
+                    if not function_name:
+                        st.error("No function definition found in the provided code.")
+                        st.stop()
+                        
+                    callable_function = namespace[function_name]
+
+                    # 4. Execute the main agent logic directly, reporting each completed node
+                    for node_name, state in stream_self_healing_code_system(
+                        callable_function, 
+                        arguments,
+                        function_string
+                    ):
+                        progress.write(f"✔️ {node_name} (repair attempts: {state['repair_attempts']})")
+                        final_state = state
+                    progress.update(label="Agent workflow finished.", state="complete", expanded=False)
                 
                 # Clean up the state object for display
-                if final_state.get('function'):
-                    del final_state['function']
+                final_state = {
+                    name: value for name, value in final_state.items()
+                    if name not in ('function', 'original_function')
+                }
+                cache.put(function_string, arguments, final_state)
 
             # 5. Display the results (this part is the same as before)
             st.success("✅ Agent workflow completed successfully!")